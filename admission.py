@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Zugangskontrolle für eingehende Nachrichten (Token Buckets)
+Ein flutender Client soll die Event-Loop nicht für alle anderen belegen:
+Nachrichten werden vor dem Parsen, Loggen und Weiterleiten gegen Limits
+für Nachrichten/s und Bytes/s pro Verbindung und pro Raum geprüft.
+Zu große Frames werden schon beim Lesen des Frame-Headers abgewiesen.
+"""
+
+from typing import Optional
+
+from metrics import Counter
+
+THROTTLE_ACTIONS = ('reject', 'close')
+
+# Close-Codes (RFC 6455): Richtlinie verletzt bzw. Nachricht zu groß
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+
+class TokenBucket:
+    """Token Bucket mit ``rate`` Token/s und maximal ``burst`` Token"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def refill(self, now: float) -> float:
+        elapsed = now - self.stamp
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.stamp = now
+        return self.tokens
+
+
+class Limiter:
+    """Nachrichten- und Byte-Bucket einer Verbindung oder eines Raums
+
+    Ein Limit von 0 ist abgeschaltet; der Bucket fehlt dann ganz. Ein
+    voller Byte-Bucket lässt auch eine Nachricht über ``burst`` passieren
+    und geht dafür ins Minus - sonst würde etwa ein 6-KB-Offer bei
+    ``--byte-limit 4000`` für immer abgewiesen. Die Rate gilt trotzdem:
+    bis die Schuld abgetragen ist, kommt nichts weiter durch.
+    """
+
+    __slots__ = ('messages', 'bytes')
+
+    def __init__(self, msg_rate: float, msg_burst: float, byte_rate: float, byte_burst: float,
+                 now: float):
+        self.messages = TokenBucket(msg_rate, max(1.0, msg_burst or msg_rate), now) if msg_rate else None
+        self.bytes = TokenBucket(byte_rate, byte_burst or byte_rate, now) if byte_rate else None
+
+    def allows(self, size: int, now: float) -> bool:
+        if self.messages is not None and self.messages.refill(now) < 1:
+            return False
+        if self.bytes is not None:
+            tokens = self.bytes.refill(now)
+            if tokens < size and tokens < self.bytes.burst:
+                return False
+        return True
+
+    def consume(self, size: int):
+        if self.messages is not None:
+            self.messages.tokens -= 1
+        if self.bytes is not None:
+            self.bytes.tokens -= size
+
+
+class AdmissionPolicy:
+    """Limits und Aktion bei Überschreitung
+
+    ``action``: ``reject`` verwirft die Nachricht stillschweigend (keine
+    Antwort, damit eine Flut nicht verdoppelt wird), ``close`` trennt den
+    Client mit Close-Code 1008. ``max_frame_size`` gilt immer und trennt
+    mit 1009.
+    """
+
+    def __init__(self, msg_rate: float = 0.0, msg_burst: float = 0.0,
+                 byte_rate: float = 0.0, byte_burst: float = 0.0,
+                 room_msg_rate: float = 0.0, room_msg_burst: float = 0.0,
+                 room_byte_rate: float = 0.0, room_byte_burst: float = 0.0,
+                 max_frame_size: int = 1024 * 1024, action: str = 'reject'):
+        if action not in THROTTLE_ACTIONS:
+            raise ValueError(f"Unknown throttle action: {action}")
+        self.msg_rate = msg_rate
+        self.msg_burst = msg_burst
+        self.byte_rate = byte_rate
+        self.byte_burst = byte_burst
+        self.room_msg_rate = room_msg_rate
+        self.room_msg_burst = room_msg_burst
+        self.room_byte_rate = room_byte_rate
+        self.room_byte_burst = room_byte_burst
+        self.max_frame_size = max_frame_size
+        self.action = action
+
+
+class Admission:
+    """Prüft Nachrichten gegen die Buckets und zählt gedrosselten Verkehr"""
+
+    def __init__(self, policy: Optional[AdmissionPolicy] = None):
+        self.policy = policy if policy is not None else AdmissionPolicy()
+        self.throttled = Counter('signaling_throttled_messages_total',
+                                 'Messages rejected by admission control', 'scope')
+        self.throttled_bytes = Counter('signaling_throttled_bytes_total',
+                                       'Bytes rejected by admission control', 'scope')
+        self.closed = Counter('signaling_throttled_disconnects_total',
+                              'Connections closed by admission control', 'scope')
+
+    @property
+    def max_frame_size(self) -> int:
+        return self.policy.max_frame_size
+
+    def connection_limiter(self, now: float) -> Optional[Limiter]:
+        p = self.policy
+        if not (p.msg_rate or p.byte_rate):
+            return None
+        return Limiter(p.msg_rate, p.msg_burst, p.byte_rate, p.byte_burst, now)
+
+    def room_limiter(self, now: float) -> Optional[Limiter]:
+        p = self.policy
+        if not (p.room_msg_rate or p.room_byte_rate):
+            return None
+        return Limiter(p.room_msg_rate, p.room_msg_burst, p.room_byte_rate, p.room_byte_burst, now)
+
+    def admit(self, connection: Optional[Limiter], room: Optional[Limiter],
+              size: int, now: float) -> Optional[str]:
+        """``None`` wenn die Nachricht passieren darf, sonst der Bereich
+
+        Token werden nur abgezogen, wenn beide Buckets genug haben - eine
+        vom Raum-Limit abgewiesene Nachricht kostet die Verbindung nichts.
+        """
+        if connection is not None and not connection.allows(size, now):
+            scope = 'connection'
+        elif room is not None and not room.allows(size, now):
+            scope = 'room'
+        else:
+            if connection is not None:
+                connection.consume(size)
+            if room is not None:
+                room.consume(size)
+            return None
+        self.throttled.inc(scope)
+        self.throttled_bytes.inc(scope, size)
+        return scope
+
+    def oversized(self, size: int) -> bool:
+        """Frame-Länge aus dem Header prüfen, bevor die Nutzdaten gelesen werden"""
+        if self.policy.max_frame_size and size > self.policy.max_frame_size:
+            self.frame_rejected(size)
+            return True
+        return False
+
+    def frame_rejected(self, size: int = 0):
+        """Zu großen Frame zählen - auch wenn ihn die WebSocket-Bibliothek abgewiesen hat"""
+        self.throttled.inc('size')
+        self.closed.inc('size')
+        if size:
+            self.throttled_bytes.inc('size', size)
+
+    @property
+    def close_on_throttle(self) -> bool:
+        return self.policy.action == 'close'
+
+    def metrics(self) -> list:
+        """Prometheus-Metriken der Zugangskontrolle (für ``SignalingMetrics.add``)"""
+        return [self.throttled, self.throttled_bytes, self.closed]
+
+
+def add_admission_arguments(parser):
+    """CLI-Optionen für Rate Limits und maximale Frame-Größe"""
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='Messages/s per connection (0 = unlimited)')
+    parser.add_argument('--rate-burst', type=float, default=0.0,
+                        help='Burst size for --rate-limit (default: same as rate)')
+    parser.add_argument('--byte-limit', type=float, default=0.0,
+                        help='Bytes/s per connection (0 = unlimited)')
+    parser.add_argument('--byte-burst', type=float, default=0.0,
+                        help='Burst size for --byte-limit (default: same as rate; '
+                             'a larger message passes when the bucket is full)')
+    parser.add_argument('--room-rate-limit', type=float, default=0.0,
+                        help='Messages/s per room, all senders together (0 = unlimited)')
+    parser.add_argument('--room-rate-burst', type=float, default=0.0,
+                        help='Burst size for --room-rate-limit (default: same as rate)')
+    parser.add_argument('--room-byte-limit', type=float, default=0.0,
+                        help='Bytes/s per room (0 = unlimited)')
+    parser.add_argument('--room-byte-burst', type=float, default=0.0,
+                        help='Burst size for --room-byte-limit (default: same as rate)')
+    parser.add_argument('--max-frame-size', type=int, default=1024 * 1024,
+                        help='Close connections sending larger frames (default: 1 MiB, 0 = unlimited)')
+    parser.add_argument('--throttle-action', choices=THROTTLE_ACTIONS, default='reject',
+                        help='reject: drop throttled messages, close: disconnect the sender')
+
+
+def admission_from_args(args) -> Admission:
+    return Admission(AdmissionPolicy(
+        msg_rate=args.rate_limit, msg_burst=args.rate_burst,
+        byte_rate=args.byte_limit, byte_burst=args.byte_burst,
+        room_msg_rate=args.room_rate_limit, room_msg_burst=args.room_rate_burst,
+        room_byte_rate=args.room_byte_limit, room_byte_burst=args.room_byte_burst,
+        max_frame_size=args.max_frame_size, action=args.throttle_action))
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Sicherheitsanalyse der Signalisierung abseits des Weiterleitungspfads
+Nachrichten werden nur in eine begrenzte Queue gestellt; ein Worker-Thread
+parst SDP- und ICE-Kandidatenzeilen gebündelt und führt pro Raum eine
+Zusammenfassung der exponierten Adressen.
+"""
+
+import ipaddress
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from batch_queue import drain_batches
+from envelope import loads
+from metrics import CallbackMetric
+
+logger = logging.getLogger(__name__)
+
+FULL_QUEUE_POLICIES = ('drop-newest', 'drop-oldest', 'inline')
+CANDIDATE_TYPES = ('host', 'srflx', 'prflx', 'relay')
+
+
+class Candidate(NamedTuple):
+    """Eine ICE-Kandidatenzeile (RFC 8839)"""
+    foundation: str
+    component: int
+    transport: str
+    priority: int
+    address: str
+    port: int
+    type: str
+    related_address: Optional[str] = None
+    related_port: Optional[int] = None
+
+    @property
+    def is_mdns(self) -> bool:
+        return self.address.endswith('.local')
+
+
+class Fingerprint(NamedTuple):
+    algorithm: str
+    value: str
+
+
+class SdpInfo(NamedTuple):
+    fingerprints: List[Fingerprint]
+    candidates: List[Candidate]
+    ice_ufrags: List[str]
+
+
+def parse_candidate(line: str) -> Optional[Candidate]:
+    """Parse ``candidate:...`` bzw. ``a=candidate:...``; ``None`` bei ungültiger Zeile"""
+    line = line.strip()
+    if line.startswith('a='):
+        line = line[2:]
+    if not line.startswith('candidate:'):
+        return None
+    fields = line[len('candidate:'):].split()
+    if len(fields) < 8 or fields[6] != 'typ':
+        return None
+    try:
+        component = int(fields[1])
+        priority = int(fields[3])
+        port = int(fields[5])
+    except ValueError:
+        return None
+    related_address = None
+    related_port = None
+    # Erweiterungen kommen als Name/Wert-Paare
+    for i in range(8, len(fields) - 1, 2):
+        name, value = fields[i], fields[i + 1]
+        if name == 'raddr':
+            related_address = value
+        elif name == 'rport':
+            try:
+                related_port = int(value)
+            except ValueError:
+                pass
+    return Candidate(fields[0], component, fields[2].lower(), priority, fields[4], port,
+                     fields[7], related_address, related_port)
+
+
+def parse_sdp(sdp: str) -> SdpInfo:
+    """Extrahiere sicherheitsrelevante Attribute aus einer SDP"""
+    fingerprints = []
+    candidates = []
+    ufrags = []
+    for line in sdp.splitlines():
+        if not line.startswith('a='):
+            continue
+        name, _, value = line[2:].partition(':')
+        if name == 'fingerprint':
+            algorithm, _, digest = value.partition(' ')
+            fingerprints.append(Fingerprint(algorithm.lower(), digest.strip()))
+        elif name == 'candidate':
+            candidate = parse_candidate(line)
+            if candidate:
+                candidates.append(candidate)
+        elif name == 'ice-ufrag':
+            ufrags.append(value.strip())
+    return SdpInfo(fingerprints, candidates, ufrags)
+
+
+def is_private(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return ip.is_private or ip.is_link_local or ip.is_loopback
+
+
+class RoomExposure:
+    """Was in einem Raum über die Signalisierung sichtbar wurde"""
+
+    def __init__(self, room: str, max_addresses: int = 256):
+        self.room = room
+        self.max_addresses = max_addresses
+        self.candidates = dict.fromkeys(CANDIDATE_TYPES, 0)
+        self.mdns_candidates = 0
+        self.addresses: Dict[str, str] = {}
+        self.fingerprints = set()
+        self.offers = 0
+        self.answers = 0
+        self.last_seen = 0.0
+
+    def add_candidate(self, candidate: Candidate) -> bool:
+        """Zähle Kandidaten; ``True``, wenn die Adresse neu ist"""
+        self.candidates[candidate.type] = self.candidates.get(candidate.type, 0) + 1
+        if candidate.is_mdns:
+            self.mdns_candidates += 1
+            return False
+        if candidate.address in self.addresses or len(self.addresses) >= self.max_addresses:
+            return False
+        self.addresses[candidate.address] = candidate.type
+        return True
+
+    def as_dict(self) -> dict:
+        return {
+            'room': self.room,
+            'candidates': dict(self.candidates),
+            'mdns_candidates': self.mdns_candidates,
+            'distinct_ips': len(self.addresses),
+            'ips': dict(self.addresses),
+            'fingerprints': len(self.fingerprints),
+            'offers': self.offers,
+            'answers': self.answers,
+            'last_seen': self.last_seen,
+        }
+
+
+class ExposureAnalyzer:
+    """Analysiert Signalisierungsnachrichten in einem Hintergrund-Thread
+
+    ``submit`` blockiert nie. Ist die Queue voll, entscheidet ``policy``:
+    ``drop-newest`` verwirft die neue Nachricht, ``drop-oldest`` die älteste
+    wartende, ``inline`` analysiert sofort im aufrufenden Thread.
+    Sicherheitswarnungen werden pro Raum und Adresse nur einmal geloggt.
+    """
+
+    def __init__(self, queue_size: int = 10000, policy: str = 'drop-newest',
+                 batch_size: int = 128, max_rooms: int = 10000):
+        if policy not in FULL_QUEUE_POLICIES:
+            raise ValueError(f"Unknown analysis queue policy: {policy}")
+        self.policy = policy
+        self.batch_size = batch_size
+        self.max_rooms = max_rooms
+        self.analyzed = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._rooms: 'OrderedDict[str, RoomExposure]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='exposure-analyzer', daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, msg_type: Optional[str], room: str, raw: str):
+        """Stelle eine Nachricht zur Analyse ein"""
+        if msg_type not in ('offer', 'answer', 'ice-candidate', 'ice-candidates'):
+            return
+        item = (msg_type, room, raw, time.time())
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        if self.policy == 'inline':
+            self._analyze_batch([item])
+        elif self.policy == 'drop-oldest':
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self.dropped += 1
+                self._queue.put_nowait(item)
+            except (queue.Empty, queue.Full):
+                self.dropped += 1
+        else:
+            self.dropped += 1
+
+    def _run(self):
+        drain_batches(self._queue, self.batch_size, self._analyze_safely)
+
+    def _analyze_safely(self, batch):
+        try:
+            self._analyze_batch(batch)
+        except Exception:
+            logger.exception("Exposure analysis failed")
+
+    def _room(self, room: str) -> RoomExposure:
+        exposure = self._rooms.get(room)
+        if exposure is None:
+            exposure = self._rooms[room] = RoomExposure(room)
+            if len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room)
+        return exposure
+
+    def _analyze_batch(self, batch):
+        warnings = []
+        with self._lock:
+            for msg_type, room, raw, timestamp in batch:
+                try:
+                    data = loads(raw)
+                except ValueError:
+                    continue
+                if not isinstance(data, dict):
+                    continue
+                exposure = self._room(room)
+                exposure.last_seen = timestamp
+                candidates = []
+                if msg_type in ('offer', 'answer'):
+                    if msg_type == 'offer':
+                        exposure.offers += 1
+                    else:
+                        exposure.answers += 1
+                    sdp = data.get('sdp')
+                    if isinstance(sdp, str):
+                        info = parse_sdp(sdp)
+                        for fingerprint in info.fingerprints:
+                            if fingerprint not in exposure.fingerprints:
+                                exposure.fingerprints.add(fingerprint)
+                                warnings.append(f"🔓 DTLS fingerprint ({fingerprint.algorithm}) "
+                                                f"exposed in room {room}")
+                        candidates = info.candidates
+                elif msg_type == 'ice-candidate':
+                    candidates = [data.get('candidate')]
+                else:
+                    candidates = data.get('candidates') or []
+                for line in candidates:
+                    if isinstance(line, dict):
+                        # Gebündelte ice-candidate-Nachrichten bzw. RTCIceCandidateInit
+                        line = line.get('candidate')
+                        if isinstance(line, dict):
+                            line = line.get('candidate')
+                    candidate = line if isinstance(line, Candidate) else \
+                        parse_candidate(line) if isinstance(line, str) else None
+                    if candidate and exposure.add_candidate(candidate):
+                        warnings.append(self._exposure_warning(room, candidate))
+                self.analyzed += 1
+        for warning in warnings:
+            logger.warning(warning)
+
+    @staticmethod
+    def _exposure_warning(room: str, candidate: Candidate) -> str:
+        if candidate.type == 'host':
+            scope = 'LOCAL' if is_private(candidate.address) else 'HOST'
+        elif candidate.type in ('srflx', 'prflx'):
+            scope = 'PUBLIC'
+        else:
+            scope = 'RELAY'
+        return f"⚠️  {scope} IP exposed in room {room}: {candidate.address} ({candidate.type})"
+
+    def summary(self, room: str) -> Optional[dict]:
+        with self._lock:
+            exposure = self._rooms.get(room)
+            return exposure.as_dict() if exposure else None
+
+    def summaries(self) -> List[dict]:
+        with self._lock:
+            return [exposure.as_dict() for exposure in self._rooms.values()]
+
+    def metrics(self) -> list:
+        """Prometheus-Metriken der Analyse-Queue (für ``SignalingMetrics.add``)"""
+        return [
+            CallbackMetric('signaling_analysis_queue_depth', 'Messages waiting for security analysis',
+                           'gauge', lambda: self.queue_depth),
+            CallbackMetric('signaling_analysis_dropped_total',
+                           'Messages skipped because the analysis queue was full',
+                           'counter', lambda: self.dropped),
+            CallbackMetric('signaling_analysis_messages_total', 'Messages analyzed',
+                           'counter', lambda: self.analyzed),
+        ]
+
+    def flush(self, timeout: float = 5.0):
+        """Warte, bis alle eingestellten Nachrichten analysiert sind (Tests/Shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def add_analysis_arguments(parser):
+    """Gemeinsame CLI-Optionen für die Sicherheitsanalyse"""
+    parser.add_argument('--analysis-queue', type=int, default=10000,
+                        help='Max messages waiting for security analysis (default: 10000)')
+    parser.add_argument('--analysis-policy', choices=FULL_QUEUE_POLICIES, default='drop-newest',
+                        help='What to do when the analysis queue is full (default: drop-newest)')
+
+
+def analyzer_from_args(args) -> ExposureAnalyzer:
+    return ExposureAnalyzer(queue_size=args.analysis_queue, policy=args.analysis_policy)
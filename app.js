@@ -8,6 +8,9 @@ class WebRTCSecurityLab {
         // WebSocket-Verbindung
         this.ws = null;
         this.wsUrl = 'ws://localhost:8080/ws';
+        // Peer-IDs vom Server: eigene aus ``welcome``, Gegenstelle aus ``from``
+        this.peerId = null;
+        this.remotePeerId = null;
 
         // WebRTC
         this.peerConnection = null;
@@ -124,7 +127,8 @@ class WebRTCSecurityLab {
         this.log('signaling', `Verbinde zu ${this.wsUrl}...`);
 
         try {
-            this.ws = new WebSocket(this.wsUrl);
+            // ice_batch: Server darf ICE-Kandidaten als ein 'ice-candidates'-Frame bündeln
+            this.ws = new WebSocket(`${this.wsUrl}?ice_batch=1`);
 
             this.ws.onopen = () => {
                 this.updateStatus('connected');
@@ -327,11 +331,24 @@ class WebRTCSecurityLab {
 
         this.log('signaling', `📥 Empfangen: ${type}`);
 
+        // Antworten gehen gezielt an den Absender statt an den ganzen Raum
+        if (message.from && type !== 'peer-unavailable') {
+            this.remotePeerId = message.from;
+        }
+
         switch (type) {
             case 'welcome':
+                this.peerId = message.peer_id || null;
                 this.log('signaling', `Server-Modus: ${message.encrypted ? 'Verschlüsselt' : 'Unverschlüsselt'}`);
                 break;
 
+            case 'peer-unavailable':
+                this.log('signaling', `Peer ${message.peer_id} nicht erreichbar - zurück zu Broadcast`);
+                if (this.remotePeerId === message.peer_id) {
+                    this.remotePeerId = null;
+                }
+                break;
+
             case 'offer':
                 this.logSdpSecurity(sdp);
                 await this.handleOffer(sdp);
@@ -345,6 +362,12 @@ class WebRTCSecurityLab {
             case 'ice-candidate':
                 await this.handleRemoteIceCandidate(candidate, sdpMid, sdpMLineIndex);
                 break;
+
+            case 'ice-candidates':
+                for (const c of message.candidates) {
+                    await this.handleRemoteIceCandidate(c.candidate, c.sdpMid, c.sdpMLineIndex);
+                }
+                break;
         }
     }
 
@@ -432,6 +455,9 @@ class WebRTCSecurityLab {
 
     sendSignaling(message) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+            if (this.remotePeerId && !message.to) {
+                message.to = this.remotePeerId;
+            }
             this.ws.send(JSON.stringify(message));
         }
     }
@@ -443,6 +469,7 @@ class WebRTCSecurityLab {
             this.peerConnection.close();
             this.peerConnection = null;
         }
+        this.remotePeerId = null;
 
         if (this.localStream) {
             this.localStream.getTracks().forEach(track => track.stop());
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Gebündeltes Abarbeiten einer Queue in einem Hintergrund-Thread
+Gemeinsame Schleife von Trace-Writer, Nachrichten-Log und Sicherheitsanalyse:
+Der Hot Path legt nur Einträge in eine begrenzte Queue, der Thread holt sie
+in Batches ab. ``None`` ist das Stop-Signal von ``close``.
+"""
+
+import queue
+from typing import Callable, List, Optional
+
+
+def drain_batches(items: queue.Queue, batch_size: int, handle: Callable[[List], None],
+                  timeout: Optional[float] = None):
+    """Übergib ``handle`` Batches von bis zu ``batch_size`` Einträgen bis zum Stop-Signal
+
+    Einträge, die nach dem Stop-Signal im selben Batch liegen, werden noch
+    übergeben. ``handle`` fängt seine Fehler selbst ab; ``task_done`` folgt
+    erst nach ``handle``, damit ``join`` auf die Queue wartet.
+    """
+    while True:
+        try:
+            item = items.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        batch = [item]
+        while len(batch) < batch_size:
+            try:
+                batch.append(items.get_nowait())
+            except queue.Empty:
+                break
+        size = len(batch)
+        # Ein Eintrag kann nach dem Stop-Signal eingereiht worden sein
+        stop = None in batch
+        if stop:
+            batch = [item for item in batch if item is not None]
+        if batch:
+            handle(batch)
+        for _ in range(size):
+            items.task_done()
+        if stop:
+            return
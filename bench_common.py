@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Gemeinsame Hilfsfunktionen für die Benchmarks
+Erzeugt realistische Signalisierungsnachrichten, Client-Frames und
+stellt einen minimalen WebSocket-Client bereit
+"""
+
+import asyncio
+import base64
+import os
+import random
+import struct
+from typing import Optional
+
+SDP_HEADER = (
+    "v=0\r\n"
+    "o=- 4611731400430051336 2 IN IP4 127.0.0.1\r\n"
+    "s=-\r\n"
+    "t=0 0\r\n"
+    "a=group:BUNDLE 0 1\r\n"
+    "a=extmap-allow-mixed\r\n"
+    "a=msid-semantic: WMS stream\r\n"
+)
+
+SDP_MEDIA = (
+    "m={kind} 9 UDP/TLS/RTP/SAVPF {payloads}\r\n"
+    "c=IN IP4 0.0.0.0\r\n"
+    "a=rtcp:9 IN IP4 0.0.0.0\r\n"
+    "a=ice-ufrag:{ufrag}\r\n"
+    "a=ice-pwd:{pwd}\r\n"
+    "a=ice-options:trickle\r\n"
+    "a=fingerprint:sha-256 {fingerprint}\r\n"
+    "a=setup:actpass\r\n"
+    "a=mid:{mid}\r\n"
+    "a=sendrecv\r\n"
+    "a=rtcp-mux\r\n"
+)
+
+SDP_CODEC = (
+    "a=rtpmap:{pt} {codec}/90000\r\n"
+    "a=rtcp-fb:{pt} goog-remb\r\n"
+    "a=rtcp-fb:{pt} transport-cc\r\n"
+    "a=rtcp-fb:{pt} ccm fir\r\n"
+    "a=rtcp-fb:{pt} nack\r\n"
+    "a=rtcp-fb:{pt} nack pli\r\n"
+    "a=fmtp:{pt} level-asymmetry-allowed=1;packetization-mode=1;profile-level-id=42e01f\r\n"
+)
+
+
+def make_sdp(size: int = 4096, seed: int = 0) -> str:
+    """Erzeuge eine SDP-Beschreibung mit ungefähr ``size`` Zeichen"""
+    rng = random.Random(seed)
+    fingerprint = ':'.join(f'{rng.randrange(256):02X}' for _ in range(32))
+    ufrag = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(4))
+    pwd = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(24))
+    parts = [SDP_HEADER]
+    mid = 0
+    pt = 96
+    while sum(map(len, parts)) < size:
+        kind = 'audio' if mid % 2 == 0 else 'video'
+        parts.append(SDP_MEDIA.format(kind=kind, payloads=' '.join(str(p) for p in range(pt, pt + 8)),
+                                      ufrag=ufrag, pwd=pwd, fingerprint=fingerprint, mid=mid))
+        for _ in range(8):
+            if sum(map(len, parts)) >= size:
+                break
+            parts.append(SDP_CODEC.format(pt=pt, codec=rng.choice(['VP8', 'VP9', 'H264', 'AV1'])))
+            pt += 1
+        mid += 1
+    return ''.join(parts)[:size]
+
+
+def make_candidate(index: int, typ: str = 'host') -> str:
+    """Erzeuge eine ICE-Kandidatenzeile"""
+    if typ == 'host':
+        ip = f'192.168.{index // 250 % 250}.{index % 250 + 1}'
+        extra = ''
+    elif typ == 'srflx':
+        ip = f'203.0.113.{index % 250 + 1}'
+        extra = f' raddr 192.168.1.{index % 250 + 1} rport {50000 + index % 1000}'
+    else:
+        ip = f'198.51.100.{index % 250 + 1}'
+        extra = f' raddr 203.0.113.{index % 250 + 1} rport {50000 + index % 1000}'
+    return (f'candidate:{1000 + index} 1 udp {2122260223 - index} {ip} '
+            f'{50000 + index % 1000} typ {typ}{extra} generation 0 ufrag abcd network-id 1')
+
+
+def client_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Baue einen maskierten Client-Frame wie ein Browser"""
+    mask = os.urandom(4)
+    length = len(payload)
+    header = bytearray([0x80 | opcode])
+    if length <= 125:
+        header.append(0x80 | length)
+    elif length <= 65535:
+        header.append(0x80 | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(0x80 | 127)
+        header += struct.pack('!Q', length)
+    header += mask
+    key = (mask * (length // 4 + 1))[:length]
+    masked = (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(length, 'little')
+    return bytes(header) + masked
+
+
+class WSClient:
+    """Minimaler asyncio-WebSocket-Client nur mit der Standardbibliothek
+
+    Reicht für Lasttests gegen alle Servervarianten und vermeidet, dass
+    die Client-Bibliothek selbst das Ergebnis verfälscht.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        self.handshake_response = b''
+
+    @classmethod
+    async def connect(cls, host: str, port: int, path: str = '/ws', ssl=None,
+                      extra_headers: str = '', local_addr=None) -> 'WSClient':
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl, local_addr=local_addr)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            f"{extra_headers}\r\n"
+        ).encode())
+        response = await reader.readuntil(b'\r\n\r\n')
+        if b' 101 ' not in response.split(b'\r\n', 1)[0]:
+            writer.close()
+            raise ConnectionError(f"Handshake rejected: {response[:80]!r}")
+        client = cls(reader, writer)
+        client.handshake_response = response
+        return client
+
+    def send_nowait(self, text: str):
+        self.writer.write(client_frame(text.encode('utf-8')))
+
+    async def send(self, text: str):
+        self.send_nowait(text)
+        await self.writer.drain()
+
+    async def recv(self) -> Optional[str]:
+        """Nächste Textnachricht oder ``None`` bei Close/EOF"""
+        parts = []
+        while True:
+            try:
+                header = await self.reader.readexactly(2)
+                opcode = header[0] & 0x0F
+                length = header[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+                payload = await self.reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+            if opcode == 0x8:
+                self.closed = True
+                return None
+            if opcode == 0x9:
+                self.writer.write(client_frame(payload, 0xA))
+                continue
+            if opcode == 0xA:
+                continue
+            parts.append(payload)
+            if header[0] & 0x80:
+                return b''.join(parts).decode('utf-8')
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.writer.write(client_frame(b'\x03\xe8', 0x8))
+                await self.writer.drain()
+            except ConnectionError:
+                pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Konsolen-Logging im Hot Path
+Führt ``bench_load.py`` je Logging-Modus aus. Die Serverausgabe geht in
+eine Datei oder (``--sink pipe``) in eine FIFO, die mit begrenzter
+Geschwindigkeit gelesen wird - wie ein Terminal über SSH. Ist der
+Pipe-Puffer voll, blockiert synchrones Logging die Event-Loop. Verglichen
+werden Weiterleitungslatenz, Server-CPU pro Nachricht und die Zahl der
+geschriebenen Zeilen.
+
+Alle Optionen außer ``--modes``, ``--sink`` und ``--pipe-kbps`` gehen an ``bench_load.py``, z. B.
+``python bench_console_log.py --servers websockets --clients 100``.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench_load import build_parser, run_benchmark
+
+MODES = {
+    'sync': [],
+    'queue': ['--console-log', 'queue'],
+    'queue+sample': ['--console-log', 'queue', '--traffic-log-sample', '100'],
+    'sync+sample': ['--traffic-log-sample', '100'],
+}
+
+
+def count_lines(path: str) -> int:
+    try:
+        with open(path, 'rb') as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+
+class SlowConsole(threading.Thread):
+    """Liest eine FIFO mit höchstens ``kbps`` KiB/s und zählt die Zeilen"""
+
+    def __init__(self, path: str, kbps: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.kbps = kbps
+        self.lines = 0
+        os.mkfifo(path)
+        self.start()
+
+    def run(self):
+        with open(self.path, 'rb') as fifo:
+            while True:
+                chunk = fifo.read1(4096)
+                if not chunk:
+                    return
+                self.lines += chunk.count(b'\n')
+                time.sleep(len(chunk) / (self.kbps * 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare console logging modes under load',
+                                     add_help=False)
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help=f'Comma-separated modes ({", ".join(MODES)})')
+    parser.add_argument('--sink', choices=('file', 'pipe'), default='pipe',
+                        help='Server output: regular file or rate-limited pipe (default: pipe)')
+    parser.add_argument('--pipe-kbps', type=float, default=64.0,
+                        help='Read speed of the pipe sink in KiB/s (default: 64)')
+    args, rest = parser.parse_known_args()
+    if '-h' in rest or '--help' in rest:
+        parser.print_help()
+        print("\nAll other options are passed to bench_load.py:")
+        build_parser().print_help()
+        return
+    load_args = build_parser().parse_args(rest)
+    base_server_args = load_args.server_args
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in (m.strip() for m in args.modes.split(',') if m.strip()):
+            if mode not in MODES:
+                sys.exit(f"Unknown mode: {mode}")
+            load_args.server_args = ' '.join([base_server_args, *MODES[mode]]).strip()
+            load_args.server_log = os.path.join(tmp, mode)
+            consoles = {}
+            if args.sink == 'pipe':
+                # bench_load öffnet <server_log>.<server> - hier eine FIFO
+                for name in (s for s in load_args.servers.split(',') if s):
+                    consoles[name] = SlowConsole(f"{load_args.server_log}.{name}", args.pipe_kbps)
+            for result in run_benchmark(load_args):
+                console = consoles.get(result['server'])
+                if console is not None:
+                    console.join(5.0)
+                    lines = console.lines
+                else:
+                    lines = count_lines(f"{load_args.server_log}.{result['server']}")
+                rows.append((mode, result, lines))
+
+    def fmt(value, spec='.2f'):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'mode':<14} {'server':<16} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} "
+          f"{'µs/msg':>7} {'lines':>8}")
+    for mode, r, lines in rows:
+        lat = r['latency_ms']
+        print(f"{mode:<14} {r['server']:<16} {fmt(r['messages_per_s'], '.0f'):>8} {fmt(lat['p50']):>8} "
+              f"{fmt(lat['p99']):>8} {fmt(lat['p999']):>8} {fmt(r['cpu_us_per_message'], '.0f'):>7} "
+              f"{lines:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Micro-Benchmark: permessage-deflate im Stdlib-Server
+Misst Bytes und CPU-Zeit pro Sitzungsaufbau (Offer, Answer, ICE-Kandidaten)
+für verschiedene Kompressionseinstellungen
+"""
+
+import argparse
+import json
+import time
+
+from bench_common import make_candidate, make_sdp
+from deflate import DeflateConfig, PerMessageDeflate
+from signaling_server_stdlib import build_frame
+
+# (Name, Level, Window Bits, Context Takeover)
+MODES = (
+    ('none', None, None, None),
+    ('level1', 1, 15, True),
+    ('level6', 6, 15, True),
+    ('level9', 9, 15, True),
+    ('level6-w10', 6, 10, True),
+    ('level6-no-takeover', 6, 15, False),
+)
+
+
+def session_messages(sdp_size: int, candidates: int):
+    """Nachrichten eines Sitzungsaufbaus, wie sie ein Peer empfängt"""
+    messages = [json.dumps({'type': 'offer', 'sdp': make_sdp(sdp_size, 0)}),
+                json.dumps({'type': 'answer', 'sdp': make_sdp(sdp_size, 1)})]
+    for k in range(candidates):
+        messages.append(json.dumps({'type': 'ice-candidate',
+                                    'candidate': make_candidate(k, ('host', 'srflx', 'relay')[k % 3]),
+                                    'sdpMid': '0', 'sdpMLineIndex': 0}))
+    return [m.encode('utf-8') for m in messages]
+
+
+def zlib_memory(window_bits: int, takeover: bool) -> int:
+    """Dauerhafter zlib-Speicher pro Verbindung (Formel aus zconf.h, memLevel 8)"""
+    if not takeover:
+        return 0
+    deflate = (1 << (window_bits + 2)) + (1 << (8 + 9))
+    inflate = (1 << window_bits) + 7 * 1024
+    return deflate + inflate
+
+
+def make_pair(level, window_bits, takeover, threshold):
+    config = DeflateConfig(threshold=threshold, level=level,
+                           server_max_window_bits=window_bits, client_max_window_bits=window_bits)
+    sender = PerMessageDeflate(config, window_bits, window_bits, not takeover, not takeover)
+    receiver = PerMessageDeflate(config, window_bits, window_bits, not takeover, not takeover)
+    return sender, receiver
+
+
+def run_mode(mode, payloads, sessions: int, threshold: int) -> dict:
+    name, level, window_bits, takeover = mode
+    wire_bytes = 0
+    compress_seconds = 0.0
+    decompress_seconds = 0.0
+    for _ in range(sessions):
+        if level is None:
+            sender = receiver = None
+        else:
+            # Neue Verbindung pro Sitzung: Kontexte starten leer
+            sender, receiver = make_pair(level, window_bits, takeover, threshold)
+        for payload in payloads:
+            start = time.perf_counter()
+            frame = build_frame(sender, payload, {})
+            compress_seconds += time.perf_counter() - start
+            wire_bytes += len(frame)
+            if frame[0] & 0x40:
+                header = 2 if frame[1] < 126 else 4 if frame[1] == 126 else 10
+                start = time.perf_counter()
+                assert receiver.decompress(frame[header:]) == payload
+                decompress_seconds += time.perf_counter() - start
+    return {
+        'mode': name,
+        'level': level,
+        'window_bits': window_bits,
+        'context_takeover': takeover,
+        'bytes_per_session': wire_bytes / sessions,
+        'compress_us_per_session': compress_seconds / sessions * 1e6,
+        'decompress_us_per_session': decompress_seconds / sessions * 1e6,
+        'zlib_bytes_per_connection': zlib_memory(window_bits, takeover) if level else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark permessage-deflate bandwidth vs CPU')
+    parser.add_argument('--sdp-size', type=int, default=4096, help='SDP size in bytes')
+    parser.add_argument('--candidates', type=int, default=10, help='ICE candidates per session')
+    parser.add_argument('--sessions', type=int, default=200, help='Session setups per mode')
+    parser.add_argument('--threshold', type=int, default=256,
+                        help='Messages below N bytes stay uncompressed')
+    parser.add_argument('--link-kbps', type=float, default=256.0,
+                        help='Link speed for the transfer time column (default: 256 kbit/s)')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    payloads = session_messages(args.sdp_size, args.candidates)
+    results = [run_mode(mode, payloads, args.sessions, args.threshold) for mode in MODES]
+    plain = results[0]['bytes_per_session']
+    for r in results:
+        r['ratio'] = plain / r['bytes_per_session']
+        r['link_ms_per_session'] = r['bytes_per_session'] * 8 / args.link_kbps
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<20} {'bytes':>8} {'ratio':>6} {'link ms':>8} "
+          f"{'comp µs':>8} {'decomp µs':>10} {'zlib KB/conn':>13}")
+    for r in results:
+        print(f"{r['mode']:<20} {r['bytes_per_session']:>8.0f} {r['ratio']:>5.1f}x "
+              f"{r['link_ms_per_session']:>8.1f} {r['compress_us_per_session']:>8.0f} "
+              f"{r['decompress_us_per_session']:>10.0f} "
+              f"{r['zlib_bytes_per_connection'] / 1024:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Broadcast-Durchsatz des aiohttp-Servers
+Vergleicht den alten sequentiellen send_str-Loop mit dem Fan-out eines einmal kodierten Frames
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+from bench_common import make_sdp
+from signaling_server_aiohttp import SignalingServer
+
+
+class LegacySignalingServer(SignalingServer):
+    """Fan-out wie vor der Optimierung: sequentiell, ein send_str pro Client"""
+
+    async def fanout(self, message, sender):
+        for client in self.clients:
+            if client != sender and not client.closed:
+                try:
+                    await client.send_str(message)
+                except Exception:
+                    pass
+
+
+async def run_room(server_cls, room_size: int, messages: int, sdp_size: int, port: int) -> dict:
+    server = server_cls()
+    server.log_message = lambda msg_type, data: None
+    app = web.Application()
+    app.router.add_get('/ws', server.websocket_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+
+    payload = json.dumps({'type': 'offer', 'sdp': make_sdp(sdp_size)})
+    async with aiohttp.ClientSession() as session:
+        sockets = [await session.ws_connect(f'http://127.0.0.1:{port}/ws', max_msg_size=0)
+                   for _ in range(room_size)]
+        for ws in sockets:
+            await ws.receive()  # welcome
+        sender, receivers = sockets[0], sockets[1:]
+
+        async def drain(ws):
+            for _ in range(messages):
+                await ws.receive()
+
+        start = time.perf_counter()
+        readers = [asyncio.ensure_future(drain(ws)) for ws in receivers]
+        for _ in range(messages):
+            await sender.send_str(payload)
+        await asyncio.gather(*readers)
+        elapsed = time.perf_counter() - start
+
+        for ws in sockets:
+            await ws.close()
+
+    await runner.cleanup()
+    delivered = messages * len(receivers)
+    return {
+        'room_size': room_size,
+        'messages': messages,
+        'delivered': delivered,
+        'seconds': elapsed,
+        'deliveries_per_s': delivered / elapsed,
+    }
+
+
+async def run(args):
+    results = []
+    for room_size in (int(s) for s in args.rooms.split(',')):
+        row = {'room_size': room_size}
+        for name, cls in (('legacy', LegacySignalingServer), ('fanout', SignalingServer)):
+            result = await run_room(cls, room_size, args.messages, args.sdp_size, args.port)
+            row[name] = result['deliveries_per_s']
+        row['speedup'] = row['fanout'] / row['legacy']
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark aiohttp broadcast fan-out')
+    parser.add_argument('--rooms', default='2,10,100', help='Comma separated room sizes')
+    parser.add_argument('--messages', type=int, default=200, help='Messages sent per room')
+    parser.add_argument('--sdp-size', type=int, default=4096, help='SDP size in bytes')
+    parser.add_argument('--port', type=int, default=18765, help='Local port to use')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'room':>6} {'legacy msg/s':>14} {'fanout msg/s':>14} {'speedup':>9}")
+    for r in results:
+        print(f"{r['room_size']:>6} {r['legacy']:>14.0f} {r['fanout']:>14.0f} {r['speedup']:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
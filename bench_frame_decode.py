@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Micro-Benchmark: WebSocket-Frame-Dekodierung im Stdlib-Server
+Vergleicht den alten Byte-für-Byte-Pfad mit recv_into + Block-Demaskierung
+"""
+
+import argparse
+import json
+import struct
+import time
+from types import SimpleNamespace
+
+from bench_common import client_frame, make_sdp
+from admission import Admission, AdmissionPolicy
+from keepalive import Liveness
+from signaling_server_stdlib import WebSocketHandler
+
+
+class BufferConnection:
+    """Socket-Ersatz, der vorbereitete Bytes in Blöcken liefert"""
+
+    def __init__(self, data: bytes, chunk: int = 65536):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.chunk = chunk
+
+    def recv(self, size):
+        size = min(size, self.chunk)
+        out = bytes(self.data[self.pos:self.pos + size])
+        self.pos += len(out)
+        return out
+
+    def recv_into(self, view):
+        size = min(len(view), self.chunk, len(self.data) - self.pos)
+        view[:size] = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+
+def legacy_recv_frame(conn):
+    """Der ursprüngliche recv_frame-Pfad (bytes += und Byte-Schleife)"""
+    data = conn.recv(2)
+    if not data: return None
+    byte1, byte2 = struct.unpack('!BB', data)
+    opcode = byte1 & 0x0F
+    if opcode == 8:
+        return None
+    masked = (byte2 & 0x80) >> 7
+    payload_len = byte2 & 0x7F
+    if payload_len == 126:
+        payload_len = struct.unpack('!H', conn.recv(2))[0]
+    elif payload_len == 127:
+        payload_len = struct.unpack('!Q', conn.recv(8))[0]
+    masks = conn.recv(4) if masked else None
+    payload = b""
+    while len(payload) < payload_len:
+        chunk = conn.recv(payload_len - len(payload))
+        if not chunk: return None
+        payload += chunk
+    if masked:
+        decoded = bytearray()
+        for i in range(len(payload)):
+            decoded.append(payload[i] ^ masks[i % 4])
+        payload = decoded
+    return payload.decode('utf-8')
+
+
+def make_stream(size: int, count: int) -> bytes:
+    message = json.dumps({'type': 'offer', 'sdp': make_sdp(size)}).encode()
+    return client_frame(message) * count
+
+
+def run_legacy(stream: bytes, count: int) -> float:
+    conn = BufferConnection(stream)
+    start = time.perf_counter()
+    for _ in range(count):
+        legacy_recv_frame(conn)
+    return time.perf_counter() - start
+
+
+def run_current(stream: bytes, count: int) -> float:
+    # Nur die Teile des Servers, die recv_frame benötigt
+    server = SimpleNamespace(admission=Admission(AdmissionPolicy(max_frame_size=0)))
+    handler = WebSocketHandler(BufferConnection(stream), None, server)
+    handler.liveness = Liveness(None, 0.0, True)
+    start = time.perf_counter()
+    for _ in range(count):
+        handler.recv_frame()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark WebSocket frame decoding')
+    parser.add_argument('--sizes', default='1024,4096,10240,65536',
+                        help='Comma separated SDP sizes in bytes')
+    parser.add_argument('--count', type=int, default=200, help='Frames per size')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        stream = make_stream(size, args.count)
+        legacy = run_legacy(stream, args.count)
+        current = run_current(stream, args.count)
+        results.append({
+            'sdp_bytes': size,
+            'frames': args.count,
+            'legacy_us_per_frame': legacy / args.count * 1e6,
+            'current_us_per_frame': current / args.count * 1e6,
+            'speedup': legacy / current if current else float('inf'),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'SDP':>8} {'legacy µs':>12} {'current µs':>12} {'speedup':>9}")
+    for r in results:
+        print(f"{r['sdp_bytes']:>8} {r['legacy_us_per_frame']:>12.1f} "
+              f"{r['current_us_per_frame']:>12.1f} {r['speedup']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+"""
+Last- und Latenz-Benchmark für alle Servervarianten
+Öffnet N Clients in M Räumen, spielt Offer/Answer/ICE-Verkehr ab und misst
+Durchsatz, Weiterleitungslatenz sowie Speicher und CPU des Servers.
+
+Mit ``--scenario reconnect-storm`` trennen sich stattdessen alle Clients
+und verbinden sich gleichzeitig neu (wie nach einem Deploy); gemessen
+werden angenommene Verbindungen pro Sekunde und die Handshake-Latenz.
+
+Benötigt nur lokale Sockets. Ergebnisse werden als JSON geschrieben, damit
+sie zwischen Versionen verglichen werden können (``--baseline``).
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from bench_common import WSClient, make_candidate, make_sdp
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = {
+    'websockets': ['signaling_server.py'],
+    'stdlib': ['signaling_server_stdlib.py'],
+    'stdlib-threads': ['signaling_server_stdlib.py', '--engine', 'threads'],
+    'aiohttp': ['signaling_server_aiohttp.py'],
+    'simple': ['signaling_server_simple.py'],
+}
+
+# Varianten mit --workers (SO_REUSEPORT + Raum-Bus)
+MULTI_WORKER = {'websockets'}
+
+# Varianten mit nur einem Raum (Raum-ID aus Pfad oder Join wird ignoriert)
+SINGLE_ROOM = {'stdlib', 'stdlib-threads', 'aiohttp'}
+
+SCENARIOS = ('traffic', 'reconnect-storm')
+
+BENCH_PREFIX = '{"bench":['
+
+
+def raise_fd_limit():
+    """Erlaube so viele Sockets wie das System zulässt"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class ServerProcess:
+    """Startet eine Servervariante als Subprozess und misst RSS/CPU über /proc"""
+
+    def __init__(self, name: str, host: str, port: int, extra_args=(), log_path: Optional[str] = None):
+        if name not in SERVERS:
+            raise ValueError(f"Unknown server variant: {name}")
+        self.name = name
+        self.host = host
+        self.port = port
+        self.extra_args = list(extra_args)
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+        self._log = None
+
+    def start(self, timeout: float = 15.0):
+        script, *args = SERVERS[self.name]
+        command = [sys.executable, os.path.join(HERE, script), '--host', self.host,
+                   '--port', str(self.port), *args, *self.extra_args]
+        self._log = open(self.log_path, 'w') if self.log_path else subprocess.DEVNULL
+        self.process = subprocess.Popen(command, cwd=HERE, stdout=self._log, stderr=self._log)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with code {self.process.returncode}")
+            try:
+                with socket.create_connection((self.host, self.port), timeout=0.2):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"{self.name} did not start listening on port {self.port}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log not in (None, subprocess.DEVNULL):
+            self._log.close()
+
+    def pids(self) -> List[int]:
+        """Serverprozess samt Worker-Prozessen (``--workers``)"""
+        pids = [self.process.pid]
+        try:
+            entries = os.listdir('/proc')
+        except OSError:
+            return pids
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == self.process.pid:
+                pids.append(int(entry))
+        return pids
+
+    def rss_bytes(self) -> Optional[int]:
+        total = None
+        for pid in self.pids():
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total = (total or 0) + int(line.split()[1]) * 1024
+            except OSError:
+                pass
+        return total
+
+    def cpu_seconds(self) -> Optional[float]:
+        total = None
+        for pid in self.pids():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                ticks = int(fields[11]) + int(fields[12])
+            except (OSError, IndexError, ValueError):
+                continue
+            total = (total or 0) + ticks / os.sysconf('SC_CLK_TCK')
+        return total
+
+
+class LoadClient:
+    """Ein simulierter Browser-Tab"""
+
+    def __init__(self, client_id: int, room: int, role: str, ws: WSClient):
+        self.client_id = client_id
+        self.room = room
+        self.role = role
+        self.ws = ws
+        self.seq = 0
+        self.sent = 0
+        self.received = 0
+        self.frames = 0
+        self.peer_id: Optional[str] = None
+
+    def stamp(self, body: str) -> str:
+        """Stelle Absender, Sequenznummer und Sendezeit voran (billig zu parsen)"""
+        self.seq += 1
+        return f'{BENCH_PREFIX}{self.client_id},{self.seq},{time.perf_counter_ns()}],{body[1:]}'
+
+
+class LoadRun:
+    """Verkehr eines Lastgenerator-Prozesses
+
+    Bei ``--client-procs`` > 1 übernimmt jeder Prozess die Räume mit
+    ``room % parts == part``; Offer und Answer eines Raums laufen so immer
+    im selben Prozess.
+    """
+
+    def __init__(self, args, host: str, port: int, part: int = 0, parts: int = 1):
+        self.args = args
+        self.host = host
+        self.port = port
+        self.part = part
+        self.parts = parts
+        self.clients: List[LoadClient] = []
+        self.readers: List[asyncio.Future] = []
+        self.latencies_ns: List[int] = []
+        self.last_receive = 0.0
+        self.connect_seconds = 0.0
+
+    async def connect_all(self):
+        args = self.args
+
+        async def connect(client_id):
+            room = client_id % args.rooms
+            role = 'offer' if (client_id // args.rooms) % 2 == 0 else 'answer'
+            path = f'/ws?room=room-{room}' + ('&ice_batch=1' if args.ice_batch else '')
+            ws = await WSClient.connect(self.host, self.port, path)
+            return LoadClient(client_id, room, role, ws)
+
+        ids = [i for i in range(args.clients) if (i % args.rooms) % self.parts == self.part]
+        for start in range(0, len(ids), args.connect_batch):
+            batch = ids[start:start + args.connect_batch]
+            self.clients.extend(await asyncio.gather(*(connect(i) for i in batch)))
+
+    async def read_loop(self, client: LoadClient):
+        while True:
+            message = await client.ws.recv()
+            if message is None:
+                return
+            now = time.perf_counter_ns()
+            client.frames += 1
+            self.last_receive = time.perf_counter()
+            # Gebündelte ICE-Kandidaten enthalten mehrere Stempel
+            pos = message.find(BENCH_PREFIX)
+            if pos == -1:
+                client.received += 1
+                if client.peer_id is None and '"welcome"' in message:
+                    client.peer_id = json.loads(message).get('peer_id')
+            while pos != -1:
+                start = pos + len(BENCH_PREFIX)
+                stamp = message[start:message.index(']', start)].split(',')
+                self.latencies_ns.append(now - int(stamp[2]))
+                client.received += 1
+                pos = message.find(BENCH_PREFIX, start)
+
+    async def send_loop(self, client: LoadClient, sdp_body: str, candidates: List[str]):
+        args = self.args
+        for _ in range(args.rounds):
+            await client.ws.send(client.stamp(sdp_body))
+            client.sent += 1
+            for body in candidates:
+                if args.ice_interval:
+                    await asyncio.sleep(args.ice_interval / 1000.0)
+                await client.ws.send(client.stamp(body))
+                client.sent += 1
+            if args.round_interval:
+                await asyncio.sleep(args.round_interval / 1000.0)
+
+    async def prepare(self):
+        """Verbinden und welcome-Nachrichten abwarten"""
+        connect_start = time.perf_counter()
+        await self.connect_all()
+        self.connect_seconds = time.perf_counter() - connect_start
+        self.readers = [asyncio.ensure_future(self.read_loop(c)) for c in self.clients]
+        await asyncio.sleep(0.5)
+        for client in self.clients:
+            client.received = 0
+            client.frames = 0
+
+    async def traffic(self) -> dict:
+        """Offer/Answer/ICE abspielen, bis keine Nachrichten mehr eintreffen"""
+        args = self.args
+        sdp = make_sdp(args.sdp_size)
+        start = time.perf_counter()
+        self.last_receive = start
+        partners = self.partners() if args.unicast else {}
+        senders = []
+        for client in self.clients:
+            # Mit --unicast adressiert jeder Client genau einen Peer im Raum
+            to = {'to': partners[client.client_id]} if client.client_id in partners else {}
+            sdp_body = json.dumps({'type': client.role, 'sdp': sdp, **to})
+            candidates = [json.dumps({'type': 'ice-candidate',
+                                      'candidate': make_candidate(client.client_id * 100 + k,
+                                                                  ('host', 'srflx', 'relay')[k % 3]),
+                                      'sdpMid': '0', 'sdpMLineIndex': 0, **to})
+                          for k in range(args.candidates)]
+            senders.append(self.send_loop(client, sdp_body, candidates))
+        await asyncio.gather(*senders)
+        send_done = time.perf_counter()
+
+        # Warten, bis keine Nachrichten mehr eintreffen
+        deadline = send_done + args.drain_timeout
+        while time.perf_counter() < deadline:
+            idle_since = time.perf_counter() - self.last_receive
+            if idle_since >= args.quiet_period:
+                break
+            await asyncio.sleep(0.05)
+        return {
+            'start': start,
+            'end': max(self.last_receive, send_done),
+            'connect_seconds': self.connect_seconds,
+            'sent': sum(c.sent for c in self.clients),
+            'delivered': sum(c.received for c in self.clients),
+            'frames': sum(c.frames for c in self.clients),
+            'latencies_ns': self.latencies_ns,
+        }
+
+    def partners(self) -> dict:
+        """Client-ID -> Peer-ID des nächsten Clients im selben Raum (Ring)"""
+        rooms = {}
+        for client in self.clients:
+            rooms.setdefault(client.room, []).append(client)
+        partners = {}
+        for members in rooms.values():
+            if len(members) < 2:
+                continue
+            for index, client in enumerate(members):
+                peer_id = members[(index + 1) % len(members)].peer_id
+                if peer_id is not None:
+                    partners[client.client_id] = peer_id
+        return partners
+
+    async def finish(self):
+        for client in self.clients:
+            await client.ws.close()
+        for reader in self.readers:
+            reader.cancel()
+        await asyncio.gather(*self.readers, return_exceptions=True)
+
+    async def run(self, server: 'ServerProcess') -> dict:
+        rss_idle = server.rss_bytes()
+        await self.prepare()
+        rss_connected = server.rss_bytes()
+        cpu_start = server.cpu_seconds()
+        traffic = await self.traffic()
+        cpu_end = server.cpu_seconds()
+        rss_end = server.rss_bytes()
+        await self.finish()
+        cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+        return summarize(self.args, server.name, [traffic], (rss_idle, rss_connected, rss_end), cpu)
+
+
+class ReconnectStorm:
+    """Alle Clients brechen ihre Verbindung ab und verbinden sich gleichzeitig neu
+
+    Die Handshake-Latenz reicht vom TCP-Connect bis zur ``101``-Antwort.
+    Läuft die Accept-Queue des Servers über, verwirft der Kernel SYNs und
+    der Client wiederholt erst nach 1 s (dann 3 s ...) - das zeigt sich
+    direkt in p99.
+    """
+
+    def __init__(self, args, host: str, port: int):
+        self.args = args
+        self.host = host
+        self.port = port
+
+    def path(self, client_id: int) -> str:
+        return f'/ws?room=room-{client_id % self.args.rooms}'
+
+    async def connect(self, client_id: int):
+        """(Sekunden, WSClient) oder (None, None), wenn der Client aufgibt"""
+        start = time.perf_counter()
+        try:
+            ws = await asyncio.wait_for(WSClient.connect(self.host, self.port, self.path(client_id)),
+                                        self.args.storm_timeout)
+        except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return None, None
+        return time.perf_counter() - start, ws
+
+    async def run(self, server: 'ServerProcess') -> dict:
+        args = self.args
+        clients = []
+        for start in range(0, args.clients, args.connect_batch):
+            batch = range(start, min(args.clients, start + args.connect_batch))
+            clients.extend(await asyncio.gather(*(self.connect(i) for i in batch)))
+        # Abbruch ohne Close-Handshake, wie beim Neustart eines Load Balancers
+        for _, ws in clients:
+            if ws is not None:
+                ws.writer.transport.abort()
+        await asyncio.sleep(args.quiet_period)
+
+        cpu_start = server.cpu_seconds()
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(self.connect(i) for i in range(args.clients)))
+        elapsed = max((seconds for seconds, _ in outcomes if seconds is not None), default=0.0)
+        cpu_end = server.cpu_seconds()
+        for _, ws in outcomes:
+            if ws is not None:
+                ws.writer.transport.abort()
+
+        latencies = sorted(seconds * 1000 for seconds, _ in outcomes if seconds is not None)
+        connected = len(latencies)
+        cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+        return {
+            'server': server.name,
+            'scenario': 'reconnect-storm',
+            'workers': args.workers if server.name in MULTI_WORKER else 1,
+            'clients': args.clients,
+            'connected': connected,
+            'failed': args.clients - connected,
+            'seconds': elapsed,
+            'accepts_per_s': connected / elapsed if elapsed else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p99': percentile(latencies, 99),
+                'p999': percentile(latencies, 99.9),
+                'max': latencies[-1] if latencies else None,
+            },
+            'server_cpu_seconds': cpu,
+            'cpu_us_per_accept': cpu / connected * 1e6 if cpu is not None and connected else None,
+        }
+
+
+def _client_process(args, host, port, part, parts, barrier, results):
+    """Lastgenerator in einem eigenen Prozess (``--client-procs``)"""
+    async def main():
+        run = LoadRun(args, host, port, part, parts)
+        await run.prepare()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, barrier.wait)   # alle verbunden
+        await loop.run_in_executor(None, barrier.wait)   # Start
+        results.put(await run.traffic())
+        await run.finish()
+
+    raise_fd_limit()
+    asyncio.run(main())
+
+
+def run_multiprocess(args, server: 'ServerProcess') -> dict:
+    parts = args.client_procs
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(parts + 1)
+    results = context.Queue()
+    procs = [context.Process(target=_client_process,
+                             args=(args, server.host, server.port, part, parts, barrier, results))
+             for part in range(parts)]
+    rss_idle = server.rss_bytes()
+    for proc in procs:
+        proc.start()
+    barrier.wait()
+    rss_connected = server.rss_bytes()
+    cpu_start = server.cpu_seconds()
+    barrier.wait()
+    traffic = [results.get() for _ in procs]
+    cpu_end = server.cpu_seconds()
+    rss_end = server.rss_bytes()
+    for proc in procs:
+        proc.join()
+    cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+    return summarize(args, server.name, traffic, (rss_idle, rss_connected, rss_end), cpu)
+
+
+def summarize(args, name: str, traffic: List[dict], rss, cpu: Optional[float]) -> dict:
+    rss_idle, rss_connected, rss_end = rss
+    elapsed = max(t['end'] for t in traffic) - min(t['start'] for t in traffic)
+    sent = sum(t['sent'] for t in traffic)
+    delivered = sum(t['delivered'] for t in traffic)
+    frames = sum(t['frames'] for t in traffic)
+    latencies = sorted(ns / 1e6 for t in traffic for ns in t['latencies_ns'])
+    per_connection = None
+    if rss_idle is not None and rss_connected is not None:
+        per_connection = (rss_connected - rss_idle) / max(1, args.clients)
+    return {
+        'server': name,
+        'workers': args.workers if name in MULTI_WORKER else 1,
+        'clients': args.clients,
+        'rooms': args.rooms,
+        'unicast': args.unicast,
+        'connect_seconds': max(t['connect_seconds'] for t in traffic),
+        'seconds': elapsed,
+        'sent': sent,
+        'delivered': delivered,
+        'frames_delivered': frames,
+        'messages_per_s': sent / elapsed if elapsed else None,
+        'deliveries_per_s': delivered / elapsed if elapsed else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'p999': percentile(latencies, 99.9),
+            'max': latencies[-1] if latencies else None,
+        },
+        'server_rss_bytes': {'idle': rss_idle, 'connected': rss_connected, 'end': rss_end},
+        'bytes_per_connection': per_connection,
+        'server_cpu_seconds': cpu,
+        'server_cpu_percent': cpu / elapsed * 100 if cpu is not None and elapsed else None,
+        'cpu_us_per_message': cpu / sent * 1e6 if cpu is not None and sent else None,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Vergleiche mit früheren Ergebnissen, liefert gefundene Regressionen"""
+    with open(baseline_path) as f:
+        baseline = {r['server']: r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        old = baseline.get(result['server'])
+        if not old:
+            continue
+        for key in ('messages_per_s', 'accepts_per_s'):
+            if old.get(key) and result.get(key) is not None and result[key] < old[key] * (1 - tolerance):
+                regressions.append(f"{result['server']}: {key} {old[key]:.0f} -> {result[key]:.0f}")
+        old_p99 = (old.get('latency_ms') or {}).get('p99')
+        new_p99 = result['latency_ms']['p99']
+        if old_p99 and new_p99 is not None and new_p99 > old_p99 * (1 + tolerance):
+            regressions.append(f"{result['server']}: p99 {old_p99:.2f} ms -> {new_p99:.2f} ms")
+    return regressions
+
+
+def print_summary(results: List[dict]):
+    def fmt(value, spec='.2f'):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'server':<16} {'wrk':>3} {'msg/s':>9} {'deliv/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'p999 ms':>8} {'B/conn':>8} {'cpu %':>6} {'µs/msg':>7}")
+    for r in results:
+        lat = r['latency_ms']
+        print(f"{r['server']:<16} {r.get('workers', 1):>3} {fmt(r['messages_per_s'], '.0f'):>9} "
+              f"{fmt(r['deliveries_per_s'], '.0f'):>9} {fmt(lat['p50']):>8} {fmt(lat['p99']):>8} "
+              f"{fmt(lat['p999']):>8} {fmt(r['bytes_per_connection'], '.0f'):>8} "
+              f"{fmt(r['server_cpu_percent'], '.0f'):>6} {fmt(r['cpu_us_per_message'], '.0f'):>7}")
+
+
+def print_storm_summary(results: List[dict]):
+    def fmt(value, spec='.2f'):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'server':<16} {'wrk':>3} {'clients':>8} {'failed':>7} {'accepts/s':>10} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'µs/accept':>10}")
+    for r in results:
+        lat = r['latency_ms']
+        print(f"{r['server']:<16} {r['workers']:>3} {r['clients']:>8} {r['failed']:>7} "
+              f"{fmt(r['accepts_per_s'], '.0f'):>10} {fmt(lat['p50']):>8} {fmt(lat['p99']):>8} "
+              f"{fmt(lat['max']):>8} {fmt(r['cpu_us_per_accept'], '.0f'):>10}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Load and latency benchmark for the signaling servers')
+    parser.add_argument('--servers', default='websockets,stdlib,aiohttp',
+                        help=f"Comma separated variants ({', '.join(SERVERS)})")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18800, help='First port to use')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='traffic',
+                        help='traffic: offer/answer/ICE load, reconnect-storm: all clients reconnect at once')
+    parser.add_argument('--storm-timeout', type=float, default=30.0,
+                        help='Seconds a reconnecting client waits for the handshake (default: 30)')
+    parser.add_argument('--clients', type=int, default=100, help='Concurrent clients (N)')
+    parser.add_argument('--rooms', type=int, default=50, help='Rooms (M)')
+    parser.add_argument('--rounds', type=int, default=5, help='Offer/answer rounds per client')
+    parser.add_argument('--candidates', type=int, default=10, help='ICE candidates per round')
+    parser.add_argument('--sdp-size', type=int, default=4096, help='SDP size in bytes')
+    parser.add_argument('--ice-interval', type=float, default=1.0, help='ms between candidates')
+    parser.add_argument('--round-interval', type=float, default=50.0, help='ms between rounds')
+    parser.add_argument('--ice-batch', action='store_true',
+                        help='Request coalesced ICE candidates (?ice_batch=1); combine with '
+                             '--server-args=--ice-batch-window=10')
+    parser.add_argument('--unicast', action='store_true',
+                        help='Address every message to one peer via "to" (peer id from welcome)')
+    parser.add_argument('--connect-batch', type=int, default=200, help='Concurrent connects')
+    parser.add_argument('--quiet-period', type=float, default=0.5,
+                        help='Seconds without traffic that end a run')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f"Server worker processes for {', '.join(sorted(MULTI_WORKER))} (default: 1)")
+    parser.add_argument('--client-procs', type=int, default=1,
+                        help='Load generator processes, so the client is not the bottleneck (default: 1)')
+    parser.add_argument('--server-args', default='', help='Extra arguments for every server')
+    parser.add_argument('--server-log', default=None, help='Write server output to FILE.<variant>')
+    parser.add_argument('--output', default=None, help='Write JSON results to this file')
+    parser.add_argument('--baseline', default=None, help='Compare against a previous --output file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative regression against --baseline (default: 0.2)')
+    return parser
+
+
+def run_benchmark(args) -> List[dict]:
+    raise_fd_limit()
+    results = []
+    for offset, name in enumerate(s for s in args.servers.split(',') if s):
+        log_path = f"{args.server_log}.{name}" if args.server_log else None
+        extra = args.server_args.split()
+        if args.workers > 1 and name in MULTI_WORKER:
+            extra += ['--workers', str(args.workers)]
+        server = ServerProcess(name, args.host, args.port + offset, extra, log_path)
+        server.start()
+        try:
+            if args.scenario == 'reconnect-storm':
+                results.append(asyncio.run(ReconnectStorm(args, server.host, server.port).run(server)))
+            elif args.client_procs > 1:
+                results.append(run_multiprocess(args, server))
+            else:
+                results.append(asyncio.run(LoadRun(args, server.host, server.port).run(server)))
+        finally:
+            server.stop()
+    return results
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.scenario == 'reconnect-storm' and args.client_procs > 1:
+        parser.error("--scenario reconnect-storm runs in a single client process")
+    results = run_benchmark(args)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': vars(args),
+        },
+        'results': results,
+    }
+    if args.scenario == 'reconnect-storm':
+        print_storm_summary(results)
+    else:
+        print_summary(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
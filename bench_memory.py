@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Speicher pro Verbindung
+Öffnet 10k/50k/100k Verbindungen ohne Verkehr gegen jede Servervariante
+und misst den RSS-Zuwachs des Servers pro Verbindung (je zwei Clients
+teilen sich einen Raum, wie bei einem 1:1-Anruf).
+
+Jeder Client-Prozess nutzt eine eigene Loopback-Adresse (127.0.0.2, ...),
+damit mehr als die rund 28 000 lokalen Ports einer Adresse möglich sind.
+Anzahlen über dem Dateideskriptor-Limit des Servers werden übersprungen.
+
+``BUDGETS`` sind die Obergrenzen in Bytes pro Verbindung; mit ``--enforce``
+endet das Script mit Exit-Code 1, sobald eine Variante darüber liegt.
+``test_memory.py`` prüft die Budgets im Test-Lauf mit kleinerer Anzahl.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+from bench_common import WSClient
+from bench_load import SERVERS, ServerProcess, git_revision, raise_fd_limit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_COUNTS = (10000, 50000, 100000)
+
+# Bytes RSS pro Verbindung ohne Verkehr (gemessen bei 10k: 1,1 / 21 / 2,4 / 16 / 15 KB)
+BUDGETS = {
+    'stdlib': 2048,
+    'stdlib-threads': 32768,
+    'simple': 4096,
+    'websockets': 20480,
+    'aiohttp': 20480,
+}
+
+# Lokale Ports pro Quelladresse (net.ipv4.ip_local_port_range, mit Reserve)
+PORTS_PER_ADDRESS = 28000
+FD_RESERVE = 64
+
+
+def fd_limit() -> int:
+    if resource is None:
+        return PORTS_PER_ADDRESS
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+async def drain(ws: WSClient):
+    while await ws.recv() is not None:
+        pass
+
+
+async def hold_idle(host: str, port: int, first: int, count: int, room_size: int,
+                    local_addr, connect_batch: int, ready, release) -> int:
+    """Öffnet ``count`` Verbindungen und hält sie bis ``release``; liefert die Anzahl"""
+    clients: List[WSClient] = []
+
+    async def connect(client_id):
+        try:
+            ws = await WSClient.connect(host, port, f'/ws?room=idle-{client_id // room_size}',
+                                        local_addr=local_addr)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            return
+        clients.append(ws)
+
+    for start in range(first, first + count, connect_batch):
+        await asyncio.gather(*(connect(i) for i in range(start, min(first + count, start + connect_batch))))
+    # Pings beantworten, damit der Server niemanden als tot trennt
+    readers = [asyncio.ensure_future(drain(ws)) for ws in clients]
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ready, len(clients))
+    await loop.run_in_executor(None, release.wait)
+    for ws in clients:
+        ws.writer.transport.abort()
+    for reader in readers:
+        reader.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    return len(clients)
+
+
+def _client_process(args, host, port, part, first, count, barrier, release, results):
+    def ready(connected):
+        results.put(connected)
+        barrier.wait()
+
+    raise_fd_limit()
+    local_addr = (f'127.0.0.{part + 2}', 0) if host.startswith('127.') else None
+    asyncio.run(hold_idle(host, port, first, count, args.room_size, local_addr,
+                          args.connect_batch, ready, release))
+
+
+def measure(name: str, count: int, args, port: int) -> dict:
+    """RSS-Zuwachs von ``name`` mit ``count`` offenen Verbindungen"""
+    result = {'server': name, 'connections': count, 'connected': None,
+              'rss_idle': None, 'rss_connected': None, 'bytes_per_connection': None,
+              'budget': BUDGETS.get(name), 'skipped': None}
+    limit = fd_limit()
+    if count + FD_RESERVE > limit:
+        result['skipped'] = f'fd limit {limit}'
+        return result
+    per_process = min(limit - FD_RESERVE, PORTS_PER_ADDRESS)
+    parts = -(-count // per_process)
+
+    server = ServerProcess(name, args.host, port, args.server_args.split())
+    server.start()
+    try:
+        time.sleep(args.settle)
+        result['rss_idle'] = server.rss_bytes()
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(parts + 1)
+        release = context.Event()
+        results = context.Queue()
+        procs = []
+        for part in range(parts):
+            first = part * per_process
+            share = min(per_process, count - first)
+            procs.append(context.Process(target=_client_process,
+                                         args=(args, args.host, port, part, first, share,
+                                               barrier, release, results)))
+        for proc in procs:
+            proc.start()
+        barrier.wait()
+        connected = sum(results.get() for _ in procs)
+        time.sleep(args.settle)
+        result['rss_connected'] = server.rss_bytes()
+        result['connected'] = connected
+        release.set()
+        for proc in procs:
+            proc.join()
+    finally:
+        server.stop()
+    if result['rss_idle'] is not None and result['rss_connected'] is not None and result['connected']:
+        result['bytes_per_connection'] = (result['rss_connected'] - result['rss_idle']) / result['connected']
+    return result
+
+
+def over_budget(result: dict) -> bool:
+    per_connection, budget = result['bytes_per_connection'], result['budget']
+    return per_connection is not None and budget is not None and per_connection > budget
+
+
+def print_summary(results: List[dict]):
+    def fmt(value, spec='.0f'):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'server':<16} {'conns':>7} {'ok':>7} {'idle MB':>8} {'conn MB':>8} {'B/conn':>8} "
+          f"{'budget':>7}")
+    for r in results:
+        if r['skipped']:
+            print(f"{r['server']:<16} {r['connections']:>7} skipped ({r['skipped']})")
+            continue
+        mb = lambda value: None if value is None else value / 2 ** 20
+        flag = '  OVER' if over_budget(r) else ''
+        print(f"{r['server']:<16} {r['connections']:>7} {fmt(r['connected']):>7} "
+              f"{fmt(mb(r['rss_idle']), '.1f'):>8} {fmt(mb(r['rss_connected']), '.1f'):>8} "
+              f"{fmt(r['bytes_per_connection']):>8} {fmt(r['budget']):>7}{flag}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Server memory per idle connection')
+    parser.add_argument('--servers', default=','.join(SERVERS),
+                        help=f"Comma separated variants ({', '.join(SERVERS)})")
+    parser.add_argument('--counts', default=','.join(map(str, DEFAULT_COUNTS)),
+                        help='Comma separated connection counts (default: 10000,50000,100000)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=19000, help='First port to use')
+    parser.add_argument('--room-size', type=int, default=2, help='Clients per room (default: 2)')
+    parser.add_argument('--connect-batch', type=int, default=500, help='Concurrent connects')
+    parser.add_argument('--settle', type=float, default=1.0,
+                        help='Seconds to wait before each RSS reading (default: 1)')
+    parser.add_argument('--server-args', default='', help='Extra arguments for every server')
+    parser.add_argument('--enforce', action='store_true',
+                        help='Exit with code 1 if a variant exceeds its bytes-per-connection budget')
+    parser.add_argument('--output', default=None, help='Write JSON results to this file')
+    return parser
+
+
+def run_benchmark(args) -> List[dict]:
+    raise_fd_limit()
+    results = []
+    port = args.port
+    for name in (s for s in args.servers.split(',') if s):
+        for count in (int(c) for c in args.counts.split(',') if c):
+            results.append(measure(name, count, args, port))
+            # Neuer Port je Lauf: TIME_WAIT der vorigen Verbindungen stört nicht
+            port += 1
+    return results
+
+
+def main():
+    args = build_parser().parse_args()
+    results = run_benchmark(args)
+    print_summary(results)
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(),
+                'revision': git_revision(),
+                'params': vars(args),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.enforce:
+        over = [r for r in results if over_budget(r)]
+        for r in over:
+            print(f"OVER BUDGET {r['server']} at {r['connections']}: "
+                  f"{r['bytes_per_connection']:.0f} > {r['budget']} bytes/connection")
+        if over:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark: TLS-Handshake mit und ohne Session-Wiederaufnahme
+Baut pro Servervariante nacheinander Verbindungen auf (TCP + TLS +
+WebSocket-Upgrade), einmal immer mit vollem Handshake und einmal mit der
+Session der vorherigen Verbindung. Gemessen werden Client-Latenz und die
+CPU-Zeit des Servers pro Handshake.
+
+Das selbstsignierte Zertifikat wird in einem temporären Verzeichnis
+erzeugt (``openssl``-Kommando erforderlich).
+"""
+
+import argparse
+import base64
+import json
+import os
+import socket
+import tempfile
+import time
+from typing import List, Optional
+
+from bench_load import SERVERS, ServerProcess, percentile
+from tls import client_context, generate_self_signed
+
+MODES = ('full', 'resumed')
+
+
+def handshake(host: str, port: int, context, session=None):
+    """Eine Verbindung bis zur 101-Antwort; liefert (TLS s, gesamt s, SSLSocket)"""
+    start = time.perf_counter()
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    tls = context.wrap_socket(sock, server_hostname='localhost', session=session)
+    tls_done = time.perf_counter()
+    key = base64.b64encode(os.urandom(16)).decode()
+    tls.sendall((
+        f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+        f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = tls.recv(4096)
+        if not chunk:
+            raise ConnectionError("Connection closed during WebSocket handshake")
+        response += chunk
+    if b' 101 ' not in response.split(b'\r\n', 1)[0]:
+        raise ConnectionError(f"Handshake rejected: {response[:80]!r}")
+    return tls_done - start, time.perf_counter() - start, tls
+
+
+def close(tls):
+    """Wie ein Browser mit close_notify schließen (sonst verwirft der Session-Cache die Session)"""
+    tls.settimeout(1.0)
+    try:
+        tls.unwrap()
+    except OSError:
+        pass
+    tls.close()
+
+
+def run_mode(server: ServerProcess, context, mode: str, count: int) -> dict:
+    tls_times: List[float] = []
+    totals: List[float] = []
+    reused = 0
+    session = None
+    version = alpn = None
+    cpu_start = server.cpu_seconds()
+    for _ in range(count):
+        tls_seconds, total, tls = handshake(server.host, server.port, context,
+                                            session if mode == 'resumed' else None)
+        reused += tls.session_reused
+        # TLS 1.3: Tickets kommen erst nach dem Handshake, also nach der Antwort lesen
+        session = tls.session
+        version, alpn = tls.version(), tls.selected_alpn_protocol()
+        close(tls)
+        tls_times.append(tls_seconds * 1000)
+        totals.append(total * 1000)
+    cpu_end = server.cpu_seconds()
+    tls_times.sort()
+    totals.sort()
+    cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+    return {
+        'server': server.name,
+        'mode': mode,
+        'handshakes': count,
+        'version': version,
+        'alpn': alpn,
+        'reused_percent': reused / count * 100,
+        'tls_ms': {'p50': percentile(tls_times, 50), 'p99': percentile(tls_times, 99)},
+        'total_ms': {'p50': percentile(totals, 50), 'p99': percentile(totals, 99)},
+        'server_cpu_us_per_handshake': cpu / count * 1e6 if cpu is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TLS handshakes with and without resumption')
+    parser.add_argument('--servers', default='websockets,stdlib,aiohttp',
+                        help=f'Comma-separated variants ({", ".join(s for s in SERVERS if s != "stdlib-threads")})')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18900, help='First port to use')
+    parser.add_argument('--handshakes', type=int, default=200, help='Connections per mode')
+    parser.add_argument('--tls-version', choices=('1.2', '1.3'), default='1.3',
+                        help='Highest TLS version offered by the client (default: 1.3)')
+    parser.add_argument('--server-args', default='',
+                        help='Extra server arguments, e.g. --tls-resumption=cache')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = os.path.join(tmp, 'cert.pem'), os.path.join(tmp, 'key.pem')
+        generate_self_signed(cert, key)
+        context = client_context(cert, max_version=args.tls_version)
+        for offset, name in enumerate(s.strip() for s in args.servers.split(',') if s.strip()):
+            extra = ['--tls-cert', cert, '--tls-key', key, *args.server_args.split()]
+            server = ServerProcess(name, args.host, args.port + offset, extra)
+            server.start()
+            try:
+                # Aufwärmen: Imports, erste Allokationen
+                run_mode(server, context, 'full', 5)
+                results.extend(run_mode(server, context, mode, args.handshakes) for mode in MODES)
+            finally:
+                server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    def fmt(value: Optional[float], spec: str = '.2f') -> str:
+        return format(value, spec) if value is not None else '-'
+
+    print(f"{'server':<12} {'mode':<8} {'version':<8} {'reused':>7} {'tls p50':>8} {'tls p99':>8} "
+          f"{'total p50':>10} {'cpu µs/hs':>10}")
+    for r in results:
+        print(f"{r['server']:<12} {r['mode']:<8} {r['version'] or '-':<8} {r['reused_percent']:>6.0f}% "
+              f"{fmt(r['tls_ms']['p50']):>8} {fmt(r['tls_ms']['p99']):>8} "
+              f"{fmt(r['total_ms']['p50']):>10} {fmt(r['server_cpu_us_per_handshake'], '.0f'):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Mitschnitt des Signalisierungsverkehrs für reproduzierbare Lasttests
+Mit ``--capture FILE`` schreibt ein Server jede eingehende Nachricht in
+einen JSONL-Trace: relative Zeit, Verbindungs-ID, Raum und Originaltext,
+dazu Öffnen (mit Peer-ID) und Schließen jeder Verbindung. ``replay.py``
+spielt einen solchen Trace gegen jede Servervariante ab.
+
+Wie beim Nachrichten-Log schreibt ein Hintergrund-Thread; der Hot Path
+legt nur ein Tupel in eine begrenzte Queue. Endet der Dateiname auf
+``.gz``, wird komprimiert.
+
+Format (eine Zeile pro Ereignis, erste Zeile ist der Header)::
+
+    {"trace": 1, "server": "stdlib", "started": 1760000000.123}
+    {"t": 0.000412, "c": 1, "r": "default", "p": "Ab3dEf9h", "e": "open"}
+    {"t": 0.101377, "c": 1, "r": "default", "m": "{\\"type\\":\\"offer\\",...}"}
+    {"t": 5.250031, "c": 1, "e": "close"}
+"""
+
+import gzip
+import itertools
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+from batch_queue import drain_batches
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+
+
+def open_trace(path: str, mode: str = 'r'):
+    """Trace-Datei als Text öffnen, ``.gz`` komprimiert"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_trace(path: str) -> Tuple[dict, Iterator[dict]]:
+    """Header und Ereignisse eines Traces (Ereignisse werden gestreamt)"""
+    f = open_trace(path)
+    header = json.loads(f.readline() or '{}')
+    if header.get('trace') != TRACE_VERSION:
+        f.close()
+        raise ValueError(f"{path}: not a version {TRACE_VERSION} trace")
+
+    def events():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    return header, events()
+
+
+class TraceWriter:
+    """Schreibt Verbindungs- und Nachrichtenereignisse im Hintergrund
+
+    ``open`` vergibt die Verbindungs-ID, ``message`` und ``close`` nehmen
+    sie entgegen. Keine der Methoden blockiert: Ist die Queue voll, wird
+    das Ereignis verworfen und in ``dropped`` gezählt - ein Trace mit
+    Lücken ist dann in ``replay.py`` erkennbar.
+    """
+
+    def __init__(self, path: str, server: str = '', queue_size: int = 100000,
+                 batch_size: int = 512, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._closed = False
+        self._ids = itertools.count(1)
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._file = open_trace(path, 'w')
+        self._file.write(json.dumps({'trace': TRACE_VERSION, 'server': server,
+                                     'started': time.time()}) + '\n')
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+        self._thread.start()
+
+    def _submit(self, event: tuple):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def open(self, room: str, peer_id: Optional[str] = None) -> int:
+        """Neue Verbindung im Raum ``room``; liefert ihre Verbindungs-ID"""
+        conn_id = next(self._ids)
+        self._submit(('open', time.monotonic() - self._start, conn_id, room, peer_id))
+        return conn_id
+
+    def message(self, conn_id: int, room: str, raw: str):
+        self._submit(('message', time.monotonic() - self._start, conn_id, room, raw))
+
+    def close_connection(self, conn_id: Optional[int]):
+        if conn_id is not None:
+            self._submit(('close', time.monotonic() - self._start, conn_id, None, None))
+
+    @staticmethod
+    def _line(event: tuple) -> str:
+        kind, t, conn_id, room, value = event
+        t = round(t, 6)
+        if kind == 'message':
+            entry = {'t': t, 'c': conn_id, 'r': room, 'm': value}
+        elif kind == 'open':
+            entry = {'t': t, 'c': conn_id, 'r': room, 'p': value, 'e': 'open'}
+        else:
+            entry = {'t': t, 'c': conn_id, 'e': 'close'}
+        return json.dumps(entry, separators=(',', ':')) + '\n'
+
+    def _run(self):
+        drain_batches(self._queue, self.batch_size, self._write_batch, self.flush_interval)
+        self._file.close()
+
+    def _write_batch(self, batch):
+        try:
+            self._file.write(''.join(self._line(event) for event in batch))
+            self._file.flush()
+            self.written += len(batch)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Trace write failed: {e}")
+
+    def stats(self) -> dict:
+        return {'path': self.path, 'written': self.written, 'dropped': self.dropped}
+
+    def close(self, timeout: float = 5.0):
+        """Schreibe ausstehende Ereignisse und beende den Writer-Thread"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def add_capture_arguments(parser):
+    """CLI-Option für den Mitschnitt (für alle Server gleich)"""
+    parser.add_argument('--capture', default=None, metavar='FILE',
+                        help='Record every inbound message to a JSONL trace for replay.py '
+                             '(.gz compresses)')
+
+
+def capture_from_args(args, server: str = '', suffix: str = '') -> Optional[TraceWriter]:
+    """``TraceWriter`` aus den CLI-Optionen oder ``None`` ohne ``--capture``
+
+    ``suffix`` trennt die Traces mehrerer Worker-Prozesse.
+    """
+    if not args.capture:
+        return None
+    if threading.current_thread() is threading.main_thread():
+        # SIGTERM wie Ctrl+C behandeln, sonst fehlen die letzten Ereignisse im Trace
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    path = args.capture
+    if suffix:
+        # trace.jsonl.gz -> trace.w1.jsonl.gz
+        base, gz = (path[:-3], '.gz') if path.endswith('.gz') else (path, '')
+        base, ext = os.path.splitext(base)
+        path = f"{base}{suffix}{ext}{gz}"
+    return TraceWriter(path, server=server)
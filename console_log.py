@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Konsolen-Logging der Signalisierungsserver
+``logging.basicConfig`` schreibt synchron aus der Event-Loop bzw. dem
+Sende-Thread auf stderr - unter Last wird die Konsole Teil der
+Weiterleitungslatenz. Im Modus ``queue`` legt der Aufrufer nur den
+unformatierten Record in eine Queue; Formatieren und Schreiben übernimmt
+ein eigener Thread (``QueueListener``).
+
+Zeilen pro Nachricht laufen über einen eigenen ``*.traffic``-Logger und
+lassen sich sampeln (jede N-te Zeile) oder auf Zeilen/s begrenzen.
+Warnungen - darunter alle Sicherheitswarnungen der Expositionsanalyse -
+werden nie gesampelt und bei voller Queue nicht verworfen.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+from typing import Optional
+
+from admission import TokenBucket
+from metrics import CallbackMetric
+
+LOG_MODES = ('sync', 'queue')
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+TRAFFIC_SUFFIX = '.traffic'
+
+
+def traffic_logger(name: str) -> logging.Logger:
+    """Logger für Zeilen pro Nachricht bzw. Verbindung (sampelbar)"""
+    return logging.getLogger(name + TRAFFIC_SUFFIX)
+
+
+class TrafficSampler(logging.Filter):
+    """Lässt von ``*.traffic``-Zeilen unter WARNING nur einen Teil durch
+
+    ``sample``: jede N-te Zeile (1 = alle). ``rate``: höchstens so viele
+    Zeilen/s (0 = unbegrenzt). Alles andere passiert unverändert.
+    """
+
+    def __init__(self, sample: int = 1, rate: float = 0.0):
+        super().__init__()
+        self.sample = max(1, sample)
+        self.bucket = TokenBucket(rate, max(1.0, rate), time.monotonic()) if rate else None
+        self.seen = 0
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not record.name.endswith(TRAFFIC_SUFFIX):
+            return True
+        self.seen += 1
+        if self.seen % self.sample:
+            self.suppressed += 1
+            return False
+        if self.bucket is not None:
+            if self.bucket.refill(time.monotonic()) < 1:
+                self.suppressed += 1
+                return False
+            self.bucket.tokens -= 1
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler ohne Formatieren im aufrufenden Thread
+
+    ``QueueHandler.prepare`` formatiert die Nachricht sofort; hier wandert
+    der Record unverändert in die Queue. Ist die Queue voll, werden
+    Zeilen unter WARNING verworfen, Warnungen warten auf Platz.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record)
+            else:
+                self.dropped += 1
+
+
+class ConsoleLog:
+    """Konfiguriert den Root-Logger und hält Queue, Writer-Thread und Sampler"""
+
+    def __init__(self, mode: str = 'sync', level: int = logging.INFO, sample: int = 1,
+                 rate: float = 0.0, queue_size: int = 10000):
+        if mode not in LOG_MODES:
+            raise ValueError(f"Unknown log mode: {mode}")
+        self.mode = mode
+        self.sampler = TrafficSampler(sample, rate)
+        self.handler: Optional[LazyQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+        self.stream = logging.StreamHandler()
+        self.stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        root = logging.getLogger()
+        # Die Handler von logging.basicConfig (Import der Servermodule) ersetzen
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.setLevel(level)
+        if mode == 'queue':
+            log_queue = queue.Queue(queue_size)
+            self.handler = LazyQueueHandler(log_queue)
+            self.handler.addFilter(self.sampler)
+            root.addHandler(self.handler)
+            self.listener = logging.handlers.QueueListener(log_queue, self.stream)
+            self.listener.start()
+            atexit.register(self.close)
+        else:
+            self.stream.addFilter(self.sampler)
+            root.addHandler(self.stream)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.handler.queue.qsize() if self.handler is not None else 0
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped if self.handler is not None else 0
+
+    def close(self):
+        """Restliche Zeilen schreiben und den Writer-Thread beenden
+
+        Spätere Zeilen (Shutdown) werden wieder direkt geschrieben.
+        """
+        if self.listener is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        self.listener.stop()
+        self.listener = None
+        self.stream.addFilter(self.sampler)
+        root.addHandler(self.stream)
+
+    def stats(self) -> dict:
+        return {'mode': self.mode, 'suppressed': self.sampler.suppressed,
+                'dropped': self.dropped, 'queue_depth': self.queue_depth}
+
+    def metrics(self) -> list:
+        """Prometheus-Metriken des Konsolen-Logs (für ``SignalingMetrics.add``)"""
+        return [
+            CallbackMetric('signaling_console_log_suppressed_total',
+                           'Traffic log lines skipped by sampling or rate limit',
+                           'counter', lambda: self.sampler.suppressed),
+            CallbackMetric('signaling_console_log_dropped_total',
+                           'Log lines dropped because the log queue was full',
+                           'counter', lambda: self.dropped),
+            CallbackMetric('signaling_console_log_queue_depth', 'Log records waiting for the writer thread',
+                           'gauge', lambda: self.queue_depth),
+        ]
+
+
+def add_console_log_arguments(parser):
+    """CLI-Optionen für das Konsolen-Logging (für alle Server gleich)"""
+    parser.add_argument('--console-log', choices=LOG_MODES, default='sync',
+                        help='sync: write on the calling thread, queue: hand records to a writer thread')
+    parser.add_argument('--console-log-level', default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help='Minimum level written to the console (default: INFO)')
+    parser.add_argument('--traffic-log-sample', type=int, default=1,
+                        help='Write every Nth per-message line (default: 1 = all)')
+    parser.add_argument('--traffic-log-rate', type=float, default=0.0,
+                        help='Max per-message lines/s (0 = unlimited); warnings are never sampled')
+
+
+def console_log_from_args(args) -> ConsoleLog:
+    return ConsoleLog(mode=args.console_log, level=getattr(logging, args.console_log_level),
+                      sample=args.traffic_log_sample, rate=args.traffic_log_rate)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+permessage-deflate (RFC 7692) für den stdlib-Server
+Aushandlung im Handshake und zlib-Kontexte pro Verbindung. SDP-Texte
+wiederholen sich stark und schrumpfen typischerweise auf ein Viertel.
+"""
+
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+EXTENSION = 'permessage-deflate'
+# Ende eines Z_SYNC_FLUSH-Blocks, wird laut RFC 7692 nicht übertragen
+SYNC_TAIL = b'\x00\x00\xff\xff'
+MIN_WINDOW_BITS = 9
+MAX_WINDOW_BITS = 15
+
+
+class DeflateError(ValueError):
+    """Komprimierte Nachricht ist ungültig oder zu groß"""
+
+
+class DeflateConfig:
+    """Serverseitige Einstellungen für permessage-deflate
+
+    ``threshold``: kleinere Nachrichten werden unkomprimiert gesendet.
+    ``server_no_context_takeover``: jede Nachricht wird unabhängig
+    komprimiert - schlechteres Verhältnis, dafür kein zlib-Zustand pro
+    Verbindung und ein Broadcast-Frame kann für alle Empfänger geteilt werden.
+    """
+
+    def __init__(self, threshold: int = 256, level: int = 6,
+                 server_max_window_bits: int = MAX_WINDOW_BITS,
+                 client_max_window_bits: int = MAX_WINDOW_BITS,
+                 server_no_context_takeover: bool = False,
+                 client_no_context_takeover: bool = False,
+                 max_message_size: int = 4 * 1024 * 1024):
+        for bits in (server_max_window_bits, client_max_window_bits):
+            if not MIN_WINDOW_BITS <= bits <= MAX_WINDOW_BITS:
+                raise ValueError(f"Window bits must be between {MIN_WINDOW_BITS} and {MAX_WINDOW_BITS}")
+        self.threshold = threshold
+        self.level = level
+        self.server_max_window_bits = server_max_window_bits
+        self.client_max_window_bits = client_max_window_bits
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self.max_message_size = max_message_size
+
+
+def parse_extensions(header: str) -> List[Tuple[str, Dict[str, Optional[str]]]]:
+    """Zerlege ``Sec-WebSocket-Extensions`` in (Name, Parameter)-Paare"""
+    offers = []
+    for item in header.split(','):
+        parts = [p.strip() for p in item.split(';')]
+        if not parts[0]:
+            continue
+        params: Dict[str, Optional[str]] = {}
+        for param in parts[1:]:
+            if not param:
+                continue
+            name, sep, value = param.partition('=')
+            name = name.strip().lower()
+            if name in params:
+                # Doppelte Parameter machen das Angebot ungültig
+                params = None
+                break
+            params[name] = value.strip().strip('"') if sep else None
+        if params is not None:
+            offers.append((parts[0].lower(), params))
+    return offers
+
+
+def _window_bits(value: Optional[str]) -> Optional[int]:
+    if value is None or not value.isdigit():
+        return None
+    bits = int(value)
+    return bits if 8 <= bits <= MAX_WINDOW_BITS else None
+
+
+def negotiate(header: Optional[str], config: Optional[DeflateConfig]):
+    """Wähle das erste annehmbare permessage-deflate-Angebot
+
+    Gibt ``(Antwort-Header, PerMessageDeflate)`` zurück oder ``None``.
+    """
+    if not header or config is None:
+        return None
+    for name, params in parse_extensions(header):
+        if name != EXTENSION:
+            continue
+        if set(params) - {'server_no_context_takeover', 'client_no_context_takeover',
+                          'server_max_window_bits', 'client_max_window_bits'}:
+            continue
+        response = [EXTENSION]
+
+        server_no_takeover = config.server_no_context_takeover
+        if 'server_no_context_takeover' in params:
+            if params['server_no_context_takeover'] is not None:
+                continue
+            server_no_takeover = True
+        if server_no_takeover:
+            response.append('server_no_context_takeover')
+
+        client_no_takeover = config.client_no_context_takeover
+        if 'client_no_context_takeover' in params:
+            if params['client_no_context_takeover'] is not None:
+                continue
+            client_no_takeover = True
+        if client_no_takeover:
+            response.append('client_no_context_takeover')
+
+        server_bits = config.server_max_window_bits
+        if 'server_max_window_bits' in params:
+            offered = _window_bits(params['server_max_window_bits'])
+            # zlib kann roh nicht mit 8 Bit Fenster komprimieren
+            if offered is None or offered < MIN_WINDOW_BITS:
+                continue
+            server_bits = min(server_bits, offered)
+        if server_bits < MAX_WINDOW_BITS or 'server_max_window_bits' in params:
+            response.append(f'server_max_window_bits={server_bits}')
+
+        client_bits = MAX_WINDOW_BITS
+        if 'client_max_window_bits' in params:
+            value = params['client_max_window_bits']
+            offered = MAX_WINDOW_BITS if value is None else _window_bits(value)
+            if offered is None:
+                continue
+            client_bits = max(8, min(config.client_max_window_bits, offered))
+            if client_bits < MAX_WINDOW_BITS:
+                response.append(f'client_max_window_bits={client_bits}')
+
+        deflate = PerMessageDeflate(config, server_bits, client_bits,
+                                    server_no_takeover, client_no_takeover)
+        return '; '.join(response), deflate
+    return None
+
+
+class PerMessageDeflate:
+    """zlib-Kontexte einer Verbindung"""
+
+    def __init__(self, config: DeflateConfig, server_bits: int, client_bits: int,
+                 server_no_context_takeover: bool, client_no_context_takeover: bool):
+        self.threshold = config.threshold
+        self.level = config.level
+        self.max_message_size = config.max_message_size
+        self.server_bits = server_bits
+        # Zum Dekomprimieren reicht ein Fenster >= dem des Clients (mind. 9 für zlib)
+        self.client_bits = max(MIN_WINDOW_BITS, client_bits)
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self._compressor = None
+        self._decompressor = None
+        # Ohne Context Takeover ist das Ergebnis für alle Empfänger mit
+        # gleichen Parametern identisch und kann geteilt werden
+        self.shared_key = (server_bits, self.level) if server_no_context_takeover else None
+
+    def _new_compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, -self.server_bits)
+
+    def compress(self, payload: bytes) -> bytes:
+        if self.server_no_context_takeover or self._compressor is None:
+            self._compressor = self._new_compressor()
+        data = self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data.endswith(SYNC_TAIL):
+            data = data[:-4]
+        return data
+
+    def decompress(self, payload: bytes) -> bytes:
+        if self.client_no_context_takeover or self._decompressor is None:
+            self._decompressor = zlib.decompressobj(-self.client_bits)
+        try:
+            data = self._decompressor.decompress(payload + SYNC_TAIL, self.max_message_size)
+        except zlib.error as e:
+            raise DeflateError(str(e)) from None
+        if self._decompressor.unconsumed_tail:
+            raise DeflateError("Decompressed message too large")
+        return data
+
+
+def add_deflate_arguments(parser):
+    """CLI-Optionen für permessage-deflate"""
+    parser.add_argument('--deflate', action='store_true',
+                        help='Negotiate permessage-deflate (RFC 7692)')
+    parser.add_argument('--deflate-threshold', type=int, default=256,
+                        help='Send messages smaller than N bytes uncompressed (default: 256)')
+    parser.add_argument('--deflate-level', type=int, default=6, help='zlib level (default: 6)')
+    parser.add_argument('--deflate-window-bits', type=int, default=MAX_WINDOW_BITS,
+                        help='Max LZ77 window bits for both directions (9-15, default: 15)')
+    parser.add_argument('--deflate-no-context-takeover', action='store_true',
+                        help='Compress every message independently (less memory, '
+                             'shared broadcast frames, worse ratio)')
+
+
+def deflate_config_from_args(args) -> Optional[DeflateConfig]:
+    if not args.deflate:
+        return None
+    return DeflateConfig(threshold=args.deflate_threshold, level=args.deflate_level,
+                         server_max_window_bits=args.deflate_window_bits,
+                         client_max_window_bits=args.deflate_window_bits,
+                         server_no_context_takeover=args.deflate_no_context_takeover)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Schnelles Lesen des Nachrichten-Umschlags (Envelope)
+Liest nur die Routing-Felder ``type``, ``to`` und ``room`` einer
+Signalisierungsnachricht, ohne die (oft mehrere KB große) SDP zu dekodieren.
+Die Nachricht selbst wird unverändert weitergeleitet; der vollständige
+Inhalt wird erst bei Zugriff auf ``Envelope.data`` dekodiert.
+
+``loads``/``dumps`` nutzen ``orjson``, falls installiert, sonst die
+Standardbibliothek.
+"""
+
+import json
+import re
+from typing import Optional
+
+try:
+    import orjson
+
+    def loads(raw):
+        return orjson.loads(raw)
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    loads = json.loads
+    dumps = json.dumps
+    JSON_BACKEND = 'json'
+
+ROUTING_KEYS = frozenset(('type', 'to', 'room'))
+
+# Kleine Nachrichten (ICE-Kandidaten) dekodiert der C-Parser schneller,
+# als sie sich in Python scannen lassen
+FULL_PARSE_BELOW = 512
+
+_WS = re.compile(r'[ \t\n\r]*')
+_WS_CHARS = frozenset(' \t\n\r')
+_SCALAR = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+
+
+class EnvelopeError(ValueError):
+    """Nachricht ist kein gültiges JSON-Objekt"""
+
+
+class Envelope:
+    """Routing-Felder einer Nachricht plus lazily dekodierter Inhalt"""
+
+    __slots__ = ('type', 'to', 'room', 'raw', '_data')
+
+    def __init__(self, raw: str, type: Optional[str] = None, to: Optional[str] = None,
+                 room: Optional[str] = None, data: Optional[dict] = None):
+        self.raw = raw
+        self.type = type
+        self.to = to
+        self.room = room
+        self._data = data
+
+    @property
+    def data(self) -> dict:
+        """Vollständig dekodierte Nachricht (erst bei Bedarf)"""
+        if self._data is None:
+            self._data = loads(self.raw)
+        return self._data
+
+    def __repr__(self):
+        return f"Envelope(type={self.type!r}, to={self.to!r}, room={self.room!r})"
+
+
+def _routing_value(value) -> Optional[str]:
+    # Objekte und Arrays überspringt der Scanner - beide Wege liefern None
+    if isinstance(value, (dict, list)):
+        return None
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _skip_ws(raw: str, pos: int) -> int:
+    # JSON.stringify erzeugt keinen Whitespace - Regex nur wenn nötig
+    if raw[pos:pos + 1] in _WS_CHARS:
+        return _WS.match(raw, pos).end()
+    return pos
+
+
+def _decode(token: str):
+    try:
+        return json.loads(token)
+    except ValueError as e:
+        raise EnvelopeError(str(e)) from None
+
+
+def _skip_string(raw: str, pos: int) -> int:
+    """Position hinter dem String, der bei ``pos`` (Anführungszeichen) beginnt"""
+    end = raw.find('"', pos + 1)
+    while end != -1:
+        backslashes = 0
+        index = end - 1
+        while raw[index] == '\\':
+            backslashes += 1
+            index -= 1
+        if backslashes % 2 == 0:
+            return end + 1
+        end = raw.find('"', end + 1)
+    raise EnvelopeError("Unterminated string")
+
+
+def _skip_nested(raw: str, pos: int) -> int:
+    """Position hinter dem Objekt/Array, das bei ``pos`` beginnt"""
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(raw, pos)
+        if match is None:
+            raise EnvelopeError("Unterminated object or array")
+        char = match.group()
+        if char == '"':
+            pos = _skip_string(raw, match.start())
+            continue
+        pos = match.end()
+        if char in '{[':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def read_envelope(raw: str) -> Envelope:
+    """Lies die Routing-Felder der obersten Ebene
+
+    Die Struktur der obersten Ebene wird geprüft; Stringinhalte und
+    verschachtelte Werte werden nur übersprungen, nicht validiert.
+    """
+    if len(raw) < FULL_PARSE_BELOW:
+        try:
+            data = loads(raw)
+        except ValueError as e:
+            raise EnvelopeError(str(e)) from None
+        if not isinstance(data, dict):
+            raise EnvelopeError("Expected JSON object")
+        return Envelope(raw, _routing_value(data.get('type')), _routing_value(data.get('to')),
+                        _routing_value(data.get('room')), data)
+
+    fields = {}
+    pos = _skip_ws(raw, 0)
+    if raw[pos:pos + 1] != '{':
+        raise EnvelopeError("Expected JSON object")
+    pos = _skip_ws(raw, pos + 1)
+    if raw[pos:pos + 1] == '}':
+        pos += 1
+    else:
+        while True:
+            if raw[pos:pos + 1] != '"':
+                raise EnvelopeError(f"Expected key at {pos}")
+            end = _skip_string(raw, pos)
+            key = raw[pos + 1:end - 1]
+            pos = _skip_ws(raw, end)
+            if raw[pos:pos + 1] != ':':
+                raise EnvelopeError(f"Expected ':' at {pos}")
+            pos = _skip_ws(raw, pos + 1)
+
+            char = raw[pos:pos + 1]
+            if char == '"':
+                end = _skip_string(raw, pos)
+                if key in ROUTING_KEYS:
+                    value = raw[pos + 1:end - 1]
+                    fields[key] = value if '\\' not in value else _decode(raw[pos:end])
+            elif char == '{' or char == '[':
+                end = _skip_nested(raw, pos)
+                if key in ROUTING_KEYS:
+                    fields[key] = None
+            else:
+                match = _SCALAR.match(raw, pos)
+                if not match:
+                    raise EnvelopeError(f"Invalid value at {pos}")
+                end = match.end()
+                if key in ROUTING_KEYS:
+                    fields[key] = _routing_value(_decode(raw[pos:end]))
+
+            pos = _skip_ws(raw, end)
+            char = raw[pos:pos + 1]
+            if char == ',':
+                pos = _skip_ws(raw, pos + 1)
+                continue
+            if char == '}':
+                pos += 1
+                break
+            raise EnvelopeError(f"Expected ',' or '}}' at {pos}")
+
+    if _skip_ws(raw, pos) != len(raw):
+        raise EnvelopeError("Trailing data after JSON object")
+    return Envelope(raw, fields.get('type'), fields.get('to'), fields.get('room'))
+
+
+def with_sender(raw: str, peer_id: str) -> str:
+    """Hänge ``"from": peer_id`` als letztes Feld an die Nachricht an
+
+    Bei doppelten Schlüsseln gewinnt in ``JSON.parse`` und ``json.loads``
+    das letzte Vorkommen - ein vom Client mitgesendetes ``from`` wird also
+    überschrieben. Die SDP wird dabei nicht erneut kodiert.
+    """
+    body = raw.rstrip()
+    if not body.endswith('}'):
+        raise EnvelopeError("Expected JSON object")
+    body = body[:-1].rstrip()
+    separator = '' if body.endswith('{') else ','
+    return f'{body}{separator}"from":{dumps(peer_id)}}}'
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Keepalive und Idle-Reaper für die Signalisierungsserver
+Halboffene TCP-Verbindungen (Peer ohne FIN verschwunden) belegen sonst für
+immer einen Thread bzw. einen Eintrag in ``clients``. Der Reaper sendet
+Pings, prüft Pong-Fristen und trennt tote oder untätige Verbindungen.
+
+Alle Fristen liegen in einem Hashed Timer Wheel statt in einem Timer pro
+Verbindung: Ein Tick besucht genau einen Slot, Lesen kostet nur eine
+Zuweisung des Zeitstempels. Abgelaufene Einträge werden erst beim Feuern
+mit dem letzten Zeitstempel verglichen und gegebenenfalls neu eingeplant.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from metrics import CallbackMetric, Counter
+
+logger = logging.getLogger(__name__)
+
+REAP_REASONS = ('handshake', 'timeout', 'idle')
+
+
+class TimerWheel:
+    """Hashed Timer Wheel mit ``slots`` Slots zu je ``tick`` Sekunden
+
+    Fristen jenseits einer Umdrehung bleiben im Slot liegen, bis ihr Tick
+    erreicht ist. ``schedule`` und ``cancel`` sind O(1).
+    """
+
+    def __init__(self, tick: float = 0.5, slots: int = 512, now: Optional[float] = None):
+        if tick <= 0 or slots <= 0:
+            raise ValueError("tick and slots must be positive")
+        self.tick = tick
+        self.origin = time.monotonic() if now is None else now
+        self.current = 0
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        self.where: Dict[Hashable, int] = {}
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key: Hashable, delay: float, now: float):
+        """Plane ``key`` in ``delay`` Sekunden ein (ersetzt eine alte Frist)"""
+        self.cancel(key)
+        due = max(self.current + 1, math.ceil((now + delay - self.origin) / self.tick))
+        self.slots[due % len(self.slots)][key] = due
+        self.where[key] = due
+
+    def cancel(self, key: Hashable):
+        due = self.where.pop(key, None)
+        if due is not None:
+            del self.slots[due % len(self.slots)][key]
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Rücke bis ``now`` vor und gib alle fälligen Schlüssel zurück"""
+        target = int((now - self.origin) / self.tick)
+        if target <= self.current:
+            return []
+        expired = []
+        # Nach einer langen Pause genügt eine Umdrehung
+        steps = min(target - self.current, len(self.slots))
+        for step in range(1, steps + 1):
+            bucket = self.slots[(self.current + step) % len(self.slots)]
+            if not bucket:
+                continue
+            due_keys = [key for key, due in bucket.items() if due <= target]
+            for key in due_keys:
+                del bucket[key]
+                del self.where[key]
+            expired.extend(due_keys)
+        self.current = target
+        return expired
+
+
+class KeepalivePolicy:
+    """Gemeinsame Keepalive- und Idle-Einstellungen aller Server
+
+    ``ping_interval``: Ping nach so vielen Sekunden ohne Daten vom Peer.
+    ``ping_timeout``: Frist für das Pong (bzw. beliebige Daten) danach.
+    ``idle_timeout``: Trennen nach so vielen Sekunden ohne Anwendungsnachricht.
+    ``handshake_timeout``: Frist für den WebSocket-Handshake (stdlib-Server).
+    0 schaltet den jeweiligen Mechanismus ab.
+    """
+
+    def __init__(self, ping_interval: float = 20.0, ping_timeout: float = 20.0,
+                 idle_timeout: float = 0.0, handshake_timeout: float = 10.0,
+                 tick: Optional[float] = None):
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.handshake_timeout = handshake_timeout
+        if tick is None:
+            # Auflösung: ein Viertel der kürzesten Frist, höchstens 0,5 s
+            deadlines = [d for d in (ping_interval, ping_timeout, idle_timeout, handshake_timeout) if d]
+            tick = max(0.05, min([0.5] + [d / 4 for d in deadlines]))
+        self.tick = tick
+
+    def websockets_options(self) -> dict:
+        """Keepalive der websockets-Bibliothek (Argumente für ``serve``)"""
+        return {'ping_interval': self.ping_interval or None,
+                'ping_timeout': self.ping_timeout or None}
+
+    def aiohttp_options(self) -> dict:
+        """Heartbeat von aiohttp (Pong-Frist ist dort fest das halbe Intervall)"""
+        return {'heartbeat': self.ping_interval or None}
+
+
+class Liveness:
+    """Zeitstempel einer überwachten Verbindung"""
+
+    __slots__ = ('conn', 'last_seen', 'last_message', 'ping_sent', 'established', 'open')
+
+    def __init__(self, conn: Any, now: float, established: bool):
+        self.conn = conn
+        # Letzte Daten überhaupt (inkl. Pong) bzw. letzte Anwendungsnachricht
+        self.last_seen = now
+        self.last_message = now
+        self.ping_sent = 0.0
+        self.established = established
+        self.open = True
+
+
+class Reaper:
+    """Überwacht Verbindungen über ein ``TimerWheel``
+
+    ``ping(conn)`` sendet einen Ping; ohne Callback übernimmt die
+    WebSocket-Bibliothek die Pings und der Reaper prüft nur die Idle-Frist.
+    ``close(conn, reason)`` trennt eine Verbindung. Beide Callbacks laufen
+    außerhalb des internen Locks.
+    """
+
+    def __init__(self, policy: KeepalivePolicy, close: Callable[[Any, str], None],
+                 ping: Optional[Callable[[Any], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.policy = policy
+        self.close = close
+        self.ping = ping if policy.ping_interval else None
+        self.clock = clock
+        self.wheel = TimerWheel(policy.tick, now=clock())
+        self.lock = threading.Lock()
+        self.pings = 0
+        self.pongs = 0
+        self.reaped = Counter('signaling_reaped_connections_total',
+                              'Connections closed by the keepalive reaper', 'reason')
+
+    def __len__(self):
+        return len(self.wheel)
+
+    def track(self, conn: Any, established: bool = True) -> Liveness:
+        """Beginne die Überwachung; der Aufrufer aktualisiert die Zeitstempel"""
+        now = self.clock()
+        entry = Liveness(conn, now, established)
+        with self.lock:
+            if not established:
+                if self.policy.handshake_timeout:
+                    self.wheel.schedule(entry, self.policy.handshake_timeout, now)
+            else:
+                self._reschedule(entry, now)
+        return entry
+
+    def established(self, entry: Liveness):
+        """Handshake abgeschlossen - ab jetzt Keepalive statt Handshake-Frist"""
+        now = self.clock()
+        with self.lock:
+            entry.established = True
+            entry.last_seen = entry.last_message = now
+            if entry.open:
+                self._reschedule(entry, now)
+
+    def forget(self, entry: Optional[Liveness]):
+        if entry is None:
+            return
+        with self.lock:
+            entry.open = False
+            self.wheel.cancel(entry)
+
+    def _reschedule(self, entry: Liveness, now: float):
+        policy = self.policy
+        delay = math.inf
+        if self.ping is not None:
+            delay = policy.ping_interval - (now - entry.last_seen)
+        if policy.idle_timeout:
+            delay = min(delay, policy.idle_timeout - (now - entry.last_message))
+        if delay != math.inf:
+            self.wheel.schedule(entry, max(delay, 0.0), now)
+
+    def _check(self, entry: Liveness, now: float) -> Optional[str]:
+        """Entscheide über einen fälligen Eintrag: ``'ping'``, Grund oder None"""
+        policy = self.policy
+        if not entry.established:
+            return 'handshake'
+        if policy.idle_timeout and now - entry.last_message >= policy.idle_timeout:
+            return 'idle'
+        if entry.ping_sent:
+            if entry.last_seen < entry.ping_sent:
+                return 'timeout'
+            entry.ping_sent = 0.0
+        if self.ping is not None and now - entry.last_seen >= policy.ping_interval:
+            entry.ping_sent = now
+            self.wheel.schedule(entry, policy.ping_timeout or policy.ping_interval, now)
+            return 'ping'
+        self._reschedule(entry, now)
+        return None
+
+    def tick(self, now: Optional[float] = None):
+        """Fällige Fristen abarbeiten (aus der Event-Loop oder einem Thread)"""
+        if now is None:
+            now = self.clock()
+        actions = []
+        with self.lock:
+            for entry in self.wheel.advance(now):
+                if entry.open:
+                    action = self._check(entry, now)
+                    if action is not None:
+                        actions.append((action, entry))
+                        if action != 'ping':
+                            entry.open = False
+        for action, entry in actions:
+            if action == 'ping':
+                self.pings += 1
+                self.ping(entry.conn)
+            else:
+                self.reaped.inc(action)
+                self.close(entry.conn, action)
+
+    def safe_tick(self):
+        # Ein fehlerhafter Callback darf die Tick-Schleife nicht beenden
+        try:
+            self.tick()
+        except Exception:
+            logger.exception("Keepalive tick failed")
+
+    async def run(self):
+        """Tick-Schleife für asyncio-Server"""
+        while True:
+            await asyncio.sleep(self.policy.tick)
+            self.safe_tick()
+
+    def run_thread(self, running: Callable[[], bool]):
+        """Tick-Schleife als Thread (``--engine threads``)"""
+        def loop():
+            while running():
+                time.sleep(self.policy.tick)
+                self.safe_tick()
+        thread = threading.Thread(target=loop, name='reaper', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        return {
+            'tracked': len(self.wheel),
+            'pings': self.pings,
+            'pongs': self.pongs,
+            'reaped': {reason: int(self.reaped.get(reason)) for reason in REAP_REASONS},
+        }
+
+    def metrics(self) -> list:
+        """Prometheus-Metriken des Reapers (für ``SignalingMetrics.add``)"""
+        return [
+            CallbackMetric('signaling_keepalive_tracked', 'Connections with a pending keepalive deadline',
+                           'gauge', lambda: len(self.wheel)),
+            CallbackMetric('signaling_keepalive_pings_total', 'Keepalive pings sent by the reaper',
+                           'counter', lambda: self.pings),
+            CallbackMetric('signaling_keepalive_pongs_total', 'Keepalive pongs received',
+                           'counter', lambda: self.pongs),
+            self.reaped,
+        ]
+
+
+def add_keepalive_arguments(parser):
+    """CLI-Optionen für Keepalive und Idle-Timeout (für alle Server gleich)"""
+    parser.add_argument('--ping-interval', type=float, default=20.0,
+                        help='Ping after N seconds without data from the peer (0 = off, default: 20)')
+    parser.add_argument('--ping-timeout', type=float, default=20.0,
+                        help='Seconds to wait for the pong before reaping (default: 20)')
+    parser.add_argument('--idle-timeout', type=float, default=0.0,
+                        help='Close connections without application messages for N seconds (0 = off)')
+    parser.add_argument('--handshake-timeout', type=float, default=10.0,
+                        help='Seconds to complete the WebSocket handshake (stdlib server, default: 10)')
+
+
+def keepalive_from_args(args) -> KeepalivePolicy:
+    return KeepalivePolicy(ping_interval=args.ping_interval, ping_timeout=args.ping_timeout,
+                           idle_timeout=args.idle_timeout, handshake_timeout=args.handshake_timeout)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Indiziertes Nachrichten-Log auf der Platte
+Die Segmente des ``JsonlSegmentWriter`` (``message_log.py``) bleiben
+normale JSONL-Dateien. Neben jedem Segment liegt ein kompakter Index
+(``.idx``) mit einem Datensatz fester Größe pro Eintrag: Zeitstempel,
+Position im Segment, Raum-Hash, Nachrichtentyp und ICE-Kandidatentypen.
+
+Abfragen lesen Index und Segmente per ``mmap``: Zeitbereiche werden per
+Binärsuche gefunden, Raum/Typ/Kandidatentyp am Index gefiltert, und nur
+passende Einträge werden aus dem Segment gelesen und dekodiert.
+
+    python logstore.py query --dir logs/ --room meeting-42 --candidate srflx --since 1h
+    python logstore.py export --dir logs/ --type offer -o offers.jsonl
+    python logstore.py stats --dir logs/
+"""
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from peers import DEFAULT_ROOM
+
+DATA_SUFFIX = '.jsonl'
+INDEX_SUFFIX = '.idx'
+
+# Zeitstempel, Offset, Länge, Raum-Hash, Typ-Code, Kandidaten-Bits
+INDEX_RECORD = struct.Struct('<dQIIBB2x')
+
+# Typ 0 = unbekannt/sonstige (wird beim Lesen am Eintrag geprüft)
+TYPE_CODES = {'offer': 1, 'answer': 2, 'ice-candidate': 3, 'ice-candidates': 4, 'join': 5}
+CANDIDATE_BITS = {'host': 1, 'srflx': 2, 'prflx': 4, 'relay': 8}
+
+_CANDIDATE_TYPE = re.compile(r'\btyp (host|srflx|prflx|relay)\b')
+_SEGMENT = re.compile(r'^(?P<prefix>.+)-(?P<index>\d+)' + re.escape(DATA_SUFFIX) + '$')
+
+
+def room_hash(room: str) -> int:
+    return zlib.crc32(room.encode('utf-8'))
+
+
+def entry_timestamp(entry: dict) -> float:
+    value = entry.get('timestamp')
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def index_record(entry: dict, offset: int, length: int, timestamp: float) -> bytes:
+    """Index-Datensatz für einen Eintrag an ``offset`` im Segment"""
+    raw = entry.get('raw') or ''
+    bits = 0
+    if 'typ ' in raw:
+        for kind in _CANDIDATE_TYPE.findall(raw):
+            bits |= CANDIDATE_BITS[kind]
+    return INDEX_RECORD.pack(timestamp, offset, length,
+                             room_hash(entry.get('room', DEFAULT_ROOM)),
+                             TYPE_CODES.get(entry.get('type'), 0), bits)
+
+
+class IndexWriter:
+    """Hängt Index-Datensätze an und hält die Zeitstempel monoton
+
+    Springt die Uhr zurück, wird der letzte Zeitstempel übernommen - die
+    Binärsuche der Leser bleibt damit korrekt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'ab')
+        self.last = 0.0
+        size = self._file.tell()
+        if size >= INDEX_RECORD.size:
+            with open(path, 'rb') as f:
+                f.seek(size - size % INDEX_RECORD.size - INDEX_RECORD.size)
+                self.last = INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[0]
+
+    def records(self, entries, lines, offset: int) -> bytes:
+        """Index-Datensätze für einen Batch ab Segment-Offset ``offset``"""
+        chunk = bytearray()
+        for entry, line in zip(entries, lines):
+            self.last = max(self.last, entry_timestamp(entry))
+            chunk += index_record(entry, offset, len(line), self.last)
+            offset += len(line)
+        return bytes(chunk)
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def index_path(data_path: str) -> str:
+    return data_path[:-len(DATA_SUFFIX)] + INDEX_SUFFIX
+
+
+def _map(path: str) -> Optional[mmap.mmap]:
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+
+class Segment:
+    """Ein Segment mit Index, beide per ``mmap`` gelesen"""
+
+    def __init__(self, data_path: str):
+        self.data_path = data_path
+        # Der Writer schreibt erst die Zeilen, dann den Index - den Index
+        # zuerst abbilden, damit jede Zeile darin schon im Segment steht
+        self.index = _map(index_path(data_path))
+        self.data = _map(data_path)
+        # Nur vollständige Datensätze (der Writer kann gerade anhängen)
+        self.count = len(self.index) // INDEX_RECORD.size if self.index is not None else 0
+        size = len(self.data) if self.data is not None else 0
+        # Datensätze, deren Zeile (noch) nicht abgebildet ist, ausblenden
+        while self.count:
+            _, offset, length = self.record(self.count - 1)[:3]
+            if offset + length <= size:
+                break
+            self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i: int) -> Tuple[float, int, int, int, int, int]:
+        return INDEX_RECORD.unpack_from(self.index, i * INDEX_RECORD.size)
+
+    def timestamp(self, i: int) -> float:
+        return struct.unpack_from('<d', self.index, i * INDEX_RECORD.size)[0]
+
+    def first_at_or_after(self, since: float) -> int:
+        """Binärsuche über die (monotonen) Zeitstempel"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self.data[offset:offset + length]
+
+    def close(self):
+        for mapped in (self.data, self.index):
+            if mapped is not None:
+                mapped.close()
+
+
+class Query:
+    """Filter einer Abfrage; ``None`` heißt beliebig"""
+
+    def __init__(self, since: Optional[float] = None, until: Optional[float] = None,
+                 room: Optional[str] = None, msg_type: Optional[str] = None,
+                 candidate: Optional[str] = None):
+        if candidate is not None and candidate not in CANDIDATE_BITS:
+            raise ValueError(f"Unknown candidate type: {candidate}")
+        self.since = since
+        self.until = until
+        self.room = room
+        self.msg_type = msg_type
+        self.candidate = candidate
+        self._room_hash = room_hash(room) if room is not None else None
+        self._type_code = TYPE_CODES.get(msg_type, 0) if msg_type is not None else None
+        self._bits = CANDIDATE_BITS[candidate] if candidate is not None else 0
+
+    def match_index(self, room: int, type_code: int, bits: int) -> bool:
+        if self._room_hash is not None and room != self._room_hash:
+            return False
+        if self._type_code is not None and type_code != self._type_code:
+            return False
+        return not self._bits or bits & self._bits
+
+    def match_entry(self, entry: dict) -> bool:
+        """Nachprüfung am Eintrag (Hash-Kollisionen, Typ-Code 0)"""
+        if self.room is not None and entry.get('room', DEFAULT_ROOM) != self.room:
+            return False
+        return self.msg_type is None or entry.get('type') == self.msg_type
+
+
+class LogStore:
+    """Alle indizierten Segmente eines Verzeichnisses (optional ein Präfix)"""
+
+    def __init__(self, directory: str, prefix: Optional[str] = None):
+        self.directory = directory
+        # Segmente pro Präfix (ein Präfix pro Worker) in Schreibreihenfolge
+        self.chains: Dict[str, List[Segment]] = {}
+        for name in sorted(os.listdir(directory)):
+            match = _SEGMENT.match(name)
+            if not match or (prefix is not None and match.group('prefix') != prefix):
+                continue
+            segment = Segment(os.path.join(directory, name))
+            if len(segment):
+                self.chains.setdefault(match.group('prefix'), []).append(segment)
+            else:
+                segment.close()
+
+    @property
+    def segments(self) -> List[Segment]:
+        return [segment for chain in self.chains.values() for segment in chain]
+
+    def _scan(self, chain: List[Segment], query: Query) -> Iterator[Tuple[float, bytes]]:
+        for segment in chain:
+            if query.until is not None and segment.timestamp(0) > query.until:
+                return
+            if query.since is not None and segment.timestamp(len(segment) - 1) < query.since:
+                continue
+            start = segment.first_at_or_after(query.since) if query.since is not None else 0
+            for i in range(start, len(segment)):
+                timestamp, offset, length, room, type_code, bits = segment.record(i)
+                if query.until is not None and timestamp > query.until:
+                    return
+                if not query.match_index(room, type_code, bits):
+                    continue
+                line = segment.read(offset, length)
+                if query.room is not None or type_code == 0:
+                    try:
+                        if not query.match_entry(json.loads(line)):
+                            continue
+                    except ValueError:
+                        continue
+                yield timestamp, line
+
+    def query(self, query: Query, limit: Optional[int] = None) -> Iterator[bytes]:
+        """Passende JSONL-Zeilen, über alle Präfixe nach Zeit gemischt"""
+        scans = [self._scan(chain, query) for chain in self.chains.values()]
+        for count, (_, line) in enumerate(heapq.merge(*scans, key=lambda item: item[0])):
+            if limit is not None and count >= limit:
+                return
+            yield line
+
+    def stats(self) -> dict:
+        segments = self.segments
+        records = sum(len(s) for s in segments)
+        first = min((s.timestamp(0) for s in segments), default=None)
+        last = max((s.timestamp(len(s) - 1) for s in segments), default=None)
+        return {
+            'segments': len(segments),
+            'records': records,
+            'index_bytes': records * INDEX_RECORD.size,
+            'data_bytes': sum(len(s.data) for s in segments if s.data is not None),
+            'first': datetime.fromtimestamp(first).isoformat() if first else None,
+            'last': datetime.fromtimestamp(last).isoformat() if last else None,
+        }
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+def reindex(data_path: str) -> int:
+    """Baue den Index eines Segments (z. B. aus älteren Versionen) neu auf"""
+    path = index_path(data_path)
+    if os.path.exists(path):
+        os.remove(path)
+    writer = IndexWriter(path)
+    count = 0
+    offset = 0
+    with open(data_path, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                offset += len(line)
+                continue
+            writer.write(writer.records([entry], [line], offset))
+            offset += len(line)
+            count += 1
+    writer.close()
+    return count
+
+
+_DURATION = re.compile(r'^(\d+(?:\.\d+)?)([smhd])$')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_time(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """``1h``/``30m`` (relativ zu jetzt), Unix-Zeit oder ISO-8601"""
+    if value is None:
+        return None
+    now = time.time() if now is None else now
+    match = _DURATION.match(value)
+    if match:
+        return now - float(match.group(1)) * _UNITS[match.group(2)]
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _add_filter_arguments(parser):
+    parser.add_argument('--dir', required=True, help='Log directory (--log-dir of the server)')
+    parser.add_argument('--prefix', default=None, help='Only segments with this prefix')
+    parser.add_argument('--since', default=None, help='Start: 1h, 30m, unix time or ISO-8601')
+    parser.add_argument('--until', default=None, help='End: same formats as --since')
+    parser.add_argument('--room', default=None, help='Room id')
+    parser.add_argument('--type', dest='msg_type', default=None, help='Message type (offer, ice-candidate, ...)')
+    parser.add_argument('--candidate', choices=sorted(CANDIDATE_BITS), default=None,
+                        help='Only messages containing ICE candidates of this type')
+    parser.add_argument('--limit', type=int, default=None, help='Max entries')
+
+
+def _query_from_args(args) -> Query:
+    now = time.time()
+    return Query(since=parse_time(args.since, now), until=parse_time(args.until, now),
+                 room=args.room, msg_type=args.msg_type, candidate=args.candidate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the indexed signaling message log')
+    commands = parser.add_subparsers(dest='command', required=True)
+    query = commands.add_parser('query', help='Print matching entries')
+    _add_filter_arguments(query)
+    query.add_argument('--count', action='store_true', help='Only print the number of matches')
+    export = commands.add_parser('export', help='Write matching entries as JSONL')
+    _add_filter_arguments(export)
+    export.add_argument('-o', '--output', default='-', help='Output file (default: stdout)')
+    stats = commands.add_parser('stats', help='Segment and index statistics')
+    stats.add_argument('--dir', required=True)
+    stats.add_argument('--prefix', default=None)
+    rebuild = commands.add_parser('reindex', help='Rebuild the index of every segment')
+    rebuild.add_argument('--dir', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'reindex':
+        for name in sorted(os.listdir(args.dir)):
+            if _SEGMENT.match(name):
+                print(f"{name}: {reindex(os.path.join(args.dir, name))} entries")
+        return
+
+    store = LogStore(args.dir, args.prefix)
+    try:
+        if args.command == 'stats':
+            print(json.dumps(store.stats(), indent=2))
+        elif args.command == 'query':
+            lines = store.query(_query_from_args(args), args.limit)
+            if args.count:
+                print(sum(1 for _ in lines))
+            else:
+                for line in lines:
+                    entry = json.loads(line)
+                    print(f"{entry.get('timestamp')} {entry.get('room', DEFAULT_ROOM)} "
+                          f"{entry.get('type')} {entry.get('raw', '')[:200]}")
+        else:
+            out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+            try:
+                count = 0
+                for line in store.query(_query_from_args(args), args.limit):
+                    out.write(line)
+                    count += 1
+            finally:
+                if out is not sys.stdout.buffer:
+                    out.close()
+            print(f"Exported {count} entries", file=sys.stderr)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Begrenztes Nachrichten-Log für die Signalisierungsserver
+Ringpuffer im Speicher plus optionaler Hintergrund-Writer für JSONL-Segmente
+mit Index (Abfragen über ``logstore.py``)
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Iterator, Optional
+
+from batch_queue import drain_batches
+from logstore import INDEX_SUFFIX, IndexWriter
+
+logger = logging.getLogger(__name__)
+
+
+class LogEntry:
+    """Ein Eintrag des Nachrichten-Logs ohne eigenes Dict
+
+    Der Ringpuffer hält bis zu ``--log-size`` Einträge; mit ``__slots__``
+    und ``time.time()`` statt ISO-String braucht ein Eintrag rund ein
+    Drittel des Speichers. ``as_dict`` liefert das bisherige JSONL-Format.
+    """
+
+    __slots__ = ('timestamp', 'type', 'room', 'raw')
+
+    def __init__(self, msg_type: str, room: str, raw: str, timestamp: Optional[float] = None):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.type = msg_type
+        self.room = room
+        self.raw = raw
+
+    def as_dict(self) -> dict:
+        return {
+            'timestamp': datetime.fromtimestamp(self.timestamp).isoformat(),
+            'type': self.type,
+            'room': self.room,
+            'raw': self.raw,
+        }
+
+
+class JsonlSegmentWriter:
+    """Schreibt Log-Einträge im Hintergrund in rotierende JSONL-Dateien
+
+    ``submit`` blockiert nie: Einträge landen in einer begrenzten Queue,
+    ein Writer-Thread schreibt sie gebündelt. Ist die Queue voll, wird der
+    Eintrag verworfen und in ``dropped`` gezählt. Zu jedem Segment schreibt
+    er im selben Batch einen Index (``.idx``) für ``logstore.py``.
+    """
+
+    def __init__(self, directory: str, prefix: str = 'signaling',
+                 segment_bytes: int = 16 * 1024 * 1024, max_segments: int = 10,
+                 batch_size: int = 256, flush_interval: float = 0.5,
+                 queue_size: int = 10000):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._closed = False
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._pattern = re.compile(rf'^{re.escape(prefix)}-(\d+)\.jsonl$')
+        os.makedirs(directory, exist_ok=True)
+        self._index = max(self._segment_indices(), default=0)
+        self._file = None
+        self._index_writer = None
+        self._size = 0
+        self._open_segment(self._index + 1)
+        self._thread = threading.Thread(target=self._run, name='message-log-writer', daemon=True)
+        self._thread.start()
+
+    def _segment_indices(self):
+        for name in os.listdir(self.directory):
+            match = self._pattern.match(name)
+            if match:
+                yield int(match.group(1))
+
+    def _segment_path(self, index: int, suffix: str = '.jsonl') -> str:
+        return os.path.join(self.directory, f"{self.prefix}-{index:06d}{suffix}")
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._index_writer.close()
+
+    def _open_segment(self, index: int):
+        self._close_segment()
+        self._index = index
+        self._file = open(self._segment_path(index), 'ab')
+        self._index_writer = IndexWriter(self._segment_path(index, INDEX_SUFFIX))
+        self._size = self._file.tell()
+        # Älteste Segmente über dem Limit löschen
+        for old in sorted(self._segment_indices())[:-self.max_segments or None]:
+            for suffix in ('.jsonl', INDEX_SUFFIX):
+                try:
+                    os.remove(self._segment_path(old, suffix))
+                except OSError:
+                    pass
+
+    def submit(self, entry: LogEntry):
+        """Reihe Eintrag zum Schreiben ein (nicht blockierend, nach ``close`` ignoriert)"""
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        drain_batches(self._queue, self.batch_size, self._write_batch, self.flush_interval)
+        self._close_segment()
+
+    def _write_batch(self, batch):
+        try:
+            entries = [entry.as_dict() for entry in batch]
+            lines = [(json.dumps(entry, default=str) + '\n').encode('utf-8') for entry in entries]
+            index = self._index_writer.records(entries, lines, self._file.tell())
+            chunk = b''.join(lines)
+            self._file.write(chunk)
+            self._file.flush()
+            # Index erst nach den Daten - er zeigt nie auf fehlende Bytes
+            self._index_writer.write(index)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Message log write failed: {e}")
+            return
+        self.written += len(batch)
+        self._size += len(chunk)
+        if self._size >= self.segment_bytes:
+            self._open_segment(self._index + 1)
+
+    def close(self, timeout: float = 5.0):
+        """Schreibe ausstehende Einträge und beende den Writer-Thread"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class MessageLog:
+    """Ringpuffer der letzten Log-Einträge
+
+    Hält höchstens ``maxlen`` Einträge im Speicher. Mit ``writer`` wird
+    zusätzlich jeder Eintrag für den Audit-Trail auf die Platte gestreamt.
+    """
+
+    def __init__(self, maxlen: int = 1000, writer: Optional[JsonlSegmentWriter] = None):
+        self.entries: deque = deque(maxlen=maxlen)
+        self.writer = writer
+        self.total = 0
+
+    def append(self, entry: LogEntry):
+        self.entries.append(entry)
+        self.total += 1
+        if self.writer is not None:
+            self.writer.submit(entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[LogEntry]:
+        return iter(self.entries)
+
+    def recent(self, count: int = 50) -> list:
+        """Die letzten ``count`` Einträge"""
+        if count <= 0:
+            return []
+        return list(self.entries)[-count:]
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def add_log_arguments(parser):
+    """Gemeinsame CLI-Optionen für das Nachrichten-Log"""
+    parser.add_argument('--log-size', type=int, default=1000,
+                        help='Max log entries kept in memory (default: 1000)')
+    parser.add_argument('--log-dir', default=None,
+                        help='Stream log entries to rotated JSONL segments in this directory')
+    parser.add_argument('--log-segment-mb', type=int, default=16,
+                        help='Segment size in MiB before rotation (default: 16)')
+    parser.add_argument('--log-segments', type=int, default=10,
+                        help='Number of segments to keep (default: 10)')
+
+
+def message_log_from_args(args, prefix: str = 'signaling') -> MessageLog:
+    """Baue ein MessageLog aus den CLI-Optionen von ``add_log_arguments``
+
+    ``prefix`` trennt die Segmentdateien mehrerer Worker-Prozesse.
+    """
+    writer = None
+    if args.log_dir:
+        writer = JsonlSegmentWriter(args.log_dir, prefix=prefix,
+                                    segment_bytes=args.log_segment_mb * 1024 * 1024,
+                                    max_segments=args.log_segments)
+    return MessageLog(maxlen=args.log_size, writer=writer)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Laufzeit-Metriken für die Signalisierungsserver im Prometheus-Textformat
+Ohne externe Abhängigkeiten; Zähler und Histogramme kosten auf dem
+Hot-Path nur ein paar Dictionary- bzw. Listen-Operationen.
+"""
+
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+ROOM_SIZE_BUCKETS = (1, 2, 3, 4, 5, 10, 25, 50, 100)
+
+# Nachrichtentypen, die als Label erscheinen dürfen - alles andere wird
+# zu "other", damit Clients die Label-Kardinalität nicht aufblähen können
+KNOWN_TYPES = frozenset({
+    'offer', 'answer', 'ice-candidate', 'ice-candidates', 'join', 'welcome', 'joined',
+})
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    """Backslash und Zeilenumbruch wie im Textformat vorgeschrieben"""
+    return value.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    # In Label-Werten zusätzlich das Anführungszeichen
+    inner = ','.join('{}="{}"'.format(k, _escape(str(v)).replace('"', '\\"'))
+                     for k, v in labels.items())
+    return '{' + inner + '}'
+
+
+def _help(name: str, documentation: str) -> str:
+    return f'# HELP {name} {_escape(documentation)}'
+
+
+class Counter:
+    """Monoton steigender Zähler, optional mit einem Label"""
+
+    def __init__(self, name: str, documentation: str, labelname: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelname = labelname
+        self.values: Dict[str, float] = {}
+
+    def inc(self, label: str = '', amount: float = 1):
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def get(self, label: str = '') -> float:
+        return self.values.get(label, 0)
+
+    def render(self) -> Iterable[str]:
+        yield _help(self.name, self.documentation)
+        yield f'# TYPE {self.name} counter'
+        if not self.values and not self.labelname:
+            yield f'{self.name} 0'
+        for label, value in sorted(self.values.items()):
+            labels = {self.labelname: label} if self.labelname else {}
+            yield f'{self.name}{_format_labels(labels)} {_format_value(value)}'
+
+
+class Histogram:
+    """Histogramm mit festen Buckets"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> Iterable[str]:
+        yield _help(self.name, self.documentation)
+        yield f'# TYPE {self.name} histogram'
+        yield from render_buckets(self.name, self.buckets, self.counts, self.sum, self.count)
+
+
+def render_buckets(name, buckets, counts, total, count) -> Iterable[str]:
+    cumulative = 0
+    for bound, bucket_count in zip(list(buckets) + [math.inf], counts):
+        cumulative += bucket_count
+        yield f'{name}_bucket{{le="{_format_value(bound)}"}} {cumulative}'
+    yield f'{name}_sum {_format_value(total)}'
+    yield f'{name}_count {count}'
+
+
+class CallbackMetric:
+    """Wert wird erst beim Abruf berechnet (Gauges, fremde Zähler)"""
+
+    def __init__(self, name: str, documentation: str, kind: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.callback = callback
+
+    def render(self) -> Iterable[str]:
+        yield _help(self.name, self.documentation)
+        yield f'# TYPE {self.name} {self.kind}'
+        yield f'{self.name} {_format_value(self.callback())}'
+
+
+class CallbackHistogram:
+    """Histogramm, das beim Abruf aus aktuellen Werten gebildet wird"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float],
+                 callback: Callable[[], Iterable[float]]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.callback = callback
+
+    def render(self) -> Iterable[str]:
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        count = 0
+        for value in self.callback():
+            counts[bisect_left(self.buckets, value)] += 1
+            total += value
+            count += 1
+        yield _help(self.name, self.documentation)
+        yield f'# TYPE {self.name} histogram'
+        yield from render_buckets(self.name, self.buckets, counts, total, count)
+
+
+class SignalingMetrics:
+    """Metrik-Satz aller Signalisierungsserver
+
+    Die Zustandswerte (Verbindungen, Räume, Queues) kommen als Callbacks
+    vom jeweiligen Server und kosten nur beim Abruf von ``/metrics``.
+    """
+
+    def __init__(self, connections: Callable[[], float], rooms: Callable[[], float],
+                 room_sizes: Callable[[], Iterable[float]],
+                 queue_depth: Optional[Callable[[], float]] = None,
+                 dropped: Optional[Callable[[], float]] = None):
+        self.messages = Counter('signaling_messages_total',
+                                'Received signaling messages by type', 'type')
+        self.message_bytes = Counter('signaling_message_bytes_total',
+                                     'Received signaling payload bytes by type', 'type')
+        self.forward_latency = Histogram('signaling_forward_latency_seconds',
+                                         'Time from receiving a message to handing it to the socket')
+        self._metrics: List = [
+            CallbackMetric('signaling_connections', 'Open WebSocket connections', 'gauge', connections),
+            CallbackMetric('signaling_rooms', 'Active rooms', 'gauge', rooms),
+            CallbackHistogram('signaling_room_size', 'Clients per active room',
+                              ROOM_SIZE_BUCKETS, room_sizes),
+            self.messages,
+            self.message_bytes,
+            self.forward_latency,
+        ]
+        if queue_depth is not None:
+            self._metrics.append(CallbackMetric('signaling_send_queue_depth',
+                                                'Outbound messages waiting in client queues',
+                                                'gauge', queue_depth))
+        if dropped is not None:
+            self._metrics.append(CallbackMetric('signaling_dropped_messages_total',
+                                                'Outbound messages dropped for slow or failed clients',
+                                                'counter', dropped))
+
+    def add(self, metric):
+        self._metrics.append(metric)
+
+    def observe_message(self, msg_type: Optional[str], size: int):
+        label = msg_type if msg_type in KNOWN_TYPES else 'other'
+        self.messages.inc(label)
+        self.message_bytes.inc(label, size)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
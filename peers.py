@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Peer-Verzeichnis für gezielte Zustellung (Unicast)
+Jeder Client erhält im ``welcome`` eine Peer-ID. Nachrichten mit einem
+``to``-Feld gehen nur an diesen Peer statt an alle im Raum - bei N
+Teilnehmern ein Send statt N-1. Ohne ``to`` bleibt es beim Broadcast.
+"""
+
+import secrets
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from metrics import Counter
+
+ROUTE_MODES = ('unicast', 'broadcast', 'remote', 'unavailable')
+
+DEFAULT_ROOM = 'default'
+
+
+def room_from_path(path: Optional[str]) -> str:
+    """Ermittle die Raum-ID aus dem Verbindungspfad
+
+    Unterstützt ``/ws/<raum>``, ``/<raum>`` und ``?room=<raum>``.
+    ``/`` und ``/ws`` landen im Standardraum.
+    """
+    if not path:
+        return DEFAULT_ROOM
+    parts = urlsplit(path)
+    query_room = parse_qs(parts.query).get('room')
+    if query_room and query_room[0]:
+        return query_room[0]
+    segments = [s for s in parts.path.split('/') if s]
+    if segments and segments[0] == 'ws':
+        segments = segments[1:]
+    return segments[0] if segments else DEFAULT_ROOM
+
+
+# Obergrenze für die Peer-Liste im ``welcome`` (große Räume)
+WELCOME_PEERS = 32
+
+
+def new_peer_id() -> str:
+    """Kurze, nicht erratbare ID (8 Zeichen, URL-sicher)"""
+    return secrets.token_urlsafe(6)
+
+
+def peer_unavailable(peer_id: str) -> dict:
+    """Antwort an den Absender, wenn der Empfänger nicht (mehr) verbunden ist"""
+    return {'type': 'peer-unavailable', 'peer_id': peer_id}
+
+
+class PeerDirectory:
+    """Peer-ID -> Verbindung, Nachschlagen in O(1)
+
+    Einfügen und Entfernen sind einzelne Dict-Operationen und damit auch
+    aus mehreren Threads (``--engine threads``) unter dem GIL sicher.
+    """
+
+    def __init__(self):
+        self._peers: Dict[str, Any] = {}
+        self.routed = Counter('signaling_routed_messages_total',
+                              'Forwarded messages by routing mode', 'mode')
+
+    def __len__(self):
+        return len(self._peers)
+
+    def __contains__(self, peer_id):
+        return peer_id in self._peers
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._peers)
+
+    def register(self, conn: Any) -> str:
+        peer_id = new_peer_id()
+        while peer_id in self._peers:
+            peer_id = new_peer_id()
+        self._peers[peer_id] = conn
+        return peer_id
+
+    def unregister(self, peer_id: Optional[str]):
+        if peer_id is not None:
+            self._peers.pop(peer_id, None)
+
+    def get(self, peer_id: Optional[str]) -> Any:
+        return self._peers.get(peer_id) if peer_id is not None else None
+
+    def others(self, peer_id: str, limit: int = WELCOME_PEERS) -> List[str]:
+        """Bis zu ``limit`` andere Peer-IDs (für ``welcome`` in Ein-Raum-Servern)"""
+        return list(islice((other for other in self._peers if other != peer_id), limit))
+
+    def stats(self) -> dict:
+        return {mode: int(self.routed.get(mode)) for mode in ROUTE_MODES}
+
+    def metrics(self) -> list:
+        """Prometheus-Metriken der Zustellung (für ``SignalingMetrics.add``)"""
+        return [self.routed]
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Spielt mitgeschnittenen Signalisierungsverkehr gegen die Servervarianten ab
+Liest einen oder mehrere Traces von ``--capture`` (siehe ``capture.py``)
+und öffnet für jede aufgezeichnete Verbindung einen Client, der seine
+Nachrichten zum aufgezeichneten Zeitpunkt sendet - in Echtzeit
+(``--speed 1``), beschleunigt (``--speed 10``) oder so schnell wie möglich
+(``--speed max``). ``--multiply N`` spielt jede Sitzung N-mal parallel ab,
+jede Kopie in eigenen Räumen (``<raum>-x<k>``). Die Server mit nur einem
+Raum (stdlib, aiohttp) würden die Kopien vermischen und lehnen es ab.
+
+Gezielte Nachrichten (``to``) werden auf die Peer-ID umgeschrieben, die der
+Server dem abgespielten Ziel im ``welcome`` zugeteilt hat. Jede Nachricht
+trägt den Stempel von ``bench_load.py``; gemessen werden
+Zustelllatenz, Reihenfolgeverletzungen (ein Empfänger sieht von einem
+Absender eine kleinere Sequenznummer als zuvor) und ``peer-unavailable``.
+
+Beispiel::
+
+    python signaling_server_stdlib.py --port 8080 --capture /tmp/session.jsonl
+    python replay.py /tmp/session.jsonl --servers websockets,simple --speed 10 --multiply 20
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from bench_common import WSClient
+from bench_load import (BENCH_PREFIX, SERVERS, SINGLE_ROOM, ServerProcess, git_revision,
+                        percentile, raise_fd_limit)
+from capture import read_trace
+from envelope import EnvelopeError, read_envelope
+
+
+class Session:
+    """Eine aufgezeichnete Verbindung: Raum, alte Peer-ID und Nachrichten"""
+
+    def __init__(self, room: str, peer_id: Optional[str], opened: float):
+        self.room = room
+        self.peer_id = peer_id
+        self.opened = opened
+        self.closed: Optional[float] = None
+        # (Sekunden seit Trace-Beginn, Originalnachricht)
+        self.messages: List[tuple] = []
+
+
+def strip_stamp(raw: str) -> str:
+    """Entferne einen Stempel aus einem mitgeschnittenen Lasttest"""
+    if raw.startswith(BENCH_PREFIX):
+        return '{' + raw[raw.index('],', len(BENCH_PREFIX)) + 2:]
+    return raw
+
+
+def load_sessions(paths: List[str]) -> tuple:
+    """Sitzungen aller Traces auf einer gemeinsamen Zeitachse
+
+    Traces mehrerer Worker werden über ``started`` im Header ausgerichtet,
+    die erste Verbindung liegt bei 0 (Leerlauf nach dem Serverstart zählt
+    nicht). Liefert ``(sessions, orphans)``; ``orphans`` zählt Nachrichten, deren
+    ``open`` im Trace fehlt (vom Writer verworfen).
+    """
+    traces = [read_trace(path) for path in paths]
+    origin = min(header['started'] for header, _ in traces)
+    sessions: List[Session] = []
+    orphans = 0
+    for header, events in traces:
+        offset = header['started'] - origin
+        by_id: Dict[int, Session] = {}
+        for event in events:
+            t = event['t'] + offset
+            kind = event.get('e')
+            if kind == 'open':
+                session = by_id[event['c']] = Session(event['r'], event.get('p'), t)
+                sessions.append(session)
+                continue
+            session = by_id.get(event['c'])
+            if session is None:
+                orphans += 1
+            elif kind == 'close':
+                session.closed = t
+            else:
+                session.messages.append((t, strip_stamp(event['m'])))
+    sessions.sort(key=lambda s: s.opened)
+    if sessions:
+        base = sessions[0].opened
+        for session in sessions:
+            session.opened -= base
+            if session.closed is not None:
+                session.closed -= base
+            session.messages = [(t - base, raw) for t, raw in session.messages]
+    return sessions, orphans
+
+
+class ReplayClient:
+    """Abgespielte Verbindung einer Sitzung in Kopie ``copy``"""
+
+    def __init__(self, client_id: int, session: Session, copy: int, room: str):
+        self.client_id = client_id
+        self.session = session
+        self.copy = copy
+        self.room = room
+        self.ws: Optional[WSClient] = None
+        self.peer_id: Optional[str] = None
+        # Gesetzt, sobald das welcome da ist (oder der Connect scheiterte)
+        self.ready = asyncio.Event()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        # Verbindung beendet oder nie zustande gekommen
+        self.done = False
+        # Eingereihte, noch nicht gesendete Nachrichten
+        self.pending = 0
+        self.seq = 0
+        self.sent = 0
+        self.received = 0
+        # Absender-ID -> letzte gesehene Sequenznummer
+        self.last_seq: Dict[int, int] = {}
+
+    def stamp(self, body: str) -> str:
+        self.seq += 1
+        return f'{BENCH_PREFIX}{self.client_id},{self.seq},{time.perf_counter_ns()}],{body[1:]}'
+
+
+class Replay:
+    """Ein Durchlauf gegen einen Server"""
+
+    def __init__(self, args, sessions: List[Session], host: str, port: int):
+        self.args = args
+        self.host = host
+        self.port = port
+        self.speed = args.speed
+        self.clients: List[ReplayClient] = []
+        # (Kopie, alte Peer-ID) -> Client, für das Umschreiben von ``to``
+        self.by_peer: Dict[tuple, ReplayClient] = {}
+        for copy in range(args.multiply):
+            for session in sessions:
+                room = session.room if args.multiply == 1 else f'{session.room}-x{copy}'
+                client = ReplayClient(len(self.clients), session, copy, room)
+                self.clients.append(client)
+                if session.peer_id is not None:
+                    self.by_peer[(copy, session.peer_id)] = client
+        self.connect_slots = asyncio.Semaphore(args.connect_batch)
+        self.latencies_ns: List[int] = []
+        self.lag: List[float] = []
+        self.violations = 0
+        self.unavailable = 0
+        self.failed = 0
+        self.unresolved = 0
+        self.last_receive = 0.0
+
+    @staticmethod
+    def schedule(clients: List[ReplayClient]) -> List[tuple]:
+        """Ereignisse einer Kopie nach Zeit: (t, Reihenfolge, Client, Nachricht oder None)"""
+        events = []
+        for client in clients:
+            session = client.session
+            events.append((session.opened, 0, client, ''))
+            for t, raw in session.messages:
+                events.append((t, 1, client, raw))
+            if session.closed is not None:
+                events.append((session.closed, 2, client, None))
+        events.sort(key=lambda event: (event[0], event[1], event[2].client_id))
+        return events
+
+    async def drive(self) -> List[asyncio.Future]:
+        """Alle Kopien parallel abspielen; liefert die Client-Tasks"""
+        start = time.perf_counter()
+        copies: Dict[int, List[ReplayClient]] = {}
+        for client in self.clients:
+            copies.setdefault(client.copy, []).append(client)
+        tasks: List[asyncio.Future] = []
+        await asyncio.gather(*(self.drive_copy(clients, start, tasks) for clients in copies.values()))
+        return tasks
+
+    async def drive_copy(self, clients: List[ReplayClient], start: float, tasks: list):
+        """Verteilt die Ereignisse einer Kopie zum (skalierten) Zeitpunkt an die Clients
+
+        Verbindungsaufbau und Zustellung skalieren nicht mit: Eine Nachricht
+        wartet, bis alle vorher geöffneten Sitzungen ihr ``welcome`` haben,
+        ein Close, bis alle vorherigen Nachrichten gesendet sind (plus
+        ``--linger``). So sieht jede Nachricht dieselben Raummitglieder wie
+        im Mitschnitt - auch bei ``--speed max``.
+        """
+        joining: List[ReplayClient] = []
+        for t, order, client, raw in self.schedule(clients):
+            if self.speed:
+                due = start + t / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if order == 0:
+                tasks.append(asyncio.ensure_future(self.run_client(client)))
+                joining.append(client)
+            elif order == 1:
+                joining = [c for c in joining if not c.ready.is_set()]
+                if joining:
+                    await asyncio.gather(*(c.ready.wait() for c in joining))
+                    joining = []
+                client.pending += 1
+                client.outbox.put_nowait(raw)
+            else:
+                while not all(c.done or not c.pending for c in clients):
+                    await asyncio.sleep(0.005)
+                asyncio.get_running_loop().call_later(self.args.linger, client.outbox.put_nowait, None)
+            if self.speed:
+                self.lag.append(max(0.0, time.perf_counter() - due))
+
+    async def run_client(self, client: ReplayClient):
+        path = f'/ws?room={quote(client.room)}'
+        async with self.connect_slots:
+            try:
+                client.ws = await WSClient.connect(self.host, self.port, path)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                self.failed += 1
+                client.done = True
+                client.ready.set()
+                return
+        reader = asyncio.ensure_future(self.read_loop(client))
+        await client.ready.wait()
+        try:
+            while True:
+                raw = await client.outbox.get()
+                if raw is None:
+                    break
+                raw = await self.rewrite(client, raw)
+                await client.ws.send(client.stamp(raw))
+                client.sent += 1
+                client.pending -= 1
+        except ConnectionError:
+            pass
+        finally:
+            client.done = True
+            await client.ws.close()
+            await asyncio.gather(reader, return_exceptions=True)
+
+    async def rewrite(self, client: ReplayClient, raw: str) -> str:
+        """Ziel (``to``) und Raumwechsel auf die abgespielte Kopie abbilden"""
+        try:
+            envelope = read_envelope(raw)
+        except EnvelopeError:
+            return raw
+        changes = {}
+        if envelope.to is not None:
+            target = self.by_peer.get((client.copy, envelope.to))
+            if target is None:
+                self.unresolved += 1
+            else:
+                try:
+                    await asyncio.wait_for(target.ready.wait(), self.args.target_timeout)
+                except asyncio.TimeoutError:
+                    pass
+                if target.peer_id is not None:
+                    changes['to'] = target.peer_id
+        if envelope.type == 'join' and envelope.room is not None and self.args.multiply > 1:
+            changes['room'] = f'{envelope.room}-x{client.copy}'
+        if not changes:
+            return raw
+        data = json.loads(raw)
+        data.update(changes)
+        return json.dumps(data)
+
+    async def read_loop(self, client: ReplayClient):
+        while True:
+            message = await client.ws.recv()
+            if message is None:
+                client.ready.set()
+                return
+            now = time.perf_counter_ns()
+            self.last_receive = time.perf_counter()
+            pos = message.find(BENCH_PREFIX)
+            if pos == -1:
+                if client.peer_id is None and '"welcome"' in message:
+                    client.peer_id = json.loads(message).get('peer_id')
+                    client.ready.set()
+                elif '"peer-unavailable"' in message:
+                    self.unavailable += 1
+                continue
+            # Gebündelte ICE-Kandidaten enthalten mehrere Stempel
+            while pos != -1:
+                start = pos + len(BENCH_PREFIX)
+                sender, seq, sent_ns = message[start:message.index(']', start)].split(',')
+                sender, seq = int(sender), int(seq)
+                self.latencies_ns.append(now - int(sent_ns))
+                if seq <= client.last_seq.get(sender, 0):
+                    self.violations += 1
+                else:
+                    client.last_seq[sender] = seq
+                client.received += 1
+                pos = message.find(BENCH_PREFIX, start)
+
+    async def run(self, server: Optional[ServerProcess]) -> dict:
+        args = self.args
+        cpu_start = server.cpu_seconds() if server is not None else None
+        start = time.perf_counter()
+        self.last_receive = start
+        tasks = await self.drive()
+        drive_done = time.perf_counter()
+
+        # Warten, bis keine Nachrichten mehr eintreffen, dann alle offenen Verbindungen schließen
+        deadline = drive_done + args.drain_timeout
+        while time.perf_counter() < deadline:
+            if time.perf_counter() - self.last_receive >= args.quiet_period and all(
+                    c.done or not c.pending for c in self.clients):
+                break
+            await asyncio.sleep(0.05)
+        end = max(self.last_receive, drive_done)
+        cpu_end = server.cpu_seconds() if server is not None else None
+        for client in self.clients:
+            if not client.done:
+                client.outbox.put_nowait(None)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        elapsed = end - start
+        sent = sum(c.sent for c in self.clients)
+        latencies = sorted(ns / 1e6 for ns in self.latencies_ns)
+        lag = sorted(seconds * 1000 for seconds in self.lag)
+        cpu = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+        return {
+            'server': server.name if server is not None else f'{self.host}:{self.port}',
+            'speed': self.speed or 'max',
+            'multiply': args.multiply,
+            'clients': len(self.clients),
+            'failed': self.failed,
+            'seconds': elapsed,
+            'sent': sent,
+            'delivered': sum(c.received for c in self.clients),
+            'messages_per_s': sent / elapsed if elapsed else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p99': percentile(latencies, 99),
+                'p999': percentile(latencies, 99.9),
+                'max': latencies[-1] if latencies else None,
+            },
+            'ordering_violations': self.violations,
+            'peer_unavailable': self.unavailable,
+            'unresolved_targets': self.unresolved,
+            'schedule_lag_ms': {'p99': percentile(lag, 99), 'max': lag[-1] if lag else None},
+            'server_cpu_seconds': cpu,
+            'cpu_us_per_message': cpu / sent * 1e6 if cpu is not None and sent else None,
+        }
+
+
+def parse_speed(value: str) -> float:
+    """``max`` bzw. ``0`` = ohne Pausen, sonst Faktor gegenüber Echtzeit"""
+    if value == 'max':
+        return 0.0
+    speed = float(value)
+    if speed < 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def print_summary(results: List[dict]):
+    def fmt(value, spec='.2f'):
+        return '-' if value is None else format(value, spec)
+
+    print(f"{'server':<16} {'speed':>5} {'clients':>8} {'sent':>8} {'deliv':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'order':>6} {'unavail':>7} {'lag ms':>7} {'µs/msg':>7}")
+    for r in results:
+        lat = r['latency_ms']
+        speed = r['speed'] if r['speed'] == 'max' else f"{r['speed']:g}x"
+        print(f"{r['server']:<16} {speed:>5} {r['clients']:>8} {r['sent']:>8} {r['delivered']:>8} "
+              f"{fmt(lat['p50']):>8} {fmt(lat['p99']):>8} {r['ordering_violations']:>6} "
+              f"{r['peer_unavailable']:>7} {fmt(r['schedule_lag_ms']['p99'], '.1f'):>7} "
+              f"{fmt(r['cpu_us_per_message'], '.0f'):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured signaling traffic against the servers')
+    parser.add_argument('traces', nargs='+', help='Trace files written with --capture (one per worker)')
+    parser.add_argument('--servers', default='stdlib',
+                        help=f"Comma separated variants to start ({', '.join(SERVERS)})")
+    parser.add_argument('--connect', default=None, metavar='HOST:PORT',
+                        help='Replay against a running server instead of starting --servers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18900, help='First port to use')
+    parser.add_argument('--server-args', default='', help='Extra arguments for every server')
+    parser.add_argument('--speed', type=parse_speed, default=1.0,
+                        help="Time scale: 1 = as recorded, 10 = ten times faster, max = no pauses")
+    parser.add_argument('--multiply', type=int, default=1,
+                        help='Replay every session N times in parallel, each copy in its own rooms '
+                             '(not for the single-room stdlib and aiohttp servers)')
+    parser.add_argument('--connect-batch', type=int, default=200, help='Concurrent connects')
+    parser.add_argument('--linger', type=float, default=0.1,
+                        help='Seconds a session stays open after its recorded close is due (default: 0.1)')
+    parser.add_argument('--target-timeout', type=float, default=5.0,
+                        help='Seconds a message waits for its "to" peer to connect (default: 5)')
+    parser.add_argument('--quiet-period', type=float, default=0.5,
+                        help='Seconds without traffic that end a run')
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--output', default=None, help='Write JSON results to this file')
+    args = parser.parse_args()
+    if args.multiply < 1:
+        parser.error("--multiply must be at least 1")
+    single_room = [s for s in args.servers.split(',') if s in SINGLE_ROOM]
+    if args.multiply > 1 and single_room and not args.connect:
+        parser.error(f"--multiply needs separate rooms, not supported by: {', '.join(single_room)}")
+
+    sessions, orphans = load_sessions(args.traces)
+    if not sessions:
+        sys.exit("No sessions in trace")
+    messages = sum(len(s.messages) for s in sessions)
+    duration = max([s.closed or s.opened for s in sessions] +
+                   [t for s in sessions for t, _ in s.messages[-1:]])
+    print(f"Trace: {len(sessions)} sessions, {messages} messages, {duration:.1f} s"
+          + (f", {orphans} messages without open" if orphans else ''))
+
+    raise_fd_limit()
+    results = []
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        results.append(asyncio.run(Replay(args, sessions, host or args.host, int(port)).run(None)))
+    else:
+        for offset, name in enumerate(s for s in args.servers.split(',') if s):
+            server = ServerProcess(name, args.host, args.port + offset, args.server_args.split())
+            server.start()
+            try:
+                results.append(asyncio.run(Replay(args, sessions, server.host, server.port).run(server)))
+            finally:
+                server.stop()
+
+    print_summary(results)
+    if args.output:
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(),
+                'revision': git_revision(),
+                'traces': args.traces,
+                'sessions': len(sessions),
+                'trace_messages': messages,
+                'trace_seconds': duration,
+                'params': vars(args),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if any(r['ordering_violations'] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Raum-Bus für mehrere Worker-Prozesse
+Leitet Nachrichten an Peers weiter, die mit einem anderen Worker verbunden
+sind. Standard ist ein Mesh aus Unix-Domain-Sockets ohne externen Broker;
+alternativ Redis Pub/Sub (``pip install redis``).
+
+Jeder Worker meldet, für welche Räume er lokale Clients hat. Nachrichten
+gehen nur an Worker mit Clients im selben Raum - Räume, deren Clients alle
+am selben Worker hängen, erzeugen keinen Bus-Verkehr.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import struct
+import tempfile
+from typing import Callable, Dict, List, Optional, Set
+
+from metrics import CallbackMetric
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+BUS_BACKENDS = ('unix', 'redis')
+
+Deliver = Callable[[str, str], None]
+
+
+class RoomBus:
+    """Schnittstelle aller Bus-Backends
+
+    ``subscribe``/``unsubscribe``/``publish`` blockieren nie; empfangene
+    Nachrichten anderer Worker gehen an ``deliver(room_id, message)``.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self.deliver = deliver
+
+    def subscribe(self, room_id: str):
+        raise NotImplementedError
+
+    def unsubscribe(self, room_id: str):
+        raise NotImplementedError
+
+    def publish(self, room_id: str, message: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def metrics(self) -> list:
+        """Prometheus-Metriken des Busses (für ``SignalingMetrics.add``)"""
+        return [
+            CallbackMetric('signaling_bus_published_total', 'Messages sent to other workers',
+                           'counter', lambda: self.published),
+            CallbackMetric('signaling_bus_received_total', 'Messages received from other workers',
+                           'counter', lambda: self.received),
+            CallbackMetric('signaling_bus_dropped_total',
+                           'Bus messages dropped because a peer was not reachable or too slow',
+                           'counter', lambda: self.dropped),
+        ]
+
+
+# Frame: Art (1 Byte), Länge Raum-ID (2 Byte), Länge Nachricht (4 Byte)
+_FRAME = struct.Struct('!BHI')
+HELLO, SUBSCRIBE, UNSUBSCRIBE, MESSAGE = range(4)
+
+
+def _encode(kind: int, room_id: str, body: bytes = b'') -> bytes:
+    room = room_id.encode('utf-8')
+    return _FRAME.pack(kind, len(room), len(body)) + room + body
+
+
+class UnixSocketBus(RoomBus):
+    """Vollständiges Mesh aus Unix-Domain-Sockets zwischen ``workers`` Prozessen
+
+    Jeder Worker lauscht auf ``<directory>/worker-<id>.sock`` und verbindet
+    sich mit allen anderen. Über die eigene ausgehende Verbindung gehen
+    Raum-Abos und Nachrichten an den jeweiligen Worker.
+    """
+
+    RECONNECT_DELAY = 0.1
+
+    def __init__(self, worker_id: int, workers: int, directory: str,
+                 max_buffer: int = 8 * 1024 * 1024):
+        super().__init__()
+        self.worker_id = worker_id
+        self.workers = workers
+        self.directory = directory
+        self.max_buffer = max_buffer
+        self.rooms: Set[str] = set()
+        # Ausgehende Verbindungen und die Raum-Abos der anderen Worker
+        self._peers: Dict[int, asyncio.StreamWriter] = {}
+        self._interest: Dict[int, Set[str]] = {}
+        self._server = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+    def path(self, worker_id: int) -> str:
+        return os.path.join(self.directory, f'worker-{worker_id}.sock')
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(self.worker_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = await asyncio.start_unix_server(self._serve_peer, path)
+        for peer in range(self.workers):
+            if peer != self.worker_id:
+                self._tasks.append(asyncio.ensure_future(self._connect(peer)))
+
+    async def _connect(self, peer: int):
+        """Verbinde (erneut) mit einem anderen Worker und sende die eigenen Abos"""
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path(peer))
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            writer.write(_encode(HELLO, str(self.worker_id)))
+            for room_id in self.rooms:
+                writer.write(_encode(SUBSCRIBE, room_id))
+            self._peers[peer] = writer
+            logger.info(f"Bus: worker {self.worker_id} connected to worker {peer}")
+            return
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = None
+        try:
+            while True:
+                kind, room_len, body_len = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                room_id = (await reader.readexactly(room_len)).decode('utf-8')
+                body = await reader.readexactly(body_len) if body_len else b''
+                if peer is None and kind != HELLO:
+                    # Abos und Nachrichten erst nach der Vorstellung des Workers
+                    logger.warning(f"Bus: frame {kind} before HELLO, closing connection")
+                    break
+                if kind == MESSAGE:
+                    self.received += 1
+                    self.deliver(room_id, body.decode('utf-8'))
+                elif kind == SUBSCRIBE:
+                    self._interest[peer].add(room_id)
+                elif kind == UNSUBSCRIBE:
+                    self._interest[peer].discard(room_id)
+                elif kind == HELLO:
+                    peer = int(room_id)
+                    self._interest[peer] = set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError as e:
+            # Ungültige Worker-ID oder kein UTF-8
+            logger.warning(f"Bus: invalid frame ({e}), closing connection")
+        except asyncio.CancelledError:
+            # Beim Beenden der Event-Loop - start_unix_server meldet
+            # abgebrochene Handler sonst als Fehler
+            pass
+        finally:
+            if peer is not None:
+                self._interest.pop(peer, None)
+                stale = self._peers.pop(peer, None)
+                if stale is not None and not self._closing:
+                    stale.close()
+                    # Worker wurde neu gestartet - neu verbinden
+                    self._tasks.append(asyncio.ensure_future(self._connect(peer)))
+            writer.close()
+
+    def _send_all(self, frame: bytes):
+        for writer in self._peers.values():
+            writer.write(frame)
+
+    def subscribe(self, room_id: str):
+        if room_id not in self.rooms:
+            self.rooms.add(room_id)
+            self._send_all(_encode(SUBSCRIBE, room_id))
+
+    def unsubscribe(self, room_id: str):
+        if room_id in self.rooms:
+            self.rooms.discard(room_id)
+            self._send_all(_encode(UNSUBSCRIBE, room_id))
+
+    def publish(self, room_id: str, message: str):
+        frame = None
+        for peer, writer in self._peers.items():
+            if room_id not in self._interest.get(peer, ()):
+                continue
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += 1
+                continue
+            if frame is None:
+                frame = _encode(MESSAGE, room_id, message.encode('utf-8'))
+            writer.write(frame)
+            self.published += 1
+
+    async def close(self):
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        for writer in self._peers.values():
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+        try:
+            os.unlink(self.path(self.worker_id))
+        except OSError:
+            pass
+
+
+class RedisBus(RoomBus):
+    """Redis Pub/Sub mit einem Kanal pro Raum (auch über Rechnergrenzen)"""
+
+    MAX_PENDING = 10000
+
+    def __init__(self, url: str, worker_id: str, prefix: str = 'signaling:'):
+        if aioredis is None:
+            raise RuntimeError("Redis bus requires the 'redis' package (pip install redis)")
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        # Eigene Nachrichten am Präfix erkennen und nicht erneut zustellen
+        self.origin = f'{worker_id}:'
+        self.rooms: Set[str] = set()
+        self._redis = None
+        self._pubsub = None
+        self._pending = 0
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        self._reader = asyncio.ensure_future(self._read_loop())
+
+    async def _read_loop(self):
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(0.05)
+                continue
+            item = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if item is None or item.get('type') != 'message':
+                continue
+            data = item['data'].decode('utf-8')
+            if data.startswith(self.origin):
+                continue
+            channel = item['channel'].decode('utf-8')
+            self.received += 1
+            self.deliver(channel[len(self.prefix):], data.split(':', 1)[1])
+
+    def subscribe(self, room_id: str):
+        if room_id not in self.rooms:
+            self.rooms.add(room_id)
+            asyncio.ensure_future(self._pubsub.subscribe(self.prefix + room_id))
+
+    def unsubscribe(self, room_id: str):
+        if room_id in self.rooms:
+            self.rooms.discard(room_id)
+            asyncio.ensure_future(self._pubsub.unsubscribe(self.prefix + room_id))
+
+    def publish(self, room_id: str, message: str):
+        if self._pending >= self.MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending += 1
+        task = asyncio.ensure_future(self._redis.publish(self.prefix + room_id, self.origin + message))
+        task.add_done_callback(self._published)
+
+    def _published(self, task: asyncio.Future):
+        self._pending -= 1
+        if task.cancelled() or task.exception() is not None:
+            self.dropped += 1
+        else:
+            self.published += 1
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            close = getattr(self._redis, 'aclose', None) or self._redis.close
+            await close()
+
+
+def add_bus_arguments(parser):
+    """CLI-Optionen für Worker-Prozesse und den Raum-Bus"""
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes sharing the port via SO_REUSEPORT (default: 1)')
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN,
+                        help='Listen backlog of each worker socket with --workers > 1 '
+                             f'(default: {socket.SOMAXCONN})')
+    parser.add_argument('--bus', choices=BUS_BACKENDS, default='unix',
+                        help='Room bus between workers (default: unix)')
+    parser.add_argument('--bus-dir', default=None,
+                        help='Directory for the unix bus sockets (default: temp dir per port)')
+    parser.add_argument('--bus-url', default='redis://localhost:6379/0',
+                        help='Redis URL for --bus redis')
+
+
+def bus_from_args(args, worker_id: int, port: int) -> Optional[RoomBus]:
+    """Bus für einen Worker; ``None`` bei einem einzelnen Prozess mit Unix-Bus"""
+    if args.bus == 'redis':
+        return RedisBus(args.bus_url, f'{os.uname().nodename}-{port}-{worker_id}')
+    if args.workers <= 1:
+        return None
+    directory = args.bus_dir or os.path.join(tempfile.gettempdir(), f'signaling-bus-{port}')
+    return UnixSocketBus(worker_id, args.workers, directory)
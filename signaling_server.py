@@ -7,162 +7,807 @@ Demonstriert Sicherheitsrisiken bei unverschlüsselter Signalisierung
 import asyncio
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Set
+import os
+import ssl
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
 import websockets
 from websockets.server import WebSocketServerProtocol
 
+from message_log import LogEntry, MessageLog, add_log_arguments, message_log_from_args
+from envelope import Envelope, EnvelopeError, read_envelope, with_sender
+from metrics import CONTENT_TYPE, Counter, SignalingMetrics
+from analysis import ExposureAnalyzer, add_analysis_arguments, analyzer_from_args
+from room_bus import RoomBus, add_bus_arguments, bus_from_args
+from keepalive import KeepalivePolicy, Reaper, add_keepalive_arguments, keepalive_from_args
+from admission import (CLOSE_MESSAGE_TOO_BIG, CLOSE_POLICY_VIOLATION, Admission, Limiter,
+                       add_admission_arguments, admission_from_args)
+from peers import DEFAULT_ROOM, WELCOME_PEERS, PeerDirectory, peer_unavailable, room_from_path
+from tls import DEFAULT_CERT, DEFAULT_KEY, add_tls_arguments, tls_from_args
+from workers import run_workers
+from console_log import ConsoleLog, add_console_log_arguments, console_log_from_args, traffic_logger
+from capture import TraceWriter, add_capture_arguments, capture_from_args
+
 # Logging-Konfiguration
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Zeilen pro Nachricht/Verbindung - mit --traffic-log-sample/-rate sampelbar
+traffic = traffic_logger(__name__)
+
+
+def wants_ice_batch(path: Optional[str]) -> bool:
+    """Client hat gebündelte ICE-Kandidaten angefordert (``?ice_batch=1``)"""
+    if not path:
+        return False
+    value = parse_qs(urlsplit(path).query).get('ice_batch')
+    return bool(value) and value[0] not in ('0', 'false')
+
+
+def batch_candidates(messages: List[str]) -> str:
+    """Fasse rohe ``ice-candidate``-Nachrichten ohne erneutes Kodieren zusammen"""
+    return '{"type":"ice-candidates","candidates":[' + ','.join(messages) + ']}'
+
+
+class CandidateCoalescer:
+    """Sammelt die ICE-Kandidaten eines Senders für ``window`` Sekunden
+
+    Trickle ICE erzeugt Dutzende Nachrichten innerhalb weniger
+    Millisekunden. Statt jede einzeln zu verteilen, werden sie gesammelt
+    und gemeinsam an ``deliver(messages, received_at)`` übergeben.
+    """
+
+    __slots__ = ('window', 'deliver', 'pending', 'received_at', '_timer')
+
+    MAX_BATCH = 64
+
+    def __init__(self, window: float, deliver: Callable[[List[str], Optional[float]], None]):
+        self.window = window
+        self.deliver = deliver
+        self.pending: List[str] = []
+        self.received_at: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, message: str, received_at: Optional[float] = None):
+        if not self.pending:
+            self.received_at = received_at
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        self.pending.append(message)
+        if len(self.pending) >= self.MAX_BATCH:
+            self.flush()
+
+    def flush(self):
+        """Verteile gesammelte Kandidaten sofort (auch vor anderen Nachrichten)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.pending:
+            messages, self.pending = self.pending, []
+            self.deliver(messages, self.received_at)
+
 
 # Verbindungsverwaltung
+SLOW_CLIENT_POLICIES = ('drop', 'disconnect')
+
+
+class OutboundStats:
+    """Serverweite Zähler für die Sende-Warteschlangen"""
+
+    __slots__ = ('sent', 'dropped', 'slow_disconnects')
+
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+
+
+class Client:
+    """WebSocket-Verbindung mit eigener, begrenzter Sende-Warteschlange
+
+    Ein langsamer Empfänger füllt nur seine eigene Queue; ist sie voll,
+    greift die Policy: ``drop`` verwirft neue Nachrichten, ``disconnect``
+    trennt den Client.
+
+    Queue und Writer-Task gibt es nur, solange Nachrichten ausstehen - ein
+    Client ohne Verkehr ist ein einzelnes Objekt mit ``__slots__``.
+    """
+
+    __slots__ = ('websocket', 'stats', 'max_queue', 'policy', 'send_timeout', 'metrics',
+                 'ice_batch', 'queue', 'dropped', 'closed', 'liveness', 'limiter', 'peer_id',
+                 '_writer')
+
+    def __init__(self, websocket: WebSocketServerProtocol, stats: OutboundStats,
+                 max_queue: int = 256, policy: str = 'drop', send_timeout: float = 10.0,
+                 metrics: Optional[SignalingMetrics] = None, ice_batch: bool = False):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+        self.websocket = websocket
+        self.stats = stats
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.metrics = metrics
+        self.ice_batch = ice_batch
+        # (Nachricht, received_at); None, solange nichts aussteht
+        self.queue: Optional[Deque[tuple]] = None
+        self.dropped = 0
+        self.closed = False
+        self.liveness = None
+        self.limiter = None
+        self.peer_id: Optional[str] = None
+        self._writer: Optional[asyncio.Future] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.queue) if self.queue is not None else 0
+
+    def enqueue(self, message: str, received_at: Optional[float] = None) -> bool:
+        """Reihe Nachricht ein, ohne zu blockieren
+
+        ``received_at`` (``time.perf_counter()``) misst die Weiterleitungslatenz.
+        """
+        if self.closed:
+            return False
+        if self.queue is None:
+            self.queue = deque()
+        elif len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            self.stats.dropped += 1
+            if self.policy == 'disconnect':
+                self.disconnect("slow consumer")
+            return False
+        self.queue.append((message, received_at))
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write_loop())
+        return True
+
+    async def _write_loop(self):
+        """Leert die Queue und endet, sobald sie leer ist"""
+        while self.queue:
+            message, received_at = self.queue.popleft()
+            try:
+                if self.policy == 'disconnect':
+                    await asyncio.wait_for(self.websocket.send(message), self.send_timeout)
+                else:
+                    await self.websocket.send(message)
+            except asyncio.TimeoutError:
+                self.disconnect("send timeout")
+                return
+            except websockets.exceptions.ConnectionClosed:
+                self.closed = True
+                return
+            self.stats.sent += 1
+            if received_at is not None and self.metrics is not None:
+                self.metrics.forward_latency.observe(time.perf_counter() - received_at)
+        self.queue = None
+        self._writer = None
+
+    def disconnect(self, reason: str):
+        """Trenne einen zu langsamen Client"""
+        if self.closed:
+            return
+        self.closed = True
+        self.stats.slow_disconnects += 1
+        logger.warning(f"Disconnecting slow client ({reason}), queue depth: {self.queue_depth}")
+        if self._writer is not None:
+            self._writer.cancel()
+        asyncio.ensure_future(self.websocket.close(1013, reason))
+
+    async def close(self):
+        """Beende den Writer-Task"""
+        self.closed = True
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        writer.cancel()
+        try:
+            await writer
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+class ReplayBuffer:
+    """Letztes Offer eines Raums plus die ICE-Kandidaten seines Senders
+
+    Gespeichert werden nur die Original-Strings. Der Puffer läuft ``ttl``
+    Sekunden nach dem Offer ab, ist in Anzahl und Größe begrenzt und wird
+    mit dem Answer verworfen.
+    """
+
+    __slots__ = ('ttl', 'sender', 'offer', 'candidates', 'size', 'expires')
+
+    MAX_CANDIDATES = 64
+    MAX_BYTES = 256 * 1024
+
+    def __init__(self, ttl: float, sender: Client, offer: str):
+        self.ttl = ttl
+        self.sender = sender
+        self.offer = offer
+        self.candidates: List[str] = []
+        self.size = len(offer)
+        self.expires = time.monotonic() + ttl
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+    def add_candidate(self, message: str):
+        if len(self.candidates) < self.MAX_CANDIDATES and self.size + len(message) <= self.MAX_BYTES:
+            self.candidates.append(message)
+            self.size += len(message)
+
+
 class Room:
-    def __init__(self, room_id: str):
+    """Clients eines Raums, nach Peer-ID (Unicast ohne Suche)"""
+
+    __slots__ = ('room_id', 'clients', 'replay_ttl', 'replay', 'limiter')
+
+    def __init__(self, room_id: str, replay_ttl: float = 0.0, limiter: Optional[Limiter] = None):
         self.room_id = room_id
-        self.clients: Set[WebSocketServerProtocol] = set()
-        
-    def add_client(self, websocket: WebSocketServerProtocol):
-        self.clients.add(websocket)
-        logger.info(f"Client joined room {self.room_id}. Total clients: {len(self.clients)}")
+        self.clients: Dict[str, Client] = {}
+        self.replay_ttl = replay_ttl
+        self.replay: Optional[ReplayBuffer] = None
+        # Gemeinsames Rate Limit aller Sender im Raum
+        self.limiter = limiter
         
-    def remove_client(self, websocket: WebSocketServerProtocol):
-        self.clients.discard(websocket)
-        logger.info(f"Client left room {self.room_id}. Remaining clients: {len(self.clients)}")
+    def add_client(self, client: Client):
+        self.clients[client.peer_id] = client
+        traffic.info("Client joined room %s. Total clients: %d", self.room_id, len(self.clients))
         
-    async def broadcast(self, message: str, sender: WebSocketServerProtocol):
-        """Sende Nachricht an alle Clients außer dem Sender"""
-        disconnected = set()
-        for client in self.clients:
-            if client != sender:
-                try:
-                    await client.send(message)
-                except websockets.exceptions.ConnectionClosed:
-                    disconnected.add(client)
+    def remove_client(self, client: Client):
+        if self.clients.get(client.peer_id) is client:
+            del self.clients[client.peer_id]
+        if self.replay is not None and self.replay.sender is client:
+            # Offer eines gegangenen Peers ist wertlos
+            self.replay = None
+        traffic.info("Client left room %s. Remaining clients: %d", self.room_id, len(self.clients))
+
+    def peer_ids(self, exclude: Optional[Client] = None, limit: int = WELCOME_PEERS) -> List[str]:
+        """Peer-IDs der anderen Clients (für ``welcome`` und ``joined``)"""
+        ids = []
+        for client in self.clients.values():
+            if client is not exclude:
+                ids.append(client.peer_id)
+                if len(ids) >= limit:
+                    break
+        return ids
+
+    def record(self, msg_type: Optional[str], message: str, sender: Client,
+               targeted: bool = False):
+        """Merke Offer und Kandidaten für später beitretende Clients
+
+        Gezielte Nachrichten (``to``) werden nicht gepuffert, ein gezieltes
+        Answer beendet das Offer aber genauso wie ein gesendetes.
+        """
+        if not self.replay_ttl:
+            return
+        if msg_type == 'answer':
+            self.replay = None
+        elif targeted:
+            return
+        elif msg_type == 'offer':
+            if len(message) <= ReplayBuffer.MAX_BYTES:
+                self.replay = ReplayBuffer(self.replay_ttl, sender, message)
+            else:
+                self.replay = None
+        elif msg_type == 'ice-candidate' and self.replay is not None:
+            if self.replay.expired:
+                self.replay = None
+            elif self.replay.sender is sender:
+                self.replay.add_candidate(message)
+
+    def replay_to(self, client: Client) -> int:
+        """Sende gepuffertes Offer und Kandidaten an einen neuen Client"""
+        replay = self.replay
+        if replay is None:
+            return 0
+        if replay.expired:
+            self.replay = None
+            return 0
+        client.enqueue(replay.offer)
+        candidates = replay.candidates
+        if client.ice_batch and len(candidates) > 1:
+            client.enqueue(batch_candidates(candidates))
+        else:
+            for message in candidates:
+                client.enqueue(message)
+        return 1 + len(candidates)
         
-        # Entferne getrennte Clients
-        for client in disconnected:
-            self.remove_client(client)
+    def broadcast(self, message: str, sender: Optional[Client], received_at: Optional[float] = None):
+        """Reihe Nachricht für alle Clients außer dem Sender ein
+
+        Blockiert nie: das Senden übernehmen die Writer-Tasks der Clients.
+        Nachrichten von anderen Workern haben keinen lokalen Sender.
+        """
+        for client in self.clients.values():
+            if client is not sender:
+                client.enqueue(message, received_at)
+
+    def broadcast_candidates(self, messages: List[str], sender: Client,
+                             received_at: Optional[float] = None):
+        """Verteile gesammelte ICE-Kandidaten
+
+        Clients mit ``ice_batch`` erhalten einen ``ice-candidates``-Frame,
+        alle anderen die Originalnachrichten einzeln.
+        """
+        batch = batch_candidates(messages) if len(messages) > 1 else None
+        for client in self.clients.values():
+            if client is sender:
+                continue
+            if batch is not None and client.ice_batch:
+                client.enqueue(batch, received_at)
+            else:
+                for message in messages:
+                    client.enqueue(message, received_at)
+
+
+class RoomRegistry:
+    """Index aller aktiven Räume - leere Räume werden sofort entfernt
+
+    Mit ``bus`` werden neue Räume bei den anderen Worker-Prozessen
+    abonniert und leere wieder abgemeldet.
+    """
+
+    def __init__(self, bus: Optional[RoomBus] = None, replay_ttl: float = 0.0,
+                 admission: Optional[Admission] = None):
+        self._rooms: Dict[str, Room] = {}
+        self.bus = bus
+        self.replay_ttl = replay_ttl
+        self.admission = admission
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._rooms
+
+    def get(self, room_id: str) -> Optional[Room]:
+        return self._rooms.get(room_id)
+
+    def __iter__(self):
+        return iter(list(self._rooms.values()))
+
+    def join(self, room_id: str, client: Client) -> Room:
+        """Füge Client einem Raum hinzu (Raum wird bei Bedarf angelegt)"""
+        room = self._rooms.get(room_id)
+        if room is None:
+            limiter = self.admission.room_limiter(time.perf_counter()) if self.admission else None
+            room = self._rooms[room_id] = Room(room_id, self.replay_ttl, limiter)
+            if self.bus is not None:
+                self.bus.subscribe(room_id)
+        room.add_client(client)
+        return room
+
+    def leave(self, room: Room, client: Client):
+        """Entferne Client aus einem Raum und räume leere Räume auf"""
+        room.remove_client(client)
+        self.discard_if_empty(room)
+
+    def discard_if_empty(self, room: Room):
+        if not room.clients and self._rooms.get(room.room_id) is room:
+            del self._rooms[room.room_id]
+            if self.bus is not None:
+                self.bus.unsubscribe(room.room_id)
+            traffic.info("Room %s removed. Active rooms: %d", room.room_id, len(self._rooms))
+
+    def stats(self) -> dict:
+        """Größe der Registry für Monitoring"""
+        return {
+            'rooms': len(self._rooms),
+            'clients': sum(len(room.clients) for room in self._rooms.values()),
+        }
 
 
 class SignalingServer:
-    def __init__(self, encrypted: bool = False):
-        self.rooms: Dict[str, Room] = {}
-        self.encrypted = encrypted
-        self.message_log = []
+    def __init__(self, ssl_context: Optional[ssl.SSLContext] = None, send_queue_size: int = 256,
+                 slow_client_policy: str = 'drop', send_timeout: float = 10.0,
+                 message_log: Optional[MessageLog] = None,
+                 analyzer: Optional[ExposureAnalyzer] = None, ice_batch_window: float = 0.0,
+                 bus: Optional[RoomBus] = None, replay_ttl: float = 30.0,
+                 keepalive: Optional[KeepalivePolicy] = None,
+                 admission: Optional[Admission] = None,
+                 console_log: Optional[ConsoleLog] = None,
+                 capture: Optional[TraceWriter] = None):
+        self.bus = bus
+        self.admission = admission if admission is not None else Admission()
+        self.rooms = RoomRegistry(bus, replay_ttl, self.admission)
+        # Mit SSLContext läuft der Server als wss://
+        self.ssl_context = ssl_context
+        self.encrypted = ssl_context is not None
+        self.message_log = message_log if message_log is not None else MessageLog()
+        self.analyzer = analyzer if analyzer is not None else ExposureAnalyzer()
+        # Mitschnitt für replay.py (None = aus)
+        self.capture = capture
+        self.send_queue_size = send_queue_size
+        self.slow_client_policy = slow_client_policy
+        self.send_timeout = send_timeout
+        # 0 = ICE-Kandidaten nicht bündeln
+        self.ice_batch_window = ice_batch_window
+        self.outbound = OutboundStats()
+        self.peers = PeerDirectory()
+        self.metrics = SignalingMetrics(
+            connections=lambda: self.rooms.stats()['clients'],
+            rooms=lambda: len(self.rooms),
+            room_sizes=lambda: [len(room.clients) for room in self.rooms],
+            queue_depth=lambda: self.outbound_stats()['queue_depth'],
+            dropped=lambda: self.outbound.dropped,
+        )
+        for metric in self.analyzer.metrics():
+            self.metrics.add(metric)
+        if bus is not None:
+            for metric in bus.metrics():
+                self.metrics.add(metric)
+        self.replayed = Counter('signaling_replayed_messages_total',
+                                'Buffered offers and candidates replayed to late joiners')
+        self.metrics.add(self.replayed)
+        for metric in self.peers.metrics():
+            self.metrics.add(metric)
+        # Pings übernimmt websockets, der Reaper prüft nur die Idle-Frist
+        self.keepalive = keepalive if keepalive is not None else KeepalivePolicy()
+        self.reaper = Reaper(self.keepalive, self.reap)
+        for metric in self.reaper.metrics():
+            self.metrics.add(metric)
+        for metric in self.admission.metrics():
+            self.metrics.add(metric)
+        if console_log is not None:
+            for metric in console_log.metrics():
+                self.metrics.add(metric)
         
-    def get_room(self, room_id: str) -> Room:
-        if room_id not in self.rooms:
-            self.rooms[room_id] = Room(room_id)
-        return self.rooms[room_id]
+    def get_room(self, room_id: str) -> Optional[Room]:
+        return self.rooms.get(room_id)
     
-    def log_message(self, msg_type: str, room_id: str, data: dict):
-        """Logge Nachrichten für Sicherheitsanalyse"""
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'type': msg_type,
-            'room': room_id,
-            'data': data
+    def outbound_stats(self) -> dict:
+        """Queue-Tiefen und verworfene Nachrichten aller Clients"""
+        depths = [client.queue_depth for room in self.rooms for client in room.clients.values()]
+        return {
+            'queue_depth': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'sent': self.outbound.sent,
+            'dropped': self.outbound.dropped,
+            'slow_disconnects': self.outbound.slow_disconnects,
         }
-        self.message_log.append(log_entry)
-        
-        # Ausgabe für Analyse
-        if msg_type in ['offer', 'answer']:
-            logger.warning(f"🔓 SDP {msg_type.upper()} übertragen (enthält Fingerprints!)")
-            if 'sdp' in data:
-                # Zeige Fingerprint falls vorhanden
-                sdp = data.get('sdp', '')
-                if 'fingerprint' in sdp:
-                    logger.warning(f"   Fingerprint detected in SDP")
-        elif msg_type == 'ice-candidate':
-            candidate = data.get('candidate', '')
-            if candidate:
-                logger.info(f"🌐 ICE Candidate: {candidate[:80]}...")
-                # Zeige IP-Adressen
-                if 'typ host' in candidate:
-                    logger.warning(f"   ⚠️  LOCAL IP exposed!")
-                elif 'typ srflx' in candidate:
-                    logger.warning(f"   ⚠️  PUBLIC IP exposed!")
     
-    async def handle_client(self, websocket: WebSocketServerProtocol, path: str):
+    def log_message(self, msg_type: str, room_id: str, envelope: Envelope):
+        """Logge Nachrichten für Sicherheitsanalyse"""
+        self.message_log.append(LogEntry(msg_type, room_id, envelope.raw))
+        # SDP/ICE-Auswertung läuft im Hintergrund, nicht vor dem Weiterleiten
+        self.analyzer.submit(msg_type, room_id, envelope.raw)
+    
+    async def handle_client(self, websocket: WebSocketServerProtocol, path: Optional[str] = None):
         """Handler für WebSocket-Verbindungen"""
-        room_id = "default"
-        room = self.get_room(room_id)
-        room.add_client(websocket)
+        if path is None:
+            # websockets >= 13 übergibt den Pfad nicht mehr separat
+            request = getattr(websocket, 'request', None)
+            path = request.path if request is not None else getattr(websocket, 'path', None)
+        room_id = room_from_path(path)
+        client = Client(websocket, self.outbound, self.send_queue_size,
+                        self.slow_client_policy, self.send_timeout, self.metrics,
+                        ice_batch=self.ice_batch_window > 0 and wants_ice_batch(path))
+        if self.keepalive.idle_timeout:
+            client.liveness = self.reaper.track(client)
+        client.limiter = self.admission.connection_limiter(time.perf_counter())
+        client.peer_id = self.peers.register(client)
+        room = self.rooms.join(room_id, client)
+        trace_id = self.capture.open(room_id, client.peer_id) if self.capture is not None else None
+        coalescer = None
+        if self.ice_batch_window > 0:
+            # ``room`` wird beim Aufruf gelesen - nach einem Raumwechsel der neue Raum
+            def deliver_candidates(messages, at):
+                room.broadcast_candidates(messages, client, at)
+                self.peers.routed.inc('broadcast', len(messages))
+                if self.bus is not None:
+                    for message in messages:
+                        self.bus.publish(room_id, message)
+
+            coalescer = CandidateCoalescer(self.ice_batch_window, deliver_candidates)
         
         try:
             # Willkommensnachricht
-            await websocket.send(json.dumps({
+            client.enqueue(json.dumps({
                 'type': 'welcome',
                 'encrypted': self.encrypted,
-                'clients_in_room': len(room.clients)
+                'room': room_id,
+                'peer_id': client.peer_id,
+                'peers': room.peer_ids(exclude=client),
+                'clients_in_room': len(room.clients),
+                'ice_batch': client.ice_batch
             }))
+            # Späte Teilnehmer erhalten das offene Offer samt Kandidaten
+            self.replayed.inc(amount=room.replay_to(client))
             
             async for message in websocket:
+                received_at = time.perf_counter()
+                if client.liveness is not None:
+                    client.liveness.last_message = time.monotonic()
+                if trace_id is not None:
+                    self.capture.message(trace_id, room_id, message if isinstance(message, str)
+                                         else message.decode('utf-8', 'replace'))
+                # Zugangskontrolle vor Parsen, Log und Weiterleitung
+                scope = self.admission.admit(client.limiter, room.limiter, len(message), received_at)
+                if scope is not None:
+                    if self.admission.close_on_throttle:
+                        logger.warning(f"Rate limit ({scope}) exceeded, disconnecting")
+                        self.admission.closed.inc(scope)
+                        await websocket.close(CLOSE_POLICY_VIOLATION, f"{scope} rate limit")
+                        break
+                    continue
                 try:
-                    data = json.loads(message)
-                    msg_type = data.get('type')
-                    
-                    logger.info(f"Received: {msg_type}")
-                    
-                    # Log für Sicherheitsanalyse
-                    self.log_message(msg_type, room_id, data)
-                    
-                    # Weiterleitung an andere Clients
-                    await room.broadcast(message, websocket)
-                    
-                except json.JSONDecodeError:
+                    # Nur den Umschlag lesen - die SDP bleibt undekodiert
+                    envelope = read_envelope(message if isinstance(message, str) else message.decode('utf-8'))
+                except (EnvelopeError, UnicodeDecodeError):
                     logger.error("Invalid JSON received")
+                    continue
+                msg_type = envelope.type
+                self.metrics.observe_message(msg_type, len(message))
+                
+                traffic.info("Received: %s", msg_type)
+                
+                if coalescer is not None:
+                    if msg_type == 'ice-candidate' and envelope.to is None:
+                        self.log_message(msg_type, room_id, envelope)
+                        forwarded = with_sender(envelope.raw, client.peer_id)
+                        room.record(msg_type, forwarded, client)
+                        coalescer.add(forwarded, received_at)
+                        continue
+                    # Reihenfolge erhalten: gesammelte Kandidaten zuerst
+                    coalescer.flush()
+                
+                if msg_type == 'join':
+                    # Raumwechsel über Nachricht
+                    new_room_id = envelope.room or DEFAULT_ROOM
+                    switched = new_room_id != room_id
+                    if switched:
+                        self.rooms.leave(room, client)
+                        room_id = new_room_id
+                        room = self.rooms.join(room_id, client)
+                    client.enqueue(json.dumps({
+                        'type': 'joined',
+                        'room': room_id,
+                        'peers': room.peer_ids(exclude=client),
+                        'clients_in_room': len(room.clients)
+                    }))
+                    if switched:
+                        self.replayed.inc(amount=room.replay_to(client))
+                    continue
+                
+                # Log für Sicherheitsanalyse
+                self.log_message(msg_type, room_id, envelope)
+                # Empfänger sehen den vom Server gesetzten Absender
+                forwarded = with_sender(envelope.raw, client.peer_id)
+                
+                if envelope.to is not None:
+                    # Gezielt an einen Peer - kein Broadcast; ein Answer beendet das Replay
+                    room.record(msg_type, forwarded, client, targeted=True)
+                    self.unicast(room, client, envelope.to, forwarded, received_at)
+                    continue
+                
+                room.record(msg_type, forwarded, client)
+                # Weiterleitung an andere Clients im selben Raum
+                room.broadcast(forwarded, client, received_at)
+                self.peers.routed.inc('broadcast')
+                if self.bus is not None:
+                    self.bus.publish(room_id, forwarded)
                     
-        except websockets.exceptions.ConnectionClosed:
-            logger.info("Client disconnected")
+        except websockets.exceptions.ConnectionClosed as e:
+            if e.sent is not None and e.sent.code == CLOSE_MESSAGE_TOO_BIG:
+                # websockets prüft max_size bereits beim Frame-Header
+                self.admission.frame_rejected()
+            traffic.info("Client disconnected")
         finally:
-            room.remove_client(websocket)
+            if coalescer is not None:
+                coalescer.flush()
+            self.reaper.forget(client.liveness)
+            self.peers.unregister(client.peer_id)
+            self.rooms.leave(room, client)
+            if trace_id is not None:
+                self.capture.close_connection(trace_id)
+            await client.close()
+    
+    async def process_request(self, connection_or_path, request):
+        """Beantworte ``GET /metrics`` und ``GET /exposure`` auf demselben Port wie WebSocket
+
+        Unterstützt die Signatur der neuen (``connection, request``) und der
+        alten websockets-API (``path, request_headers``).
+        """
+        legacy = isinstance(connection_or_path, str)
+        url = urlsplit(connection_or_path if legacy else request.path)
+        if url.path == '/metrics':
+            body, content_type = self.metrics.render(), CONTENT_TYPE
+        elif url.path == '/exposure':
+            body, content_type = json.dumps(self.exposure(url.query)), 'application/json'
+        else:
+            return None
+        if legacy:
+            return 200, [('Content-Type', content_type)], body.encode()
+        response = connection_or_path.respond(200, body)
+        response.headers['Content-Type'] = content_type
+        return response
+
+    def exposure(self, query: str = '') -> dict:
+        """Expositions-Zusammenfassung aller Räume oder eines Raums (``?room=``)"""
+        rooms = parse_qs(query).get('room')
+        if rooms:
+            summary = self.analyzer.summary(rooms[0])
+            summaries = [summary] if summary else []
+        else:
+            summaries = self.analyzer.summaries()
+        return {'rooms': summaries, 'queue_depth': self.analyzer.queue_depth,
+                'dropped': self.analyzer.dropped}
     
-    async def start(self, host: str = "localhost", port: int = 8080):
-        """Starte den Signalisierungsserver"""
+    def reap(self, client: Client, reason: str):
+        """Vom Reaper aufgerufen: Client ohne Nachricht innerhalb der Idle-Frist"""
+        logger.info(f"Closing {reason} client")
+        asyncio.ensure_future(client.websocket.close(1001, f"{reason} timeout"))
+
+    def unicast(self, room: Room, sender: Client, peer_id: str, message: str,
+                received_at: Optional[float] = None):
+        """Stelle eine Nachricht mit ``to`` nur dem adressierten Peer zu
+
+        Der Empfänger muss im selben Raum sein. Ist er hier nicht verbunden,
+        geht die Nachricht an die anderen Worker; ohne Bus erhält der
+        Absender ``peer-unavailable``.
+        """
+        target = room.clients.get(peer_id)
+        if target is not None:
+            target.enqueue(message, received_at)
+            self.peers.routed.inc('unicast')
+        elif self.bus is not None and self.peers.get(peer_id) is None:
+            self.bus.publish(room.room_id, message)
+            self.peers.routed.inc('remote')
+        else:
+            self.peers.routed.inc('unavailable')
+            sender.enqueue(json.dumps(peer_unavailable(peer_id)))
+
+    def deliver_remote(self, room_id: str, message: str):
+        """Nachricht eines anderen Workers an die lokalen Clients des Raums"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        if '"to"' in message:
+            try:
+                peer_id = read_envelope(message).to
+            except EnvelopeError:
+                return
+            if peer_id is not None:
+                # Unicast: nur zustellen, wenn der Peer hier verbunden ist
+                target = room.clients.get(peer_id)
+                if target is not None:
+                    target.enqueue(message)
+                return
+        room.broadcast(message, None)
+
+    async def start(self, host: str = "localhost", port: int = 8080, sock=None):
+        """Starte den Signalisierungsserver
+
+        ``sock`` ist ein bereits gebundener Socket (Worker-Modus).
+        """
         mode = "VERSCHLÜSSELT (WSS)" if self.encrypted else "⚠️  UNVERSCHLÜSSELT (WS)"
         logger.info(f"=" * 60)
         logger.info(f"WebRTC Signalisierungsserver - {mode}")
         logger.info(f"=" * 60)
-        logger.info(f"Listening on: ws://{host}:{port}")
+        logger.info(f"Listening on: {'wss' if self.encrypted else 'ws'}://{host}:{port}")
         logger.info(f"Encryption: {'TLS' if self.encrypted else 'NONE (Sicherheitsrisiko!)'}")
+        scheme = 'https' if self.encrypted else 'http'
+        logger.info(f"Metrics: {scheme}://{host}:{port}/metrics")
+        logger.info(f"Exposure: {scheme}://{host}:{port}/exposure")
         logger.info(f"=" * 60)
         
-        async with websockets.serve(self.handle_client, host, port):
-            await asyncio.Future()  # Run forever
+        if self.bus is not None:
+            await self.bus.start(self.deliver_remote)
+        address = {'sock': sock} if sock is not None else {'host': host, 'port': port}
+        reaper = asyncio.ensure_future(self.reaper.run()) if self.keepalive.idle_timeout else None
+        try:
+            async with websockets.serve(self.handle_client, process_request=self.process_request,
+                                        max_size=self.admission.max_frame_size or None,
+                                        ssl=self.ssl_context,
+                                        **self.keepalive.websockets_options(), **address):
+                await asyncio.Future()  # Run forever
+        finally:
+            if reaper is not None:
+                reaper.cancel()
+            if self.bus is not None:
+                await self.bus.close()
 
 
-async def main():
+async def run_server(args, worker_id: int = 0, sock=None,
+                     ssl_context: Optional[ssl.SSLContext] = None):
+    """Ein Serverprozess (bzw. ein Worker bei ``--workers`` > 1)"""
+    prefix = f'signaling-w{worker_id}' if args.workers > 1 else 'signaling'
+    # Pro Prozess: der Writer-Thread des Queue-Modus überlebt keinen Fork
+    console_log = console_log_from_args(args)
+    server = SignalingServer(ssl_context=ssl_context,
+                             send_queue_size=args.send_queue,
+                             slow_client_policy=args.slow_client_policy,
+                             send_timeout=args.send_timeout,
+                             message_log=message_log_from_args(args, prefix),
+                             analyzer=analyzer_from_args(args),
+                             ice_batch_window=args.ice_batch_window / 1000.0,
+                             bus=bus_from_args(args, worker_id, args.port),
+                             replay_ttl=args.replay_ttl,
+                             keepalive=keepalive_from_args(args),
+                             admission=admission_from_args(args),
+                             console_log=console_log,
+                             capture=capture_from_args(args, 'websockets',
+                                                       f'.w{worker_id}' if args.workers > 1 else ''))
+    
+    try:
+        await server.start(host=args.host, port=args.port, sock=sock)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("\n" + "=" * 60)
+        logger.info("Server stopped")
+        logger.info(f"Total messages logged: {server.message_log.total}")
+        logger.info(f"Outbound: {server.outbound_stats()}")
+        logger.info(f"Keepalive: {server.reaper.stats()}")
+        logger.info(f"Console log: {console_log.stats()}")
+        if server.capture is not None:
+            logger.info(f"Capture: {server.capture.stats()}")
+        for summary in server.analyzer.summaries():
+            logger.info(f"Exposure {summary['room']}: {summary['candidates']}, "
+                        f"{summary['distinct_ips']} distinct IPs")
+        logger.info("=" * 60)
+    finally:
+        server.message_log.close()
+        server.analyzer.close()
+        if server.capture is not None:
+            server.capture.close()
+        console_log.close()
+
+
+def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='WebRTC Signaling Server')
     parser.add_argument('--encrypted', action='store_true', 
-                       help='Enable TLS encryption (requires cert/key)')
+                       help=f'Enable TLS (wss://); without --tls-cert uses {DEFAULT_CERT}')
     parser.add_argument('--host', default='localhost', 
                        help='Host to bind to (default: localhost)')
     parser.add_argument('--port', type=int, default=8080, 
                        help='Port to listen on (default: 8080)')
+    parser.add_argument('--send-queue', type=int, default=256,
+                       help='Max queued outbound messages per client (default: 256)')
+    parser.add_argument('--slow-client-policy', choices=SLOW_CLIENT_POLICIES, default='drop',
+                       help='What to do when a client queue overflows (default: drop)')
+    parser.add_argument('--send-timeout', type=float, default=10.0,
+                       help='Seconds a single send may stall before disconnect policy applies')
+    parser.add_argument('--ice-batch-window', type=float, default=0.0,
+                       help='Coalesce ICE candidates per sender for N ms (default: 0 = off); '
+                            'clients opt in with ?ice_batch=1')
+    add_log_arguments(parser)
+    add_analysis_arguments(parser)
+    parser.add_argument('--replay-ttl', type=float, default=30.0,
+                       help='Seconds an unanswered offer is replayed to late joiners (0 = off)')
+    add_keepalive_arguments(parser)
+    add_admission_arguments(parser)
+    add_bus_arguments(parser)
+    add_tls_arguments(parser)
+    add_console_log_arguments(parser)
+    add_capture_arguments(parser)
     
     args = parser.parse_args()
     
-    if args.encrypted:
-        logger.warning("TLS mode requested but not implemented in this demo")
-        logger.warning("For production, use wss:// with proper certificates")
-    
-    server = SignalingServer(encrypted=args.encrypted)
+    if args.encrypted and not args.tls_cert:
+        if not os.path.exists(DEFAULT_CERT):
+            parser.error(f"--encrypted needs --tls-cert/--tls-key or {DEFAULT_CERT} "
+                         "(create one with: python tls.py selfsigned)")
+        args.tls_cert, args.tls_key = DEFAULT_CERT, args.tls_key or DEFAULT_KEY
+    # Vor dem Fork erzeugen: alle Worker teilen den Ticket-Schlüssel
+    ssl_context = tls_from_args(args)
     
+    if args.workers > 1:
+        # Jeder Worker bekommt einen eigenen Socket derselben SO_REUSEPORT-Gruppe
+        raise SystemExit(run_workers(
+            args.host, args.port, args.workers,
+            lambda worker_id, sock: asyncio.run(run_server(args, worker_id, sock, ssl_context)),
+            backlog=args.backlog))
     try:
-        await server.start(host=args.host, port=args.port)
+        asyncio.run(run_server(args, ssl_context=ssl_context))
     except KeyboardInterrupt:
-        logger.info("\n" + "=" * 60)
-        logger.info("Server stopped")
-        logger.info(f"Total messages logged: {len(server.message_log)}")
-        logger.info("=" * 60)
+        pass
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
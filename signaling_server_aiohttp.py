@@ -4,11 +4,24 @@ WebRTC Signalisierungsserver - Alternative Implementierung
 Verwendet aiohttp für WebSocket ohne externe websockets-Bibliothek
 """
 
-from aiohttp import web
-import json
+from aiohttp import WSCloseCode, web
+import asyncio
 import logging
-from datetime import datetime
-from typing import Set
+import time
+from typing import Dict, Optional
+
+from message_log import LogEntry, MessageLog, add_log_arguments, message_log_from_args
+from envelope import Envelope, EnvelopeError, read_envelope, with_sender
+from metrics import CONTENT_TYPE, Counter, SignalingMetrics
+from analysis import ExposureAnalyzer, add_analysis_arguments, analyzer_from_args
+from keepalive import KeepalivePolicy, Reaper, add_keepalive_arguments, keepalive_from_args
+from admission import (CLOSE_MESSAGE_TOO_BIG, CLOSE_POLICY_VIOLATION, Admission,
+                       add_admission_arguments, admission_from_args)
+from peers import DEFAULT_ROOM, PeerDirectory, peer_unavailable
+from tls import add_tls_arguments, tls_from_args
+from console_log import ConsoleLog, add_console_log_arguments, console_log_from_args, traffic_logger
+from capture import TraceWriter, add_capture_arguments, capture_from_args
+from signaling_server_stdlib import encode_frame
 
 # Logging-Konfiguration
 logging.basicConfig(
@@ -16,113 +29,294 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Zeilen pro Nachricht/Verbindung - mit --traffic-log-sample/-rate sampelbar
+traffic = traffic_logger(__name__)
 
 
 class SignalingServer:
-    def __init__(self):
-        self.clients: Set[web.WebSocketResponse] = set()
-        self.message_log = []
+    def __init__(self, message_log: Optional[MessageLog] = None, compress: bool = False,
+                 max_client_buffer: int = 4 * 1024 * 1024,
+                 analyzer: Optional[ExposureAnalyzer] = None,
+                 keepalive: Optional[KeepalivePolicy] = None,
+                 admission: Optional[Admission] = None, encrypted: bool = False,
+                 console_log: Optional[ConsoleLog] = None,
+                 capture: Optional[TraceWriter] = None):
+        # WebSocket -> Transport der Verbindung (für die Puffer-Prüfung im Fan-out)
+        self.clients: Dict[web.WebSocketResponse, Optional[asyncio.Transport]] = {}
+        self.message_log = message_log if message_log is not None else MessageLog()
+        self.analyzer = analyzer if analyzer is not None else ExposureAnalyzer()
+        # Mitschnitt für replay.py (None = aus)
+        self.capture = capture
+        self.compress = compress
+        self.encrypted = encrypted
+        self.max_client_buffer = max_client_buffer
+        self.metrics = SignalingMetrics(
+            connections=lambda: len(self.clients),
+            rooms=lambda: 1 if self.clients else 0,
+            room_sizes=lambda: [len(self.clients)] if self.clients else [],
+        )
+        # Vom Fan-out entfernte Clients - keine verworfenen Nachrichten
+        self.removed = Counter('signaling_fanout_removed_clients_total',
+                               'Clients removed during fan-out', 'reason')
+        self.metrics.add(self.removed)
+        for metric in self.analyzer.metrics():
+            self.metrics.add(metric)
+        self.peers = PeerDirectory()
+        for metric in self.peers.metrics():
+            self.metrics.add(metric)
+        # Pings übernimmt der aiohttp-Heartbeat, der Reaper prüft nur die Idle-Frist
+        self.keepalive = keepalive if keepalive is not None else KeepalivePolicy()
+        self.reaper = Reaper(self.keepalive, self.reap)
+        for metric in self.reaper.metrics():
+            self.metrics.add(metric)
+        self.admission = admission if admission is not None else Admission()
+        # Alle Clients teilen sich einen Raum und damit ein Raum-Limit
+        self.room_limiter = self.admission.room_limiter(time.perf_counter())
+        for metric in self.admission.metrics():
+            self.metrics.add(metric)
+        self.console_log = console_log
+        if console_log is not None:
+            for metric in console_log.metrics():
+                self.metrics.add(metric)
         
-    def log_message(self, msg_type: str, data: dict):
+    def log_message(self, msg_type: str, envelope: Envelope):
         """Logge Nachrichten für Sicherheitsanalyse"""
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'type': msg_type,
-            'data': data
-        }
-        self.message_log.append(log_entry)
-        
-        # Ausgabe für Analyse
-        if msg_type in ['offer', 'answer']:
-            logger.warning(f"🔓 SDP {msg_type.upper()} übertragen (enthält Fingerprints!)")
-            if 'sdp' in data:
-                sdp = data.get('sdp', '')
-                if 'fingerprint' in sdp:
-                    logger.warning(f"   Fingerprint detected in SDP")
-        elif msg_type == 'ice-candidate':
-            candidate = data.get('candidate', '')
-            if candidate:
-                logger.info(f"🌐 ICE Candidate: {candidate[:80]}...")
-                if 'typ host' in candidate:
-                    logger.warning(f"   ⚠️  LOCAL IP exposed!")
-                elif 'typ srflx' in candidate:
-                    logger.warning(f"   ⚠️  PUBLIC IP exposed!")
+        self.message_log.append(LogEntry(msg_type, DEFAULT_ROOM, envelope.raw))
+        # SDP/ICE-Auswertung läuft im Hintergrund, nicht vor dem Weiterleiten
+        self.analyzer.submit(msg_type, DEFAULT_ROOM, envelope.raw)
     
+    async def fanout(self, message: str, sender: web.WebSocketResponse):
+        """Sende Nachricht an alle anderen Clients
+
+        Der Frame wird einmal gebaut und in den Transport jeder
+        unkomprimierten Verbindung geschrieben (``request.transport``).
+        aiohttp schreibt unkomprimierte Frames ebenfalls synchron und in
+        einem Stück, die Frames verschiedener Sender verzahnen sich also
+        nicht. Komprimierte Verbindungen haben eigenen zlib-Zustand und
+        senden parallel über ``send_str``, damit ein langsamer Client die
+        anderen nicht aufhält. Geschlossene, fehlerhafte oder zu langsame
+        Clients (mehr als ``max_client_buffer`` Bytes im Puffer) werden aus
+        der Menge entfernt und in ``removed`` gezählt.
+        """
+        frame = None
+        compressed = []
+        failed = []
+        for client, transport in list(self.clients.items()):
+            if client is sender:
+                continue
+            if client.closed or transport is None or transport.is_closing():
+                failed.append((client, 'closed'))
+            elif transport.get_write_buffer_size() > self.max_client_buffer:
+                failed.append((client, 'slow'))
+            elif client.compress:
+                compressed.append(client)
+            else:
+                if frame is None:
+                    frame = encode_frame(message.encode('utf-8'))
+                transport.write(frame)
+
+        if compressed:
+            results = await asyncio.gather(*(client.send_str(message) for client in compressed),
+                                           return_exceptions=True)
+            failed.extend((client, 'error') for client, result in zip(compressed, results)
+                          if isinstance(result, Exception))
+
+        for client, reason in failed:
+            self.removed.inc(reason)
+            self.clients.pop(client, None)
+            if not client.closed:
+                asyncio.ensure_future(client.close())
+            logger.info(f"Client entfernt ({reason}). Remaining clients: {len(self.clients)}")
+
+    async def unicast(self, message: str, sender: web.WebSocketResponse, peer_id: str):
+        """Sende Nachricht nur an den adressierten Peer (``to``)"""
+        target = self.peers.get(peer_id)
+        if target is None or target.closed:
+            self.peers.routed.inc('unavailable')
+            await sender.send_json(peer_unavailable(peer_id))
+            return
+        self.peers.routed.inc('unicast')
+        try:
+            await target.send_str(message)
+        except Exception as e:
+            logger.info(f"Unicast to {peer_id} failed: {e}")
+
+    def reap(self, ws: web.WebSocketResponse, reason: str):
+        """Vom Reaper aufgerufen: Client ohne Nachricht innerhalb der Idle-Frist"""
+        logger.info(f"Closing {reason} client")
+        asyncio.ensure_future(ws.close(code=WSCloseCode.GOING_AWAY,
+                                       message=f"{reason} timeout".encode()))
+
     async def websocket_handler(self, request):
         """WebSocket-Verbindungs-Handler"""
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(compress=self.compress, max_msg_size=self.admission.max_frame_size,
+                                   **self.keepalive.aiohttp_options())
         await ws.prepare(request)
+        liveness = self.reaper.track(ws) if self.keepalive.idle_timeout else None
+        limiter = self.admission.connection_limiter(time.perf_counter())
+        peer_id = self.peers.register(ws)
+        trace_id = self.capture.open(DEFAULT_ROOM, peer_id) if self.capture is not None else None
         
-        self.clients.add(ws)
-        logger.info(f"Client verbunden. Total clients: {len(self.clients)}")
+        self.clients[ws] = request.transport
+        traffic.info("Client verbunden. Total clients: %d", len(self.clients))
         
         # Willkommensnachricht
         await ws.send_json({
             'type': 'welcome',
-            'encrypted': False,
+            'encrypted': self.encrypted,
+            'peer_id': peer_id,
+            'peers': self.peers.others(peer_id),
             'clients_in_room': len(self.clients)
         })
         
         try:
             async for msg in ws:
                 if msg.type == web.WSMsgType.TEXT:
+                    received_at = time.perf_counter()
+                    if liveness is not None:
+                        liveness.last_message = time.monotonic()
+                    if trace_id is not None:
+                        self.capture.message(trace_id, DEFAULT_ROOM, msg.data)
+                    # Zugangskontrolle vor Parsen, Log und Weiterleitung
+                    scope = self.admission.admit(limiter, self.room_limiter, len(msg.data), received_at)
+                    if scope is not None:
+                        if self.admission.close_on_throttle:
+                            logger.warning(f"Rate limit ({scope}) exceeded, disconnecting")
+                            self.admission.closed.inc(scope)
+                            await ws.close(code=CLOSE_POLICY_VIOLATION,
+                                           message=f"{scope} rate limit".encode())
+                            break
+                        continue
                     try:
-                        data = json.loads(msg.data)
-                        msg_type = data.get('type')
+                        # Nur den Umschlag lesen - die SDP bleibt undekodiert
+                        envelope = read_envelope(msg.data)
+                        msg_type = envelope.type
+                        self.metrics.observe_message(msg_type, len(msg.data))
+                        
+                        traffic.info("Received: %s", msg_type)
+                        self.log_message(msg_type, envelope)
                         
-                        logger.info(f"Received: {msg_type}")
-                        self.log_message(msg_type, data)
+                        # Empfänger sehen den vom Server gesetzten Absender
+                        forwarded = with_sender(msg.data, peer_id)
+                        if envelope.to is not None:
+                            await self.unicast(forwarded, ws, envelope.to)
+                        else:
+                            # Broadcast an alle anderen Clients
+                            await self.fanout(forwarded, ws)
+                            self.peers.routed.inc('broadcast')
+                        self.metrics.forward_latency.observe(time.perf_counter() - received_at)
                         
-                        # Broadcast an alle anderen Clients
-                        for client in self.clients:
-                            if client != ws and not client.closed:
-                                try:
-                                    await client.send_str(msg.data)
-                                except:
-                                    pass
-                                    
-                    except json.JSONDecodeError:
+                    except EnvelopeError:
                         logger.error("Invalid JSON received")
                         
                 elif msg.type == web.WSMsgType.ERROR:
+                    if getattr(ws.exception(), 'code', None) == CLOSE_MESSAGE_TOO_BIG:
+                        # aiohttp prüft max_msg_size bereits beim Frame-Header
+                        self.admission.frame_rejected()
                     logger.error(f'WebSocket error: {ws.exception()}')
                     
         except Exception as e:
             logger.error(f"Error in websocket handler: {e}")
         finally:
-            self.clients.discard(ws)
-            logger.info(f"Client getrennt. Remaining clients: {len(self.clients)}")
+            self.reaper.forget(liveness)
+            self.peers.unregister(peer_id)
+            self.clients.pop(ws, None)
+            if trace_id is not None:
+                self.capture.close_connection(trace_id)
+            traffic.info("Client getrennt. Remaining clients: %d", len(self.clients))
             
         return ws
 
+    async def metrics_handler(self, request):
+        """Prometheus-Metriken"""
+        return web.Response(body=self.metrics.render().encode(),
+                            headers={'Content-Type': CONTENT_TYPE})
+
+    async def exposure_handler(self, request):
+        """Expositions-Zusammenfassung der Sicherheitsanalyse"""
+        summary = self.analyzer.summary(DEFAULT_ROOM)
+        return web.json_response({'rooms': [summary] if summary else [],
+                                  'queue_depth': self.analyzer.queue_depth,
+                                  'dropped': self.analyzer.dropped})
+
+
+async def create_app(message_log: Optional[MessageLog] = None, compress: bool = False,
+                     analyzer: Optional[ExposureAnalyzer] = None,
+                     keepalive: Optional[KeepalivePolicy] = None,
+                     admission: Optional[Admission] = None, encrypted: bool = False,
+                     console_log: Optional[ConsoleLog] = None,
+                     capture: Optional[TraceWriter] = None):
+    """Erstelle aiohttp Application
 
-async def create_app():
-    """Erstelle aiohttp Application"""
-    server = SignalingServer()
+    ``encrypted`` meldet den Clients nur TLS - den ``SSLContext`` übergibt
+    der Aufrufer an ``web.run_app``.
+    """
+    server = SignalingServer(message_log, compress=compress, analyzer=analyzer,
+                             keepalive=keepalive, admission=admission, encrypted=encrypted,
+                             console_log=console_log, capture=capture)
     app = web.Application()
+    if server.keepalive.idle_timeout:
+        app.cleanup_ctx.append(lambda app: _run_reaper(server))
+    app.on_cleanup.append(lambda app: _close_log(server))
     app.router.add_get('/ws', server.websocket_handler)
+    app.router.add_get('/metrics', server.metrics_handler)
+    app.router.add_get('/exposure', server.exposure_handler)
     app.router.add_get('/', lambda r: web.Response(text="WebRTC Signaling Server"))
     return app
 
 
+async def _run_reaper(server: SignalingServer):
+    task = asyncio.ensure_future(server.reaper.run())
+    yield
+    task.cancel()
+
+
+async def _close_log(server: SignalingServer):
+    server.message_log.close()
+    server.analyzer.close()
+    if server.capture is not None:
+        logger.info(f"Capture: {server.capture.stats()}")
+        server.capture.close()
+    if server.console_log is not None:
+        server.console_log.close()
+
+
 def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='WebRTC Signaling Server (aiohttp)')
     parser.add_argument('--host', default='localhost', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--compress', action='store_true',
+                        help='Negotiate permessage-deflate (compressed clients get their own '
+                             'frame instead of the shared pre-encoded one)')
+    add_log_arguments(parser)
+    add_analysis_arguments(parser)
+    add_keepalive_arguments(parser)
+    add_admission_arguments(parser)
+    add_tls_arguments(parser)
+    add_console_log_arguments(parser)
+    add_capture_arguments(parser)
     
     args = parser.parse_args()
+    console_log = console_log_from_args(args)
+    ssl_context = tls_from_args(args)
+    ws_scheme, http_scheme = ('wss', 'https') if ssl_context else ('ws', 'http')
     
     logger.info("=" * 60)
     logger.info("WebRTC Signalisierungsserver - aiohttp WebSocket")
     logger.info("=" * 60)
-    logger.info(f"Listening on: ws://{args.host}:{args.port}/ws")
-    logger.info(f"HTTP Status: http://{args.host}:{args.port}/")
+    logger.info(f"Listening on: {ws_scheme}://{args.host}:{args.port}/ws")
+    logger.info(f"HTTP Status: {http_scheme}://{args.host}:{args.port}/")
+    logger.info(f"Metrics: {http_scheme}://{args.host}:{args.port}/metrics")
+    logger.info(f"Exposure: {http_scheme}://{args.host}:{args.port}/exposure")
     logger.info("=" * 60)
     
-    app = create_app()
-    web.run_app(app, host=args.host, port=args.port, print=lambda x: None)
+    app = create_app(message_log_from_args(args), compress=args.compress,
+                     analyzer=analyzer_from_args(args), keepalive=keepalive_from_args(args),
+                     admission=admission_from_args(args), encrypted=ssl_context is not None,
+                     console_log=console_log, capture=capture_from_args(args, 'aiohttp'))
+    web.run_app(app, host=args.host, port=args.port, ssl_context=ssl_context, print=lambda x: None)
 
 
 if __name__ == "__main__":
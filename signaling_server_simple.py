@@ -1,16 +1,38 @@
 #!/usr/bin/env python3
 """
 WebRTC Signalisierungsserver (Vereinfachte Version ohne externe Dependencies)
-Verwendet nur Standard-Python-Bibliotheken
+Verwendet nur Standard-Python-Bibliotheken.
+
+Jede Verbindung ist ein ``asyncio.BufferedProtocol``: Die Event-Loop liest
+per ``recv_into`` direkt in einen wiederverwendeten Puffer, Frames werden
+inkrementell daraus geparst. Ausgehende Frames sammelt der Server pro
+Verbindung und schreibt sie einmal pro Loop-Durchlauf mit ``writelines``.
+Frame-Kodierung, permessage-deflate und Handshake stammen aus
+``signaling_server_stdlib.py``; Räume wie im websockets-Server
+(``/ws/<raum>``, ``?room=<raum>``).
 """
 
 import asyncio
-import json
 import logging
-from datetime import datetime
-from typing import Dict, Set
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-import threading
+import time
+from itertools import islice
+from typing import Dict, List, Optional
+
+from envelope import Envelope, EnvelopeError, dumps, read_envelope, with_sender
+from message_log import LogEntry, MessageLog, add_log_arguments, message_log_from_args
+from analysis import ExposureAnalyzer, add_analysis_arguments, analyzer_from_args
+from console_log import add_console_log_arguments, console_log_from_args, traffic_logger
+from capture import TraceWriter, add_capture_arguments, capture_from_args
+from deflate import DeflateError, add_deflate_arguments, deflate_config_from_args, negotiate
+from keepalive import KeepalivePolicy, Reaper, add_keepalive_arguments, keepalive_from_args
+from peers import WELCOME_PEERS, PeerDirectory, peer_unavailable, room_from_path
+from tls import add_tls_arguments, tls_from_args
+from admission import (CLOSE_MESSAGE_TOO_BIG, CLOSE_POLICY_VIOLATION, Admission,
+                       add_admission_arguments, admission_from_args)
+from signaling_server_stdlib import (DEFAULT_BACKLOG, MAX_HANDSHAKE_SIZE, MAX_WRITE_BUFFER,
+                                     OP_BINARY, OP_CLOSE, OP_PING, OP_PONG, OP_TEXT, PING_FRAME,
+                                     FrameTooLarge, HandshakeError, HandshakeRequest, build_frame,
+                                     close_frame, encode_frame, handshake_response, parse_frame)
 
 # Logging-Konfiguration
 logging.basicConfig(
@@ -18,134 +40,415 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Zeilen pro Nachricht/Verbindung - mit --traffic-log-sample/-rate sampelbar
+traffic = traffic_logger(__name__)
+
+# Gemeinsamer Lesepuffer aller Verbindungen (nur ein Protokoll liest gleichzeitig)
+READ_BUFFER_SIZE = 256 * 1024
+# Startgröße des eigenen Puffers für einen unvollständigen Frame
+PARTIAL_BUFFER_SIZE = 4096
+
+
+class WebSocketProtocol(asyncio.BufferedProtocol):
+    """Eine WebSocket-Verbindung
+
+    Ohne angefangenen Frame liest die Verbindung in den gemeinsamen Puffer
+    des Servers und belegt selbst keinen Lesepuffer. Bleibt ein
+    unvollständiger Rest (Handshake oder Frame), wird er in einen eigenen
+    Puffer kopiert, der bis zum vollständigen Frame wächst; Folgedaten
+    landen per ``recv_into`` direkt dahinter.
+    """
+
+    __slots__ = ('server', 'transport', 'addr', 'partial', 'filled', 'handshake_done', 'closing',
+                 'outbox', 'room', 'peer_id', 'deflate', 'liveness', 'limiter', 'trace_id')
+
+    def __init__(self, server: 'SimpleSignalingServer'):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.addr = None
+        # Eigener Puffer mit ``filled`` Bytes eines angefangenen Frames, sonst None
+        self.partial: Optional[bytearray] = None
+        self.filled = 0
+        self.handshake_done = False
+        self.closing = False
+        self.outbox: List[bytes] = []
+        self.room = None
+        self.peer_id: Optional[str] = None
+        self.deflate = None
+        self.liveness = None
+        self.limiter = None
+        self.trace_id: Optional[int] = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info('peername')
+        self.liveness = self.server.reaper.track(self, established=False)
+
+    def connection_lost(self, exc):
+        self.closing = True
+        self.outbox.clear()
+        self.server.reaper.forget(self.liveness)
+        if self.handshake_done:
+            self.server.remove_client(self)
+
+    def get_buffer(self, sizehint):
+        if self.partial is None:
+            return self.server.read_view
+        if self.filled == len(self.partial):
+            grown = bytearray(len(self.partial) * 2)
+            grown[:self.filled] = self.partial
+            self.partial = grown
+        return memoryview(self.partial)[self.filled:]
 
+    def buffer_updated(self, nbytes):
+        if self.closing:
+            return
+        self.liveness.last_seen = time.monotonic()
+        if self.partial is None:
+            buf, end = self.server.read_buffer, nbytes
+        else:
+            self.filled += nbytes
+            buf, end = self.partial, self.filled
+        data = memoryview(buf)[:end]
+        pos = 0
+        if not self.handshake_done:
+            pos = self.do_handshake(buf, end)
+        if self.handshake_done:
+            pos = self.process_frames(data, pos)
+        rest = end - pos
+        if self.closing or not rest:
+            self.partial = None
+            self.filled = 0
+        elif self.partial is None or pos:
+            # Rest erst kopieren: Quelle und Ziel können im selben Puffer überlappen
+            tail = bytes(data[pos:])
+            if self.partial is None:
+                self.partial = bytearray(max(PARTIAL_BUFFER_SIZE, 2 * rest))
+            # Rest an den Anfang (gleiche Länge, der Puffer bleibt)
+            self.partial[:rest] = tail
+            self.filled = rest
 
-class WebSocketProtocol:
-    """Vereinfachter WebSocket-Handler"""
-    
-    def __init__(self, reader, writer):
-        self.reader = reader
-        self.writer = writer
-        self.closed = False
-        
-    async def recv(self):
-        """Empfange Nachricht"""
+    def do_handshake(self, buf, end) -> int:
+        """HTTP-Upgrade auswerten; liefert die Zahl verbrauchter Bytes"""
+        header_end = buf.find(b'\r\n\r\n', 0, end)
         try:
-            data = await self.reader.read(4096)
-            if not data:
-                return None
-            return data.decode('utf-8')
-        except:
-            return None
-    
-    async def send(self, message):
-        """Sende Nachricht"""
-        if not self.closed:
+            if header_end < 0 and end > MAX_HANDSHAKE_SIZE or header_end > MAX_HANDSHAKE_SIZE:
+                raise HandshakeError("Handshake too large", 431)
+            if header_end < 0:
+                return 0
+            request = HandshakeRequest(bytes(buf[:header_end]))
+        except HandshakeError as e:
+            logger.info(f"Rejected handshake from {self.addr}: {e}")
+            self.send_raw(e.response())
+            self.flush()
+            self.closing = True
+            self.transport.close()
+            return end
+        extensions = self.server.negotiate_deflate(request)
+        if extensions:
+            self.deflate = extensions[1]
+        self.send_raw(handshake_response(request.key, extensions[0] if extensions else None))
+        self.handshake_done = True
+        self.server.add_client(self, room_from_path(request.path))
+        return header_end + 4
+
+    def process_frames(self, data: memoryview, pos: int) -> int:
+        """Alle vollständigen Frames ab ``pos`` verarbeiten; liefert die neue Position"""
+        server = self.server
+        max_size = server.admission.max_frame_size
+        end = len(data)
+        while pos < end and not self.closing:
             try:
-                self.writer.write(message.encode('utf-8'))
-                await self.writer.drain()
-            except:
-                self.closed = True
-    
-    async def close(self):
-        """Schließe Verbindung"""
-        self.closed = True
-        try:
-            self.writer.close()
-            await self.writer.wait_closed()
-        except:
-            pass
+                frame = parse_frame(data[pos:], max_size)
+            except FrameTooLarge as e:
+                if server.admission.oversized(e.args[0]):
+                    logger.warning(f"Frame of {e.args[0]} bytes from {self.addr}, disconnecting")
+                self.close_with(CLOSE_MESSAGE_TOO_BIG, "frame too large")
+                return end
+            if frame is None:
+                break
+            opcode, payload, consumed, compressed = frame
+            pos += consumed
+            if opcode == OP_CLOSE:
+                self.close_with(None, '')
+                return end
+            if opcode == OP_PING:
+                self.send_raw(encode_frame(payload, OP_PONG))
+            elif opcode == OP_PONG:
+                server.reaper.pongs += 1
+            elif opcode in (OP_TEXT, OP_BINARY):
+                self.liveness.last_message = self.liveness.last_seen
+                try:
+                    if compressed:
+                        if self.deflate is None:
+                            raise DeflateError("RSV1 set without permessage-deflate")
+                        payload = self.deflate.decompress(payload)
+                    message = payload.decode('utf-8')
+                except DeflateError as e:
+                    logger.warning(f"Invalid compressed frame from {self.addr}: {e}")
+                    self.abort()
+                    return end
+                except UnicodeDecodeError:
+                    continue
+                server.handle_message(message, self)
+        return pos
+
+    def send_frame(self, message: str):
+        self.send_payload(message.encode('utf-8'), {})
+
+    def send_payload(self, payload: bytes, frames: dict):
+        self.send_raw(build_frame(self.deflate, payload, frames))
+
+    def send_raw(self, data: bytes):
+        """Frame für den nächsten ``writelines`` dieser Verbindung vormerken"""
+        if self.closing:
+            return
+        if not self.outbox:
+            self.server.schedule_flush(self)
+        self.outbox.append(data)
+
+    def flush(self):
+        if not self.outbox:
+            return
+        if self.transport.is_closing():
+            self.outbox.clear()
+            return
+        self.transport.writelines(self.outbox)
+        self.outbox.clear()
+        if self.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            logger.warning(f"Write buffer full for {self.addr}, disconnecting")
+            self.abort()
+
+    def close_with(self, code: Optional[int], reason: str):
+        """Close-Frame senden (``None``: leeres Echo) und nach dem Schreiben schließen"""
+        self.send_raw(close_frame(code, reason) if code is not None else encode_frame(b"", OP_CLOSE))
+        self.flush()
+        self.closing = True
+        self.transport.close()
+
+    def abort(self):
+        self.closing = True
+        self.outbox.clear()
+        self.transport.abort()
+
+
+class Room:
+    """Verbindungen eines Raums in Beitrittsreihenfolge"""
+
+    __slots__ = ('room_id', 'clients', 'limiter')
+
+    def __init__(self, room_id: str, limiter=None):
+        self.room_id = room_id
+        self.clients: Dict[str, WebSocketProtocol] = {}
+        self.limiter = limiter
 
 
 class SimpleSignalingServer:
-    """Einfacher HTTP-basierter Signalisierungsserver"""
-    
-    def __init__(self):
-        self.clients = []
-        self.message_log = []
-        
-    def log_message(self, msg_type: str, data: dict):
+    """Signalisierungsserver auf ``asyncio`` ohne externe Abhängigkeiten"""
+
+    def __init__(self, message_log: Optional[MessageLog] = None,
+                 analyzer: Optional[ExposureAnalyzer] = None, deflate=None,
+                 keepalive: Optional[KeepalivePolicy] = None,
+                 admission: Optional[Admission] = None, encrypted: bool = False,
+                 capture: Optional[TraceWriter] = None):
+        self.message_log = message_log if message_log is not None else MessageLog()
+        self.analyzer = analyzer if analyzer is not None else ExposureAnalyzer()
+        # Mitschnitt für replay.py (None = aus)
+        self.capture = capture
+        # DeflateConfig oder None (keine Kompression)
+        self.deflate = deflate
+        self.encrypted = encrypted
+        self.reaper = Reaper(keepalive if keepalive is not None else KeepalivePolicy(),
+                             self.reap, self.send_ping)
+        self.admission = admission if admission is not None else Admission()
+        # Peer-ID -> Verbindung (Nachschlagen in O(1)), Räume nach ID
+        self.peers = PeerDirectory()
+        self.rooms: Dict[str, Room] = {}
+        self.read_buffer = bytearray(READ_BUFFER_SIZE)
+        self.read_view = memoryview(self.read_buffer)
+        # Verbindungen mit vorgemerkten Frames, geleert einmal pro Loop-Durchlauf
+        self.dirty: List[WebSocketProtocol] = []
+        self.flush_scheduled = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def log_message(self, msg_type: str, room_id: str, envelope: Envelope):
         """Logge Nachrichten für Sicherheitsanalyse"""
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'type': msg_type,
-            'data': data
-        }
-        self.message_log.append(log_entry)
-        
-        # Ausgabe für Analyse
-        if msg_type in ['offer', 'answer']:
-            logger.warning(f"🔓 SDP {msg_type.upper()} übertragen (enthält Fingerprints!)")
-            if 'sdp' in data:
-                sdp = data.get('sdp', '')
-                if 'fingerprint' in sdp:
-                    logger.warning(f"   Fingerprint detected in SDP")
-        elif msg_type == 'ice-candidate':
-            candidate = data.get('candidate', '')
-            if candidate:
-                logger.info(f"🌐 ICE Candidate: {candidate[:80]}...")
-                if 'typ host' in candidate:
-                    logger.warning(f"   ⚠️  LOCAL IP exposed!")
-                elif 'typ srflx' in candidate:
-                    logger.warning(f"   ⚠️  PUBLIC IP exposed!")
-    
-    def add_client(self, client_id):
-        """Füge Client hinzu"""
-        if client_id not in self.clients:
-            self.clients.append(client_id)
-            logger.info(f"Client {client_id} joined. Total clients: {len(self.clients)}")
-    
-    def remove_client(self, client_id):
+        self.message_log.append(LogEntry(msg_type, room_id, envelope.raw))
+        # SDP/ICE-Auswertung läuft im Hintergrund, nicht vor dem Weiterleiten
+        self.analyzer.submit(msg_type, room_id, envelope.raw)
+
+    def schedule_flush(self, conn: WebSocketProtocol):
+        self.dirty.append(conn)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.flush)
+
+    def flush(self):
+        """Alle in diesem Durchlauf erzeugten Frames schreiben - ein ``writelines`` pro Verbindung"""
+        self.flush_scheduled = False
+        dirty, self.dirty = self.dirty, []
+        for conn in dirty:
+            conn.flush()
+
+    def negotiate_deflate(self, request):
+        return negotiate(request.get('Sec-WebSocket-Extensions'), self.deflate)
+
+    def add_client(self, conn: WebSocketProtocol, room_id: str):
+        """Füge Client dem Raum hinzu und sende ``welcome``"""
+        self.reaper.established(conn.liveness)
+        conn.limiter = self.admission.connection_limiter(time.perf_counter())
+        conn.peer_id = self.peers.register(conn)
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, self.admission.room_limiter(time.perf_counter()))
+        peers = list(islice(room.clients, WELCOME_PEERS))
+        room.clients[conn.peer_id] = conn
+        conn.room = room
+        if self.capture is not None:
+            conn.trace_id = self.capture.open(room_id, conn.peer_id)
+        traffic.info("Client joined room %s. Total clients: %d", room_id, len(room.clients))
+        conn.send_frame(dumps({
+            'type': 'welcome',
+            'encrypted': self.encrypted,
+            'room': room_id,
+            'peer_id': conn.peer_id,
+            'peers': peers,
+            'clients_in_room': len(room.clients)
+        }))
+
+    def remove_client(self, conn: WebSocketProtocol):
         """Entferne Client"""
-        if client_id in self.clients:
-            self.clients.remove(client_id)
-            logger.info(f"Client {client_id} left. Remaining clients: {len(self.clients)}")
-    
-    def broadcast(self, message: str, sender_id: str):
-        """Sende Nachricht an alle außer Sender"""
+        self.peers.unregister(conn.peer_id)
+        if self.capture is not None:
+            self.capture.close_connection(conn.trace_id)
+        room = conn.room
+        if room is None or room.clients.pop(conn.peer_id, None) is None:
+            return
+        traffic.info("Client left room %s. Remaining clients: %d", room.room_id, len(room.clients))
+        if not room.clients:
+            del self.rooms[room.room_id]
+
+    def broadcast(self, message: str, sender: WebSocketProtocol) -> int:
+        """An alle anderen im Raum des Senders; Frames nur einmal pro Variante gebaut"""
+        payload = message.encode('utf-8')
+        frames = {}
+        count = 0
+        for conn in sender.room.clients.values():
+            if conn is not sender:
+                conn.send_payload(payload, frames)
+                count += 1
+        return count
+
+    def unicast(self, message: str, sender: WebSocketProtocol, peer_id: str):
+        """Sende nur an den adressierten Peer (``to``) im selben Raum, sonst ``peer-unavailable``"""
+        target = sender.room.clients.get(peer_id)
+        if target is None or target.closing:
+            self.peers.routed.inc('unavailable')
+            sender.send_frame(dumps(peer_unavailable(peer_id)))
+            return
+        self.peers.routed.inc('unicast')
+        target.send_frame(message)
+
+    def handle_message(self, message: str, sender: WebSocketProtocol):
+        room = sender.room
+        if sender.trace_id is not None:
+            self.capture.message(sender.trace_id, room.room_id, message)
+        # Zugangskontrolle vor Parsen und Weiterleiten
+        scope = self.admission.admit(sender.limiter, room.limiter, len(message), time.perf_counter())
+        if scope is not None:
+            if self.admission.close_on_throttle:
+                logger.warning(f"Rate limit ({scope}) exceeded by {sender.addr}, disconnecting")
+                self.admission.closed.inc(scope)
+                sender.close_with(CLOSE_POLICY_VIOLATION, f"{scope} rate limit")
+            return
         try:
-            data = json.loads(message)
-            msg_type = data.get('type')
-            self.log_message(msg_type, data)
-        except:
-            pass
+            # Nur den Umschlag lesen - die SDP bleibt undekodiert
+            envelope = read_envelope(message)
+        except EnvelopeError:
+            logger.error("Invalid JSON received")
+            return
+        traffic.info("Received: %s", envelope.type)
+        self.log_message(envelope.type, room.room_id, envelope)
+        # Empfänger sehen den vom Server gesetzten Absender
+        forwarded = with_sender(message, sender.peer_id)
+        if envelope.to is not None:
+            self.unicast(forwarded, sender, envelope.to)
+        else:
+            self.broadcast(forwarded, sender)
+            self.peers.routed.inc('broadcast')
+
+    def send_ping(self, conn: WebSocketProtocol):
+        conn.send_raw(PING_FRAME)
+
+    def reap(self, conn: WebSocketProtocol, reason: str):
+        """Vom Reaper aufgerufen: Verbindung ohne Pong, untätig oder ohne Handshake"""
+        logger.info(f"Reaping {conn.addr}: {reason}")
+        conn.abort()
+
+    async def serve(self, host: str, port: int, ssl_context=None, backlog: int = DEFAULT_BACKLOG):
+        self.loop = asyncio.get_running_loop()
+        server = await self.loop.create_server(lambda: WebSocketProtocol(self), host, port,
+                                               ssl=ssl_context, backlog=backlog,
+                                               reuse_address=True)
+        reaper = asyncio.ensure_future(self.reaper.run())
+        scheme = 'wss' if ssl_context is not None else 'ws'
+        logger.info(f"Listening on: {scheme}://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reaper.cancel()
 
 
 def main():
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='WebRTC Signaling Server (Simple)')
     parser.add_argument('--host', default='localhost', help='Host to bind to')
     parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
-    
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG,
+                        help=f'Listen backlog, capped by net.core.somaxconn (default: {DEFAULT_BACKLOG})')
+    add_log_arguments(parser)
+    add_analysis_arguments(parser)
+    add_deflate_arguments(parser)
+    add_keepalive_arguments(parser)
+    add_admission_arguments(parser)
+    add_tls_arguments(parser)
+    add_console_log_arguments(parser)
+    add_capture_arguments(parser)
+
     args = parser.parse_args()
-    
-    logger.info("=" * 60)
-    logger.info("WebRTC Signalisierungsserver (Vereinfachte Version)")
-    logger.info("=" * 60)
-    logger.info(f"HINWEIS: Dieser Server unterstützt WebSocket-Funktionalität begrenzt")
-    logger.info(f"Für volle Funktionalität installieren Sie: pip install websockets")
+    console_log = console_log_from_args(args)
+    ssl_context = tls_from_args(args)
+
     logger.info("=" * 60)
-    logger.info(f"Listening on: http://{args.host}:{args.port}")
+    logger.info("WebRTC Signalisierungsserver (Vereinfachte Version, nur Standardbibliothek)")
     logger.info("=" * 60)
-    
-    server = SimpleSignalingServer()
-    
-    print("\nServer läuft! Drücken Sie Ctrl+C zum Beenden...")
-    print("\nFür vollständige WebSocket-Unterstützung:")
-    print("  sudo apt install python3-websockets")
-    print("  oder verwende ein Virtual Environment")
-    print()
-    
+
+    server = SimpleSignalingServer(message_log_from_args(args), analyzer_from_args(args),
+                                   deflate=deflate_config_from_args(args),
+                                   keepalive=keepalive_from_args(args),
+                                   admission=admission_from_args(args),
+                                   encrypted=ssl_context is not None,
+                                   capture=capture_from_args(args, 'simple'))
+
     try:
-        # Halte Server am Laufen
-        import time
-        while True:
-            time.sleep(1)
+        asyncio.run(server.serve(args.host, args.port, ssl_context, args.backlog))
     except KeyboardInterrupt:
         logger.info("\n" + "=" * 60)
         logger.info("Server stopped")
+        logger.info(f"Total messages logged: {server.message_log.total}")
+        logger.info(f"Keepalive: {server.reaper.stats()}")
+        logger.info(f"Routing: {server.peers.stats()}")
+        if server.capture is not None:
+            logger.info(f"Capture: {server.capture.stats()}")
         logger.info("=" * 60)
+    finally:
+        server.message_log.close()
+        server.analyzer.close()
+        if server.capture is not None:
+            server.capture.close()
+        console_log.close()
 
 
 if __name__ == "__main__":
@@ -2,29 +2,539 @@
 """
 WebRTC Signalisierungsserver (Standard Library Version)
 Implementiert ein minimales WebSocket-Protokoll ohne externe Abhängigkeiten.
+
+Standardmäßig läuft der Server single-threaded auf einer selectors-Event-Loop
+(epoll/kqueue) mit Lese- und Schreibpuffern pro Verbindung. Der alte
+Thread-pro-Verbindung-Modus ist mit ``--engine threads`` weiterhin verfügbar.
+Beide Engines senden Pings und trennen tote Verbindungen über den Reaper
+aus ``keepalive.py``. TLS (``--tls-cert``) läuft nicht-blockierend in der
+selectors-Engine.
+
+Der Upgrade-Request wird inkrementell und größenbegrenzt gelesen
+(``HandshakeParser``); Bytes hinter den Headern (ein früher erster Frame)
+gehen an den Frame-Decoder. Nach einem Deploy verbinden sich alle Clients
+gleichzeitig neu - dafür ist der Listen-Backlog groß (``--backlog``) und
+die selectors-Engine nimmt pro Event bis zu ``--accept-batch`` Verbindungen
+an.
 """
 
+import errno
+import selectors
 import socket
+import ssl
 import threading
 import struct
 import hashlib
 import base64
-import json
 import logging
+import time
+from collections import deque
 from datetime import datetime
 
+from envelope import EnvelopeError, dumps, read_envelope, with_sender
+from deflate import DeflateError, add_deflate_arguments, deflate_config_from_args, negotiate
+from peers import DEFAULT_ROOM, PeerDirectory, peer_unavailable
+from analysis import ExposureAnalyzer, add_analysis_arguments, analyzer_from_args
+from keepalive import KeepalivePolicy, Reaper, add_keepalive_arguments, keepalive_from_args
+from tls import add_tls_arguments, tls_from_args
+from console_log import add_console_log_arguments, console_log_from_args, traffic_logger
+from capture import add_capture_arguments, capture_from_args
+from admission import (CLOSE_MESSAGE_TOO_BIG, CLOSE_POLICY_VIOLATION, Admission,
+                       add_admission_arguments, admission_from_args)
+
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# Zeilen pro Verbindung - mit --traffic-log-sample/-rate sampelbar
+traffic = traffic_logger(__name__)
+
+MAGIC_STRING = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_HANDSHAKE_SIZE = 8192
+# Der Kernel kürzt auf net.core.somaxconn
+DEFAULT_BACKLOG = 4096
+DEFAULT_ACCEPT_BATCH = 64
+# Keine Dateideskriptoren bzw. Puffer mehr - Annehmen kurz aussetzen statt busy loop
+ACCEPT_PAUSE_ERRNOS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+ACCEPT_PAUSE = 0.1
+RECV_SIZE = 65536
+# Startgröße des Frame-Puffers im threads-Engine, wächst mit größeren Frames
+FRAME_BUFFER_SIZE = 4096
+MAX_PENDING_FRAMES = 1024
+MAX_WRITE_BUFFER = 16 * 1024 * 1024
+SEND_NONBLOCKING = getattr(socket, 'MSG_DONTWAIT', 0)
+# Socket bzw. TLS-Record gerade nicht bereit - später erneut versuchen
+WOULD_BLOCK = (BlockingIOError, InterruptedError, ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+RSV1 = 0x40
+
+
+class HandshakeError(ValueError):
+    """Ungültiger oder zu großer Upgrade-Request; ``status`` für die HTTP-Antwort"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def response(self):
+        reason = {400: 'Bad Request', 426: 'Upgrade Required',
+                  431: 'Request Header Fields Too Large'}.get(self.status, 'Bad Request')
+        version = "Sec-WebSocket-Version: 13\r\n" if self.status == 426 else ""
+        return (f"HTTP/1.1 {self.status} {reason}\r\n{version}"
+                "Connection: close\r\nContent-Length: 0\r\n\r\n").encode()
+
+
+def header_tokens(value):
+    return {token.strip().lower() for token in value.split(',')}
+
+
+class HandshakeRequest:
+    """Geprüfter Upgrade-Request; Header-Namen klein geschrieben
+
+    Mehrfach vorkommende Header werden wie in RFC 7230 mit ``, ``
+    zusammengefasst (z. B. ``Sec-WebSocket-Extensions``).
+    """
+
+    def __init__(self, head):
+        lines = head.decode('latin-1').split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise HandshakeError(f"Malformed request line: {lines[0][:80]!r}")
+        self.method, self.path, self.version = parts
+        self.headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                raise HandshakeError(f"Malformed header line: {line[:80]!r}")
+            name = name.lower()
+            value = value.strip()
+            if name in self.headers:
+                value = f"{self.headers[name]}, {value}"
+            self.headers[name] = value
+        self.validate()
+
+    def validate(self):
+        headers = self.headers
+        if self.method != 'GET':
+            raise HandshakeError(f"Method {self.method} not allowed")
+        if 'websocket' not in header_tokens(headers.get('upgrade', '')):
+            raise HandshakeError("Missing 'Upgrade: websocket'", 426)
+        if 'upgrade' not in header_tokens(headers.get('connection', '')):
+            raise HandshakeError("Missing 'Connection: Upgrade'", 426)
+        if headers.get('sec-websocket-version') != '13':
+            raise HandshakeError("Unsupported Sec-WebSocket-Version", 426)
+        try:
+            key_ok = len(base64.b64decode(self.key, validate=True)) == 16
+        except ValueError:
+            key_ok = False
+        if not key_ok:
+            raise HandshakeError("Invalid Sec-WebSocket-Key")
+
+    @property
+    def key(self):
+        return self.headers.get('sec-websocket-key', '')
+
+    def get(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class HandshakeParser:
+    """Sammelt den Upgrade-Request über beliebig viele Reads
+
+    ``feed`` liefert ``None``, solange das Header-Ende fehlt, danach
+    ``(HandshakeRequest, Rest)``; der Rest sind bereits empfangene
+    Frame-Bytes. Die Suche nach ``\\r\\n\\r\\n`` setzt am vorherigen
+    Ende an, jedes Byte wird nur einmal geprüft. Mehr als ``max_size``
+    Bytes ohne Header-Ende lösen ``HandshakeError`` (431) aus.
+    """
+
+    def __init__(self, max_size=MAX_HANDSHAKE_SIZE):
+        self.max_size = max_size
+        self.buf = bytearray()
+
+    def feed(self, data):
+        start = max(0, len(self.buf) - 3)
+        self.buf += data
+        end = self.buf.find(b'\r\n\r\n', start)
+        if end < 0:
+            if len(self.buf) > self.max_size:
+                raise HandshakeError("Handshake too large", 431)
+            return None
+        if end > self.max_size:
+            raise HandshakeError("Handshake too large", 431)
+        request = HandshakeRequest(bytes(self.buf[:end]))
+        rest = bytes(self.buf[end + 4:])
+        self.buf = bytearray()
+        return request, rest
+
+
+def handshake_response(key, extensions=None):
+    accept_key = base64.b64encode(hashlib.sha1((key + MAGIC_STRING).encode()).digest()).decode()
+    extension_line = f"Sec-WebSocket-Extensions: {extensions}\r\n" if extensions else ""
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key}\r\n"
+        f"{extension_line}\r\n"
+    ).encode()
+
+
+def unmask(payload, masks):
+    """Demaskiere ``payload`` in einem Schritt statt Byte für Byte
+
+    Payload und wiederholte Maske werden als große Ganzzahlen verknüpft,
+    die XOR-Operation läuft damit wortweise in C.
+    """
+    length = len(payload)
+    if not length:
+        return b""
+    key = (masks * (length // 4 + 1))[:length]
+    value = int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')
+    return value.to_bytes(length, 'little')
+
+
+def encode_frame(payload, opcode=OP_TEXT, compressed=False):
+    """Baue einen unmaskierten Server-Frame (FIN gesetzt)
+
+    Server-Frames sind für alle Empfänger identisch und werden bei
+    Broadcasts nur einmal pro Nachricht erzeugt. ``compressed`` setzt
+    RSV1 für permessage-deflate.
+    """
+    payload_len = len(payload)
+    first = 0x80 | opcode | (RSV1 if compressed else 0)
+
+    if payload_len <= 125:
+        header = struct.pack('!BB', first, payload_len)
+    elif payload_len <= 65535:
+        header = struct.pack('!BBH', first, 126, payload_len)
+    else:
+        header = struct.pack('!BBQ', first, 127, payload_len)
+
+    return header + bytes(payload)
+
+
+PING_FRAME = encode_frame(b"", OP_PING)
+
+
+def close_frame(code, reason=''):
+    return encode_frame(struct.pack('!H', code) + reason.encode('utf-8'), OP_CLOSE)
+
+
+def build_frame(deflate, payload, frames):
+    """Frame für einen Empfänger, über ``frames`` zwischen Empfängern geteilt
+
+    Unkomprimierte Frames und Frames ohne Context Takeover sind für alle
+    Empfänger gleich und werden nur einmal gebaut. Mit Context Takeover
+    hat jede Verbindung ihren eigenen zlib-Zustand.
+    """
+    if deflate is None or len(payload) < deflate.threshold:
+        key = None
+    elif deflate.shared_key is None:
+        return encode_frame(deflate.compress(payload), compressed=True)
+    else:
+        key = deflate.shared_key
+    frame = frames.get(key)
+    if frame is None:
+        if key is None:
+            frame = encode_frame(payload)
+        else:
+            frame = encode_frame(deflate.compress(payload), compressed=True)
+        frames[key] = frame
+    return frame
+
+
+class FrameTooLarge(ValueError):
+    """Frame-Länge im Header überschreitet das Limit"""
+
+
+def parse_frame(buf, max_size=0):
+    """Lese einen vollständigen Frame aus ``buf``
+
+    Gibt ``(opcode, payload, consumed, compressed)`` zurück oder ``None``,
+    wenn der Frame noch nicht vollständig im Puffer liegt. Ist die Länge
+    größer als ``max_size`` (0 = unbegrenzt), wird ``FrameTooLarge``
+    ausgelöst, bevor Nutzdaten gepuffert werden müssen.
+    """
+    if len(buf) < 2:
+        return None
+    byte1, byte2 = buf[0], buf[1]
+    opcode = byte1 & 0x0F
+    masked = byte2 & 0x80
+    payload_len = byte2 & 0x7F
+    offset = 2
+
+    if payload_len == 126:
+        if len(buf) < 4:
+            return None
+        payload_len = struct.unpack_from('!H', buf, 2)[0]
+        offset = 4
+    elif payload_len == 127:
+        if len(buf) < 10:
+            return None
+        payload_len = struct.unpack_from('!Q', buf, 2)[0]
+        offset = 10
+
+    if max_size and payload_len > max_size:
+        raise FrameTooLarge(payload_len)
+
+    masks = None
+    if masked:
+        if len(buf) < offset + 4:
+            return None
+        masks = bytes(buf[offset:offset + 4])
+        offset += 4
+
+    end = offset + payload_len
+    if len(buf) < end:
+        return None
+
+    with memoryview(buf) as view:
+        if masks:
+            payload = unmask(view[offset:end], masks)
+        else:
+            payload = bytes(view[offset:end])
+    return opcode, payload, end, bool(byte1 & RSV1)
+
+
+class Connection:
+    """Zustand einer Verbindung in der selectors-Event-Loop
+
+    Ersetzt den Thread pro Verbindung: Daten werden in ``rbuf`` gesammelt
+    und frameweise verarbeitet, ausgehende Daten landen in ``wbuf`` und
+    werden geschrieben, sobald der Socket schreibbar ist.
+    """
+
+    __slots__ = ('conn', 'addr', 'server', 'rbuf', 'wbuf', 'handshake', 'handshake_done',
+                 'running', 'close_after_flush', 'deflate', 'liveness', 'limiter', 'peer_id',
+                 'trace_id', 'tls', 'tls_handshaking')
 
-class WebSocketHandler(threading.Thread):
     def __init__(self, conn, addr, server):
-        super().__init__()
         self.conn = conn
         self.addr = addr
         self.server = server
+        self.rbuf = bytearray()
+        self.wbuf = bytearray()
+        self.handshake = HandshakeParser()
         self.handshake_done = False
         self.running = True
+        self.close_after_flush = False
+        self.deflate = None
+        self.liveness = None
+        self.limiter = None
+        self.peer_id = None
+        self.trace_id = None
+        self.tls = isinstance(conn, ssl.SSLSocket)
+        self.tls_handshaking = self.tls
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def tls_handshake(self):
+        """TLS-Handshake nicht-blockierend fortsetzen; True sobald abgeschlossen"""
+        try:
+            self.conn.do_handshake()
+        except ssl.SSLWantReadError:
+            self.server.want_write(self, False)
+            return False
+        except ssl.SSLWantWriteError:
+            self.server.want_write(self, True)
+            return False
+        except OSError as e:
+            logger.info(f"TLS handshake with {self.addr} failed: {e}")
+            self.server.close_connection(self)
+            return False
+        self.tls_handshaking = False
+        self.server.want_write(self, False)
+        return True
+
+    def on_readable(self):
+        if self.tls_handshaking and not self.tls_handshake():
+            return
+        try:
+            data = self.conn.recv(RECV_SIZE)
+            # Rest eines TLS-Records liegt schon entschlüsselt im SSL-Objekt,
+            # nicht mehr im Socket - select würde dafür nicht erneut melden
+            if self.tls and self.conn.pending():
+                data += self.conn.recv(self.conn.pending())
+        except WOULD_BLOCK:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.server.close_connection(self)
+            return
+        self.liveness.last_seen = time.monotonic()
+        if not self.handshake_done:
+            data = self.do_handshake(data)
+            if data is None:
+                return
+        self.rbuf += data
+
+        while self.running and not self.close_after_flush:
+            try:
+                frame = parse_frame(self.rbuf, self.server.admission.max_frame_size)
+            except FrameTooLarge as e:
+                if self.server.admission.oversized(e.args[0]):
+                    logger.warning(f"Frame of {e.args[0]} bytes from {self.addr}, disconnecting")
+                self.close_with(CLOSE_MESSAGE_TOO_BIG, "frame too large")
+                return
+            if frame is None:
+                break
+            opcode, payload, consumed, compressed = frame
+            del self.rbuf[:consumed]
+            if opcode == OP_CLOSE:
+                self.send_raw(encode_frame(b"", OP_CLOSE))
+                self.close_after_flush = True
+                if not self.wbuf:
+                    self.server.close_connection(self)
+                break
+            if opcode == OP_PING:
+                self.send_raw(encode_frame(payload, OP_PONG))
+                continue
+            if opcode == OP_PONG:
+                self.server.reaper.pongs += 1
+                continue
+            if opcode in (OP_TEXT, OP_BINARY):
+                self.liveness.last_message = self.liveness.last_seen
+                try:
+                    if compressed:
+                        if self.deflate is None:
+                            raise DeflateError("RSV1 set without permessage-deflate")
+                        payload = self.deflate.decompress(payload)
+                    message = payload.decode('utf-8')
+                except DeflateError as e:
+                    logger.warning(f"Invalid compressed frame from {self.addr}: {e}")
+                    self.server.close_connection(self)
+                    return
+                except UnicodeDecodeError:
+                    continue
+                self.server.handle_message(message, self)
+
+    def do_handshake(self, data):
+        """Upgrade-Request fortsetzen; liefert die Bytes hinter den Headern oder None"""
+        try:
+            result = self.handshake.feed(data)
+        except HandshakeError as e:
+            logger.info(f"Rejected handshake from {self.addr}: {e}")
+            self.send_raw(e.response())
+            self.close_after_flush = True
+            if not self.wbuf:
+                self.server.defer_close(self)
+            return None
+        if result is None:
+            return None
+        request, rest = result
+        self.handshake = None
+
+        extensions = self.server.negotiate_deflate(request)
+        if extensions:
+            self.deflate = extensions[1]
+        self.send_raw(handshake_response(request.key, extensions[0] if extensions else None))
+        self.handshake_done = True
+        self.server.add_client(self)
+        return rest
+
+    def send_frame(self, message):
+        self.send_payload(message.encode('utf-8'), {})
+
+    def send_payload(self, payload, frames):
+        self.send_raw(build_frame(self.deflate, payload, frames))
+
+    def close_with(self, code, reason):
+        """Close-Frame senden und nach dem Leeren des Puffers schließen"""
+        self.send_raw(close_frame(code, reason))
+        self.close_after_flush = True
+        if not self.wbuf:
+            self.server.defer_close(self)
+
+    def send_raw(self, data):
+        if not self.running:
+            return
+        if self.wbuf:
+            # Socket blockiert bereits - hinten anstellen
+            if len(self.wbuf) + len(data) > MAX_WRITE_BUFFER:
+                logger.warning(f"Write buffer full for {self.addr}, disconnecting")
+                self.running = False
+                self.server.defer_close(self)
+                return
+            self.wbuf += data
+            return
+        try:
+            sent = self.conn.send(data)
+        except WOULD_BLOCK:
+            sent = 0
+        except OSError:
+            self.running = False
+            self.server.defer_close(self)
+            return
+        if sent < len(data):
+            self.wbuf += memoryview(data)[sent:]
+            self.server.want_write(self, True)
+
+    def on_writable(self):
+        if self.tls_handshaking:
+            self.tls_handshake()
+            return
+        self.flush()
+        if not self.wbuf:
+            self.server.want_write(self, False)
+            if self.close_after_flush:
+                self.server.close_connection(self)
+
+    def flush(self):
+        try:
+            sent = self.conn.send(self.wbuf)
+        except WOULD_BLOCK:
+            return
+        except OSError:
+            # Nicht direkt schließen - flush kann mitten in broadcast laufen
+            self.running = False
+            self.server.defer_close(self)
+            return
+        del self.wbuf[:sent]
+
+
+class WebSocketHandler:
+    """Thread-pro-Verbindung-Handler (``--engine threads``)
+
+    Kein ``threading.Thread``-Subobjekt: ``start`` startet einen Thread mit
+    ``run`` als Ziel. Frame-Puffer und Sende-Warteschlange wachsen erst bei
+    Bedarf, eine Verbindung ohne Verkehr hält nur ihre Slots.
+    """
+
+    __slots__ = ('conn', 'addr', 'server', 'handshake_done', 'running', 'header', 'buffer',
+                 'leftover', 'deflate', 'send_lock', 'pending', 'sending', 'liveness',
+                 'limiter', 'peer_id', 'trace_id')
+
+    def __init__(self, conn, addr, server):
+        self.conn = conn
+        self.addr = addr
+        self.server = server
+        self.handshake_done = False
+        self.running = True
+        self.header = bytearray(14)
+        self.buffer = None
+        # Schon mit dem Handshake empfangene Frame-Bytes
+        self.leftover = bytearray()
+        self.deflate = None
+        # Reentrant: send_payload komprimiert und sendet unter demselben Lock
+        self.send_lock = threading.RLock()
+        # deque der noch nicht gesendeten Frames, nur während ``sending``
+        self.pending = None
+        self.sending = False
+        self.liveness = None
+        self.limiter = None
+        self.peer_id = None
+        self.trace_id = None
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
 
     def run(self):
         try:
@@ -32,161 +542,502 @@ class WebSocketHandler(threading.Thread):
                 self.server.add_client(self)
                 while self.running:
                     data = self.recv_frame()
-                    if data:
+                    if data is not None:
                         self.handle_message(data)
                     else:
                         break
         except Exception as e:
             logger.error(f"Error: {e}")
         finally:
+            self.server.reaper.forget(self.liveness)
             self.server.remove_client(self)
             self.conn.close()
 
     def do_handshake(self):
-        data = self.conn.recv(4096).decode('utf-8', errors='ignore')
-        headers = {}
-        lines = data.split('\r\n')
-        for line in lines[1:]:
-            if ': ' in line:
-                key, value = line.split(': ', 1)
-                headers[key] = value
-
-        if 'Sec-WebSocket-Key' not in headers:
+        parser = HandshakeParser()
+        try:
+            result = None
+            while result is None:
+                data = self.conn.recv(4096)
+                if not data:
+                    return False
+                result = parser.feed(data)
+        except HandshakeError as e:
+            logger.info(f"Rejected handshake from {self.addr}: {e}")
+            self.conn.sendall(e.response())
             return False
+        request, rest = result
+        self.leftover += rest
 
-        key = headers['Sec-WebSocket-Key']
-        magic_string = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
-        accept_key = base64.b64encode(hashlib.sha1((key + magic_string).encode()).digest()).decode()
-
-        response = (
-            "HTTP/1.1 101 Switching Protocols\r\n"
-            "Upgrade: websocket\r\n"
-            "Connection: Upgrade\r\n"
-            f"Sec-WebSocket-Accept: {accept_key}\r\n\r\n"
-        )
-        self.conn.send(response.encode())
+        extensions = self.server.negotiate_deflate(request)
+        if extensions:
+            self.deflate = extensions[1]
+        self.conn.sendall(handshake_response(request.key, extensions[0] if extensions else None))
         self.handshake_done = True
         return True
 
+    def recv_exactly(self, view):
+        """Fülle ``view`` vollständig - erst aus ``leftover``, dann per recv_into"""
+        received = 0
+        total = len(view)
+        if self.leftover:
+            received = min(total, len(self.leftover))
+            view[:received] = self.leftover[:received]
+            del self.leftover[:received]
+        while received < total:
+            count = self.conn.recv_into(view[received:])
+            if not count:
+                return False
+            received += count
+        return True
+
     def recv_frame(self):
+        """Nächste Textnachricht; Ping/Pong werden dabei beantwortet bzw. gezählt"""
+        while True:
+            opcode, payload = self.recv_raw_frame()
+            if opcode is None:
+                return None
+            if opcode == OP_CLOSE:
+                # Close-Handshake beantworten wie die selectors-Engine
+                self.send_raw(encode_frame(b"", OP_CLOSE))
+                return None
+            if opcode == OP_PING:
+                self.send_raw(encode_frame(payload, OP_PONG))
+            elif opcode == OP_PONG:
+                self.server.reaper.pongs += 1
+            else:
+                self.liveness.last_message = self.liveness.last_seen
+                return payload
+
+    def recv_raw_frame(self):
         # Read header
-        data = self.conn.recv(2)
-        if not data: return None
-        
-        byte1, byte2 = struct.unpack('!BB', data)
-        
+        header = memoryview(self.header)
+        if not self.recv_exactly(header[:2]): return None, None
+        self.liveness.last_seen = time.monotonic()
+
+        byte1, byte2 = self.header[0], self.header[1]
+
         opcode = byte1 & 0x0F
-        if opcode == 8: # Close
-            return None
-            
+        compressed = byte1 & RSV1
         masked = (byte2 & 0x80) >> 7
         payload_len = byte2 & 0x7F
-        
+
         if payload_len == 126:
-            data = self.conn.recv(2)
-            payload_len = struct.unpack('!H', data)[0]
+            if not self.recv_exactly(header[2:4]): return None, None
+            payload_len = struct.unpack_from('!H', self.header, 2)[0]
         elif payload_len == 127:
-            data = self.conn.recv(8)
-            payload_len = struct.unpack('!Q', data)[0]
-            
+            if not self.recv_exactly(header[2:10]): return None, None
+            payload_len = struct.unpack_from('!Q', self.header, 2)[0]
+
         masks = None
         if masked:
-            masks = self.conn.recv(4)
-            
-        payload = b""
-        while len(payload) < payload_len:
-            chunk = self.conn.recv(payload_len - len(payload))
-            if not chunk: return None
-            payload += chunk
-            
-        if masked:
-            decoded = bytearray()
-            for i in range(len(payload)):
-                decoded.append(payload[i] ^ masks[i % 4])
-            payload = decoded
-            
-        return payload.decode('utf-8')
+            if not self.recv_exactly(header[10:14]): return None, None
+            masks = bytes(header[10:14])
+
+        if self.server.admission.oversized(payload_len):
+            logger.warning(f"Frame of {payload_len} bytes from {self.addr}, disconnecting")
+            self.close_with(CLOSE_MESSAGE_TOO_BIG, "frame too large")
+            return None, None
+
+        # Payload direkt in den wiederverwendeten Puffer lesen
+        if self.buffer is None or payload_len > len(self.buffer):
+            self.buffer = bytearray(max(payload_len, FRAME_BUFFER_SIZE))
+        with memoryview(self.buffer) as view:
+            payload = view[:payload_len]
+            if not self.recv_exactly(payload): return None, None
+            if opcode in (OP_PING, OP_PONG, OP_CLOSE):
+                return opcode, unmask(payload, masks) if masked else bytes(payload)
+            if compressed:
+                if self.deflate is None:
+                    raise DeflateError("RSV1 set without permessage-deflate")
+                data = unmask(payload, masks) if masked else bytes(payload)
+                return opcode, self.deflate.decompress(data).decode('utf-8')
+            if masked:
+                return opcode, unmask(payload, masks).decode('utf-8')
+            return opcode, str(payload, 'utf-8')
 
     def send_frame(self, message):
-        payload = message.encode('utf-8')
-        payload_len = len(payload)
-        
-        frame = bytearray()
-        frame.append(0x81) # Text frame, FIN
-        
-        if payload_len <= 125:
-            frame.append(payload_len)
-        elif payload_len <= 65535:
-            frame.append(126)
-            frame.extend(struct.pack('!H', payload_len))
-        else:
-            frame.append(127)
-            frame.extend(struct.pack('!Q', payload_len))
-            
-        frame.extend(payload)
-        try:
-            self.conn.send(frame)
-        except:
-            self.running = False
+        self.send_payload(message.encode('utf-8'), {})
 
-    def handle_message(self, message):
+    def send_payload(self, payload, frames):
+        # Kompressionsreihenfolge muss der Sendereihenfolge entsprechen
+        with self.send_lock:
+            self.send_raw(build_frame(self.deflate, payload, frames))
+
+    def send_raw(self, frame):
+        """Sende einen fertigen Frame, ohne bei vollem Socket zu blockieren
+
+        Kann nicht alles sofort geschrieben werden, landet der Rest in der
+        eigenen Warteschlange dieses Clients, die ein Writer-Thread leert.
+        """
+        with self.send_lock:
+            if not self.running:
+                return
+            if self.sending:
+                if len(self.pending) >= MAX_PENDING_FRAMES:
+                    logger.warning(f"Send queue full for {self.addr}, disconnecting")
+                    self.abort()
+                    return
+                self.pending.append(frame)
+                return
+            try:
+                sent = self.conn.send(frame, SEND_NONBLOCKING)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.running = False
+                return
+            if sent < len(frame):
+                self.pending = deque((memoryview(frame)[sent:],))
+                self.sending = True
+                threading.Thread(target=self.drain, daemon=True).start()
+
+    def drain(self):
+        while True:
+            with self.send_lock:
+                if not self.pending or not self.running:
+                    self.pending = None
+                    self.sending = False
+                    return
+                chunk = self.pending.popleft()
+            try:
+                self.conn.sendall(chunk)
+            except OSError:
+                with self.send_lock:
+                    self.running = False
+                    self.pending = None
+                    self.sending = False
+                return
+
+    def close_with(self, code, reason):
+        """Close-Frame senden; die Leseschleife endet danach"""
+        self.send_raw(close_frame(code, reason))
+        self.running = False
+
+    def abort(self):
+        with self.send_lock:
+            self.running = False
+            self.pending = None
         try:
-            data = json.loads(message)
-            self.server.broadcast(message, self)
-            
-            # Security Logging
-            msg_type = data.get('type')
-            if msg_type == 'offer':
-                logger.warning("🔓 SDP OFFER received (contains Fingerprints)")
-            elif msg_type == 'ice-candidate':
-                cand = data.get('candidate', '')
-                if 'typ host' in cand:
-                    logger.warning(f"⚠️  Local IP exposed: {cand.split()[4]}")
-                elif 'typ srflx' in cand:
-                    logger.warning(f"⚠️  Public IP exposed: {cand.split()[4]}")
-                    
-        except json.JSONDecodeError:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
             pass
 
+    def handle_message(self, message):
+        self.server.handle_message(message, self)
+
+def somaxconn():
+    """Obergrenze des Kernels für den Listen-Backlog (Linux), sonst None"""
+    try:
+        with open('/proc/sys/net/core/somaxconn') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
 class SignalingServer:
-    def __init__(self, host='0.0.0.0', port=8080):
+    ENGINES = ('selectors', 'threads')
+
+    def __init__(self, host='0.0.0.0', port=8080, engine='selectors', backlog=DEFAULT_BACKLOG,
+                 analyzer=None, deflate=None, keepalive=None, admission=None, ssl_context=None,
+                 accept_batch=DEFAULT_ACCEPT_BATCH, capture=None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        if ssl_context is not None and engine != 'selectors':
+            # Ein SSL-Objekt darf nicht gleichzeitig aus Lese- und Sende-Thread benutzt werden
+            raise ValueError("TLS requires the selectors engine")
         self.host = host
         self.port = port
+        self.engine = engine
+        self.backlog = backlog
+        self.accept_batch = accept_batch
+        # Zeitpunkt, ab dem nach EMFILE & Co. wieder angenommen wird (0 = aktiv)
+        self.accept_resume = 0.0
+        self.analyzer = analyzer if analyzer is not None else ExposureAnalyzer()
+        # TraceWriter für replay.py oder None
+        self.capture = capture
+        # DeflateConfig oder None (keine Kompression)
+        self.deflate = deflate
+        self.ssl_context = ssl_context
+        self.reaper = Reaper(keepalive if keepalive is not None else KeepalivePolicy(),
+                             self.reap, self.send_ping)
+        self.admission = admission if admission is not None else Admission()
+        # Alle Clients teilen sich einen Raum und damit ein Raum-Limit
+        self.room_limiter = self.admission.room_limiter(time.perf_counter())
         self.clients = []
+        self.peers = PeerDirectory()
         self.lock = threading.Lock()
+        self.selector = None
+        self.running = False
+        self.pending_close = []
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
     def start(self):
         self.sock.bind((self.host, self.port))
-        self.sock.listen(5)
-        logger.info(f"Signaling Server listening on ws://{self.host}:{self.port}")
-        
-        while True:
-            conn, addr = self.sock.accept()
+        limit = somaxconn()
+        if limit is not None and limit < self.backlog:
+            logger.warning(f"Listen backlog {self.backlog} is capped to {limit} by net.core.somaxconn")
+        self.sock.listen(self.backlog)
+        self.running = True
+        scheme = 'wss' if self.ssl_context is not None else 'ws'
+        logger.info(f"Signaling Server listening on {scheme}://{self.host}:{self.port} ({self.engine})")
+
+        if self.engine == 'threads':
+            self.serve_threads()
+        else:
+            self.serve_selectors()
+
+    def stop(self):
+        self.running = False
+
+    def serve_threads(self):
+        self.reaper.run_thread(lambda: self.running)
+        while self.running:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError as e:
+                if e.errno not in ACCEPT_PAUSE_ERRNOS:
+                    raise
+                logger.warning(f"Accept failed ({e.strerror}), pausing accepts for {ACCEPT_PAUSE}s")
+                time.sleep(ACCEPT_PAUSE)
+                continue
             handler = WebSocketHandler(conn, addr, self)
+            handler.liveness = self.reaper.track(handler, established=False)
             handler.start()
 
+    def serve_selectors(self):
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ, None)
+        try:
+            while self.running:
+                for key, mask in self.selector.select(timeout=self.reaper.policy.tick):
+                    if key.data is None:
+                        self.accept_connections()
+                        continue
+                    connection = key.data
+                    try:
+                        if mask & selectors.EVENT_READ:
+                            connection.on_readable()
+                        if mask & selectors.EVENT_WRITE and connection.running:
+                            connection.on_writable()
+                    except Exception as e:
+                        logger.error(f"Error: {e}")
+                        self.close_connection(connection)
+                while self.pending_close:
+                    self.close_connection(self.pending_close.pop())
+                if self.accept_resume and time.monotonic() >= self.accept_resume:
+                    self.accept_resume = 0.0
+                    self.selector.register(self.sock, selectors.EVENT_READ, None)
+                self.reaper.tick()
+        finally:
+            for connection in list(self.clients):
+                self.close_connection(connection)
+            self.selector.close()
+            self.sock.close()
+
+    def accept_connections(self):
+        """Bis zu ``accept_batch`` wartende Verbindungen annehmen
+
+        Bei einem Reconnect-Sturm leert das die Accept-Queue in wenigen
+        Durchläufen, ohne die übrigen Verbindungen warten zu lassen.
+        """
+        for _ in range(self.accept_batch):
+            try:
+                conn, addr = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if e.errno in ACCEPT_PAUSE_ERRNOS:
+                    # Listener bleibt lesbar - ohne Pause würde die Loop nur noch accept rufen
+                    logger.warning(f"Accept failed ({e.strerror}), pausing accepts for {ACCEPT_PAUSE}s")
+                    self.selector.unregister(self.sock)
+                    self.accept_resume = time.monotonic() + ACCEPT_PAUSE
+                else:
+                    logger.error(f"Accept failed: {e}")
+                return
+            conn.setblocking(False)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.ssl_context is not None:
+                # Handshake läuft in der Event-Loop (Connection.tls_handshake)
+                conn = self.ssl_context.wrap_socket(conn, server_side=True,
+                                                    do_handshake_on_connect=False)
+            connection = Connection(conn, addr, self)
+            connection.liveness = self.reaper.track(connection, established=False)
+            self.selector.register(conn, selectors.EVENT_READ, connection)
+
+    def want_write(self, connection, enabled):
+        events = selectors.EVENT_READ
+        if enabled:
+            events |= selectors.EVENT_WRITE
+        try:
+            self.selector.modify(connection.conn, events, connection)
+        except (KeyError, ValueError):
+            pass
+
+    def defer_close(self, connection):
+        self.pending_close.append(connection)
+
+    def close_connection(self, connection):
+        if connection.conn.fileno() < 0:
+            return
+        connection.running = False
+        self.reaper.forget(connection.liveness)
+        try:
+            self.selector.unregister(connection.conn)
+        except (KeyError, ValueError):
+            pass
+        if connection.handshake_done:
+            self.remove_client(connection)
+        if connection.tls and not connection.tls_handshaking:
+            # close_notify senden - ohne sauberes Ende verwirft OpenSSL die
+            # Session aus dem Session-Cache (--tls-resumption cache)
+            try:
+                connection.conn.unwrap()
+            except (OSError, ValueError):
+                pass
+        connection.conn.close()
+
+    def send_ping(self, connection):
+        connection.send_raw(PING_FRAME)
+
+    def reap(self, connection, reason):
+        """Vom Reaper aufgerufen: Verbindung ohne Pong, untätig oder ohne Handshake"""
+        logger.info(f"Reaping {connection.addr}: {reason}")
+        if self.engine == 'threads':
+            # Blockierendes recv im Handler-Thread kehrt danach zurück
+            connection.abort()
+        else:
+            self.close_connection(connection)
+
     def add_client(self, handler):
+        self.reaper.established(handler.liveness)
+        handler.limiter = self.admission.connection_limiter(time.perf_counter())
         with self.lock:
+            handler.peer_id = self.peers.register(handler)
+            if self.capture is not None:
+                handler.trace_id = self.capture.open(DEFAULT_ROOM, handler.peer_id)
             self.clients.append(handler)
-            logger.info(f"Client connected. Total: {len(self.clients)}")
+            peers = self.peers.others(handler.peer_id)
+            traffic.info("Client connected. Total: %d", len(self.clients))
+        handler.send_frame(dumps({'type': 'welcome', 'encrypted': self.ssl_context is not None,
+                                  'peer_id': handler.peer_id, 'peers': peers,
+                                  'clients_in_room': len(self.clients)}))
 
     def remove_client(self, handler):
         with self.lock:
+            self.peers.unregister(handler.peer_id)
+            if self.capture is not None:
+                self.capture.close_connection(handler.trace_id)
+                handler.trace_id = None
             if handler in self.clients:
                 self.clients.remove(handler)
-                logger.info(f"Client disconnected. Total: {len(self.clients)}")
+                traffic.info("Client disconnected. Total: %d", len(self.clients))
+
+    def negotiate_deflate(self, request):
+        return negotiate(request.get('Sec-WebSocket-Extensions'), self.deflate)
 
     def broadcast(self, message, sender):
+        # Frames nur einmal pro Variante bauen, Empfänger unter dem Lock
+        # kopieren, gesendet wird außerhalb des Locks
+        payload = message.encode('utf-8')
+        frames = {}
         with self.lock:
-            for client in self.clients:
-                if client != sender:
-                    client.send_frame(message)
+            recipients = [client for client in self.clients if client is not sender]
+        for client in recipients:
+            client.send_payload(payload, frames)
 
-if __name__ == "__main__":
-    server = SignalingServer()
+    def unicast(self, message, sender, peer_id):
+        """Sende nur an den adressierten Peer (``to``), sonst ``peer-unavailable``"""
+        target = self.peers.get(peer_id)
+        if target is None or not target.running:
+            self.peers.routed.inc('unavailable')
+            sender.send_frame(dumps(peer_unavailable(peer_id)))
+            return
+        self.peers.routed.inc('unicast')
+        target.send_frame(message)
+
+    def handle_message(self, message, sender):
+        if sender.trace_id is not None:
+            self.capture.message(sender.trace_id, DEFAULT_ROOM, message)
+        # Zugangskontrolle vor Parsen und Weiterleiten
+        scope = self.admission.admit(sender.limiter, self.room_limiter, len(message),
+                                     time.perf_counter())
+        if scope is not None:
+            if self.admission.close_on_throttle:
+                logger.warning(f"Rate limit ({scope}) exceeded by {sender.addr}, disconnecting")
+                self.admission.closed.inc(scope)
+                sender.close_with(CLOSE_POLICY_VIOLATION, f"{scope} rate limit")
+            return
+        try:
+            # Nur den Umschlag lesen - die SDP bleibt undekodiert
+            envelope = read_envelope(message)
+        except EnvelopeError:
+            logger.error("Invalid JSON received")
+            return
+        # Empfänger sehen den vom Server gesetzten Absender
+        forwarded = with_sender(message, sender.peer_id)
+        if envelope.to is not None:
+            self.unicast(forwarded, sender, envelope.to)
+        else:
+            self.broadcast(forwarded, sender)
+            self.peers.routed.inc('broadcast')
+
+        # Security Logging im Hintergrund-Thread
+        self.analyzer.submit(envelope.type, DEFAULT_ROOM, message)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='WebRTC Signaling Server (stdlib)')
+    parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--engine', choices=SignalingServer.ENGINES, default='selectors',
+                        help='selectors: single-threaded event loop, threads: one thread per client')
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG,
+                        help=f'Listen backlog, capped by net.core.somaxconn (default: {DEFAULT_BACKLOG})')
+    parser.add_argument('--accept-batch', type=int, default=DEFAULT_ACCEPT_BATCH,
+                        help=f'Connections accepted per readiness event (selectors, default: {DEFAULT_ACCEPT_BATCH})')
+    add_deflate_arguments(parser)
+    add_analysis_arguments(parser)
+    add_keepalive_arguments(parser)
+    add_admission_arguments(parser)
+    add_tls_arguments(parser)
+    add_console_log_arguments(parser)
+    add_capture_arguments(parser)
+
+    args = parser.parse_args()
+    console_log = console_log_from_args(args)
+    ssl_context = tls_from_args(args)
+    if ssl_context is not None and args.engine != 'selectors':
+        parser.error("TLS requires --engine selectors")
+
+    server = SignalingServer(host=args.host, port=args.port, engine=args.engine,
+                             backlog=args.backlog, analyzer=analyzer_from_args(args),
+                             deflate=deflate_config_from_args(args),
+                             keepalive=keepalive_from_args(args),
+                             admission=admission_from_args(args),
+                             ssl_context=ssl_context, accept_batch=args.accept_batch,
+                             capture=capture_from_args(args, f'stdlib-{args.engine}'))
     try:
         server.start()
     except KeyboardInterrupt:
         print("Server stopped")
+        print(f"Keepalive: {server.reaper.stats()}")
+        print(f"Console log: {console_log.stats()}")
+        if server.capture is not None:
+            print(f"Capture: {server.capture.stats()}")
+        for summary in server.analyzer.summaries():
+            print(f"Exposure {summary['room']}: {summary['candidates']}, "
+                  f"{summary['distinct_ips']} distinct IPs")
+    finally:
+        server.analyzer.close()
+        if server.capture is not None:
+            server.capture.close()
+        console_log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Zugangskontrolle: Token Buckets, Limiter und Admission
+"""
+
+import pytest
+
+from admission import Admission, AdmissionPolicy, Limiter, TokenBucket
+
+
+def test_bucket_starts_full_and_refills_up_to_burst():
+    bucket = TokenBucket(rate=10, burst=5, now=0.0)
+    assert bucket.refill(0.0) == 5
+    bucket.tokens = 0
+    assert bucket.refill(0.2) == pytest.approx(2)
+    assert bucket.refill(10.0) == 5
+
+
+def test_bucket_ignores_clock_going_backwards():
+    bucket = TokenBucket(rate=10, burst=5, now=1.0)
+    bucket.tokens = 1
+    assert bucket.refill(0.5) == 1
+    assert bucket.stamp == 1.0
+
+
+def test_message_rate_and_burst():
+    limiter = Limiter(msg_rate=2, msg_burst=3, byte_rate=0, byte_burst=0, now=0.0)
+    admitted = 0
+    for _ in range(10):
+        if limiter.allows(10, 0.0):
+            limiter.consume(10)
+            admitted += 1
+    assert admitted == 3
+    assert not limiter.allows(10, 0.4)
+    assert limiter.allows(10, 0.5)
+
+
+def test_burst_defaults_to_rate():
+    limiter = Limiter(msg_rate=4, msg_burst=0, byte_rate=100, byte_burst=0, now=0.0)
+    assert limiter.messages.burst == 4
+    assert limiter.bytes.burst == 100
+    # Unter 1 Nachricht/s trotzdem mindestens eine Nachricht Burst
+    assert Limiter(0.5, 0, 0, 0, now=0.0).messages.burst == 1
+
+
+def test_byte_limit():
+    limiter = Limiter(msg_rate=0, msg_burst=0, byte_rate=1000, byte_burst=0, now=0.0)
+    assert limiter.messages is None
+    limiter.consume(600)
+    assert not limiter.allows(600, 0.0)
+    assert limiter.allows(600, 0.2)
+
+
+def test_oversized_message_passes_full_bucket():
+    # --byte-limit 4000: ein 6-KB-Offer darf nicht für immer hängen bleiben
+    limiter = Limiter(msg_rate=0, msg_burst=0, byte_rate=4000, byte_burst=0, now=0.0)
+    assert limiter.allows(6000, 0.0)
+    limiter.consume(6000)
+    assert limiter.bytes.tokens == -2000
+    # Die Schuld wird erst abgetragen, dann ist der Bucket wieder voll
+    assert not limiter.allows(100, 0.5)
+    assert not limiter.allows(6000, 1.4)
+    assert limiter.allows(100, 0.6)
+    assert limiter.allows(6000, 1.5)
+
+
+def test_oversized_message_waits_for_full_bucket():
+    limiter = Limiter(msg_rate=0, msg_burst=0, byte_rate=4000, byte_burst=0, now=0.0)
+    limiter.consume(100)
+    assert not limiter.allows(6000, 0.0)
+    assert limiter.allows(6000, 0.025)
+
+
+def test_unlimited_admission_creates_no_limiters():
+    admission = Admission()
+    assert admission.connection_limiter(0.0) is None
+    assert admission.room_limiter(0.0) is None
+    assert admission.admit(None, None, 10 ** 6, 0.0) is None
+
+
+def test_room_rejection_costs_connection_nothing():
+    admission = Admission(AdmissionPolicy(msg_rate=10, room_msg_rate=1))
+    connection = admission.connection_limiter(0.0)
+    room = admission.room_limiter(0.0)
+    assert admission.admit(connection, room, 100, 0.0) is None
+    assert admission.admit(connection, room, 100, 0.0) == 'room'
+    assert connection.messages.tokens == 9
+    assert admission.throttled.get('room') == 1
+    assert admission.throttled_bytes.get('room') == 100
+
+
+def test_connection_scope_checked_first():
+    admission = Admission(AdmissionPolicy(msg_rate=1, room_msg_rate=1))
+    connection = admission.connection_limiter(0.0)
+    room = admission.room_limiter(0.0)
+    assert admission.admit(connection, room, 1, 0.0) is None
+    assert admission.admit(connection, room, 1, 0.0) == 'connection'
+
+
+def test_oversized_frames():
+    admission = Admission(AdmissionPolicy(max_frame_size=1024))
+    assert not admission.oversized(1024)
+    assert admission.oversized(1025)
+    assert admission.throttled.get('size') == 1
+    assert admission.closed.get('size') == 1
+    assert not Admission(AdmissionPolicy(max_frame_size=0)).oversized(10 ** 9)
+
+
+def test_rejects_unknown_action():
+    with pytest.raises(ValueError):
+        AdmissionPolicy(action='ignore')
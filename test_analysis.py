@@ -0,0 +1,51 @@
+"""
+Sicherheitsanalyse: ICE-Kandidaten aus Einzel- und Sammelnachrichten
+"""
+
+import json
+
+import pytest
+
+from analysis import ExposureAnalyzer
+
+HOST = 'candidate:1 1 udp 2122260223 192.168.1.20 54321 typ host'
+SRFLX = 'candidate:2 1 udp 1686052607 203.0.113.7 54322 typ srflx raddr 0.0.0.0 rport 0'
+
+
+@pytest.fixture
+def analyzer():
+    analyzer = ExposureAnalyzer()
+    yield analyzer
+    analyzer.close()
+
+
+def analyze(analyzer, msg_type, message):
+    analyzer.submit(msg_type, 'room', json.dumps(message))
+    analyzer.flush()
+    return analyzer.summary('room')
+
+
+def test_single_candidate(analyzer):
+    summary = analyze(analyzer, 'ice-candidate', {'type': 'ice-candidate', 'candidate': HOST})
+    assert summary['ips'] == {'192.168.1.20': 'host'}
+
+
+def test_batched_candidate_messages(analyzer):
+    # So bündelt signaling_server.py (batch_candidates): ganze ice-candidate-Nachrichten
+    batch = {'type': 'ice-candidates', 'candidates': [
+        {'type': 'ice-candidate', 'candidate': HOST, 'sdpMid': '0', 'from': 'peer'},
+        {'type': 'ice-candidate', 'candidate': SRFLX, 'sdpMid': '0', 'from': 'peer'},
+    ]}
+    summary = analyze(analyzer, 'ice-candidates', batch)
+    assert summary['ips'] == {'192.168.1.20': 'host', '203.0.113.7': 'srflx'}
+
+
+def test_batched_candidate_strings_and_init_objects(analyzer):
+    batch = {'type': 'ice-candidates', 'candidates': [
+        HOST,
+        {'candidate': {'candidate': SRFLX, 'sdpMid': '0'}},
+        {'candidate': None},
+        42,
+    ]}
+    summary = analyze(analyzer, 'ice-candidates', batch)
+    assert summary['ips'] == {'192.168.1.20': 'host', '203.0.113.7': 'srflx'}
@@ -0,0 +1,19 @@
+"""
+Gemeinsame Batch-Schleife der Hintergrund-Writer
+"""
+
+import queue
+
+from batch_queue import drain_batches
+
+
+def test_stop_signal_inside_batch():
+    # Ein Eintrag nach dem Stop-Signal landet noch im letzten Batch
+    items = queue.Queue()
+    for item in ['a', 'b', 'c', None, 'd']:
+        items.put(item)
+    batches = []
+    drain_batches(items, 3, batches.append)
+    assert batches == [['a', 'b', 'c'], ['d']]
+    assert items.unfinished_tasks == 0
+    assert items.empty()
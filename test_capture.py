@@ -0,0 +1,33 @@
+"""
+Mitschnitt: Trace schreiben und wieder lesen
+"""
+
+import pytest
+
+from capture import TraceWriter, read_trace
+
+
+@pytest.mark.parametrize('name', ['trace.jsonl', 'trace.jsonl.gz'])
+def test_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    writer = TraceWriter(path, server='stdlib')
+    conn = writer.open('r1', 'Ab3dEf9h')
+    writer.message(conn, 'r1', '{"type":"offer"}')
+    writer.close_connection(conn)
+    writer.close()
+    header, events = read_trace(path)
+    assert header['server'] == 'stdlib'
+    events = list(events)
+    assert [event.get('e') for event in events] == ['open', None, 'close']
+    assert events[0]['p'] == 'Ab3dEf9h'
+    assert events[1]['m'] == '{"type":"offer"}'
+
+
+def test_events_after_close_are_ignored(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    writer = TraceWriter(path)
+    writer.open('r1')
+    writer.close()
+    writer.open('r2')
+    assert writer._queue.empty()
+    assert [event['r'] for event in read_trace(path)[1]] == ['r1']
@@ -0,0 +1,128 @@
+"""
+Konsolen-Logging: Sampling, Rate-Limit und Formatieren erst im Writer-Thread
+"""
+
+import io
+import logging
+import queue
+import threading
+
+import pytest
+
+import console_log
+from console_log import ConsoleLog, LazyQueueHandler, TrafficSampler, traffic_logger
+
+
+@pytest.fixture(autouse=True)
+def root_logger():
+    """ConsoleLog ersetzt die Handler des Root-Loggers - danach wiederherstellen"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Message:
+    """Zählt, wie oft und in welchem Thread die Nachricht formatiert wird"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread())
+        return self.text
+
+
+def record(name: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, 'line', None, None)
+
+
+def test_sampler_keeps_every_nth_traffic_line():
+    sampler = TrafficSampler(sample=3)
+    passed = [sampler.filter(record('srv.traffic')) for _ in range(9)]
+    assert passed == [False, False, True] * 3
+    assert sampler.suppressed == 6
+    # Warnungen und andere Logger werden nie gesampelt
+    assert sampler.filter(record('srv.traffic', logging.WARNING))
+    assert sampler.filter(record('srv'))
+    assert sampler.seen == 9
+
+
+def test_sampler_rate_limit(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(console_log.time, 'monotonic', clock)
+    sampler = TrafficSampler(rate=2)
+    assert [sampler.filter(record('srv.traffic')) for _ in range(4)] == [True, True, False, False]
+    clock.now += 0.5
+    assert sampler.filter(record('srv.traffic'))
+    assert not sampler.filter(record('srv.traffic'))
+    assert sampler.filter(record('srv', logging.ERROR))
+    assert sampler.suppressed == 3
+
+
+def test_queue_mode_formats_only_in_writer_thread():
+    log = ConsoleLog(mode='queue', sample=2)
+    out = io.StringIO()
+    log.stream.setStream(out)
+    assert isinstance(logging.getLogger().handlers[0], LazyQueueHandler)
+    assert log.listener._thread is not None
+    messages = [Message(f'line {n}') for n in range(4)]
+    for message in messages:
+        traffic_logger('srv').info('%s', message)
+    warning = Message('exposed')
+    logging.getLogger('srv').warning(warning)
+    # Im aufrufenden Thread wird nichts formatiert
+    assert all(not message.threads for message in messages + [warning])
+    log.close()
+    assert log.listener is None
+    lines = out.getvalue().splitlines()
+    assert [line.split(' - ')[-1] for line in lines] == ['line 1', 'line 3', 'exposed']
+    # Weggesampelte Zeilen werden nie formatiert
+    assert [len(message.threads) for message in messages] == [0, 1, 0, 1]
+    assert threading.current_thread() not in messages[1].threads + warning.threads
+    assert log.stats() == {'mode': 'queue', 'suppressed': 2, 'dropped': 0, 'queue_depth': 0}
+
+    # Nach close() schreibt der Root-Logger wieder direkt
+    logging.getLogger('srv').info('shutdown')
+    assert out.getvalue().splitlines()[-1].endswith('shutdown')
+
+
+def test_full_queue_drops_info_but_keeps_warnings():
+    handler = LazyQueueHandler(queue.Queue(1))
+    handler.enqueue(record('srv'))
+    handler.enqueue(record('srv.traffic'))
+    assert handler.dropped == 1
+    waiting = threading.Thread(target=handler.enqueue, args=(record('srv', logging.WARNING),))
+    waiting.start()
+    waiting.join(0.05)
+    # Die Warnung wartet auf Platz statt verworfen zu werden
+    assert waiting.is_alive()
+    handler.queue.get_nowait()
+    waiting.join(5)
+    assert handler.queue.get_nowait().levelno == logging.WARNING
+    assert handler.dropped == 1
+
+
+def test_sync_mode_filters_on_stream(root_logger):
+    log = ConsoleLog(mode='sync', level=logging.WARNING)
+    assert root_logger.handlers == [log.stream] and root_logger.level == logging.WARNING
+    assert log.listener is None and log.queue_depth == 0 and log.dropped == 0
+    log.close()
+    assert [metric.name for metric in log.metrics()] == [
+        'signaling_console_log_suppressed_total', 'signaling_console_log_dropped_total',
+        'signaling_console_log_queue_depth']
+    with pytest.raises(ValueError):
+        ConsoleLog(mode='async')
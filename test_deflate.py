@@ -0,0 +1,121 @@
+"""
+permessage-deflate: Aushandlung (RFC 7692) und Kompression
+"""
+
+import pytest
+
+from deflate import DeflateConfig, DeflateError, PerMessageDeflate, negotiate, parse_extensions
+
+
+def test_parse_extensions():
+    header = 'permessage-deflate; client_max_window_bits, x-webkit-deflate-frame, ' \
+             'permessage-deflate; server_max_window_bits="10" ;SERVER_NO_CONTEXT_TAKEOVER'
+    assert parse_extensions(header) == [
+        ('permessage-deflate', {'client_max_window_bits': None}),
+        ('x-webkit-deflate-frame', {}),
+        ('permessage-deflate', {'server_max_window_bits': '10', 'server_no_context_takeover': None}),
+    ]
+
+
+def test_parse_extensions_drops_duplicate_parameters():
+    header = 'permessage-deflate; server_max_window_bits=10; server_max_window_bits=12'
+    assert parse_extensions(header) == []
+
+
+def test_no_offer_or_disabled():
+    assert negotiate(None, DeflateConfig()) is None
+    assert negotiate('permessage-deflate', None) is None
+    assert negotiate('x-webkit-deflate-frame', DeflateConfig()) is None
+
+
+def test_plain_offer():
+    response, deflate = negotiate('permessage-deflate', DeflateConfig())
+    assert response == 'permessage-deflate'
+    assert (deflate.server_bits, deflate.client_bits) == (15, 15)
+    assert not deflate.server_no_context_takeover
+
+
+def test_browser_offer():
+    # Chrome/Firefox: client_max_window_bits ohne Wert
+    response, _ = negotiate('permessage-deflate; client_max_window_bits', DeflateConfig())
+    assert response == 'permessage-deflate'
+    response, deflate = negotiate('permessage-deflate; client_max_window_bits',
+                                  DeflateConfig(client_max_window_bits=10))
+    assert response == 'permessage-deflate; client_max_window_bits=10'
+    assert deflate.client_bits == 10
+
+
+@pytest.mark.parametrize('offer, response, server_bits', [
+    ('permessage-deflate; server_max_window_bits=10',
+     'permessage-deflate; server_max_window_bits=10', 10),
+    ('permessage-deflate; server_max_window_bits="12"',
+     'permessage-deflate; server_max_window_bits=12', 12),
+    ('permessage-deflate; server_max_window_bits=15',
+     'permessage-deflate; server_max_window_bits=15', 15),
+])
+def test_server_window_bits(offer, response, server_bits):
+    result, deflate = negotiate(offer, DeflateConfig())
+    assert result == response
+    assert deflate.server_bits == server_bits
+
+
+def test_server_window_bits_capped_by_config():
+    response, deflate = negotiate('permessage-deflate', DeflateConfig(server_max_window_bits=11))
+    assert response == 'permessage-deflate; server_max_window_bits=11'
+    assert deflate.server_bits == 11
+
+
+def test_context_takeover_flags():
+    response, deflate = negotiate(
+        'permessage-deflate; server_no_context_takeover; client_no_context_takeover', DeflateConfig())
+    assert response == 'permessage-deflate; server_no_context_takeover; client_no_context_takeover'
+    assert deflate.server_no_context_takeover and deflate.client_no_context_takeover
+    assert deflate.shared_key == (15, 6)
+
+
+@pytest.mark.parametrize('offer', [
+    'permessage-deflate; server_max_window_bits=8',
+    'permessage-deflate; server_max_window_bits=16',
+    'permessage-deflate; server_max_window_bits',
+    'permessage-deflate; client_max_window_bits=abc',
+    'permessage-deflate; server_no_context_takeover=1',
+    'permessage-deflate; unknown_param',
+])
+def test_unacceptable_offers(offer):
+    assert negotiate(offer, DeflateConfig()) is None
+
+
+def test_falls_back_to_next_offer():
+    header = 'permessage-deflate; server_max_window_bits=8, permessage-deflate; client_max_window_bits'
+    response, deflate = negotiate(header, DeflateConfig())
+    assert response == 'permessage-deflate'
+    assert deflate.server_bits == 15
+
+
+def pair(server: PerMessageDeflate) -> PerMessageDeflate:
+    """Gegenstelle mit vertauschten Rollen zum Dekomprimieren der Server-Frames"""
+    config = DeflateConfig()
+    return PerMessageDeflate(config, server.client_bits, server.server_bits,
+                             server.client_no_context_takeover, server.server_no_context_takeover)
+
+
+@pytest.mark.parametrize('offer', ['permessage-deflate',
+                                   'permessage-deflate; server_no_context_takeover',
+                                   'permessage-deflate; server_max_window_bits=9'])
+def test_round_trip(offer):
+    _, server = negotiate(offer, DeflateConfig())
+    client = pair(server)
+    sdp = b'a=candidate:1 1 udp 2122260223 192.168.1.20 54321 typ host\r\n' * 40
+    for _ in range(3):
+        compressed = server.compress(sdp)
+        assert len(compressed) < len(sdp) // 4
+        assert client.decompress(compressed) == sdp
+
+
+def test_decompress_limits_size():
+    _, server = negotiate('permessage-deflate', DeflateConfig(max_message_size=1024))
+    client = pair(server)
+    with pytest.raises(DeflateError):
+        server.decompress(client.compress(b'x' * 4096))
+    with pytest.raises(DeflateError):
+        server.decompress(b'\xff\xff\xff')
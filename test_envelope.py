@@ -0,0 +1,136 @@
+"""
+Umschlag-Parser: ``read_envelope`` muss dieselben Routing-Felder liefern
+wie ``json.loads`` - unter und über ``FULL_PARSE_BELOW``
+"""
+
+import json
+
+import pytest
+
+from envelope import FULL_PARSE_BELOW, EnvelopeError, read_envelope, with_sender
+
+# Füllt eine Nachricht über die Schwelle, ab der gescannt statt geparst wird
+PADDING = 'x' * FULL_PARSE_BELOW
+
+
+def routing(raw):
+    envelope = read_envelope(raw)
+    return envelope.type, envelope.to, envelope.room
+
+
+def expected(raw):
+    data = json.loads(raw)
+    return data.get('type'), data.get('to'), data.get('room')
+
+
+def sized(message: dict, large: bool) -> str:
+    if large:
+        message = dict(message, sdp=PADDING)
+    return json.dumps(message)
+
+
+@pytest.mark.parametrize('large', [False, True], ids=['small', 'large'])
+@pytest.mark.parametrize('message', [
+    {'type': 'offer', 'to': 'Ab3dEf9h'},
+    {'type': 'join', 'room': 'r"1\\'},
+    {'type': 'offer', 'sdp': 'v=0 "type":"answer" \\"quoted\\"'},
+    {'payload': {'type': 'answer', 'to': 'nested'}, 'type': 'offer'},
+    {'list': [{'type': 'bye'}, '"type"', ['}', ']']], 'type': 'ice-candidate'},
+    {'type': 'café ☃', 'room': 'unicode'},
+    {'type': 'answer', 'to': 42, 'room': None},
+    {'candidate': {'candidate': 'candidate:1 1 udp 1 10.0.0.1 9 typ host'}},
+])
+def test_matches_json_loads(message, large):
+    raw = sized(message, large)
+    assert (len(raw) >= FULL_PARSE_BELOW) == large
+    type_, to, room = expected(raw)
+    assert routing(raw) == (type_, None if to is None else str(to), room)
+
+
+@pytest.mark.parametrize('raw', [
+    '{"type":"offer","to":"abc","sdp":"%s"}',
+    ' {\n  "type" : "offer" ,\n  "to" :\t"abc",\r\n  "sdp":"%s"\n}\n ',
+    '{ "sdp" : "%s" , "type" : "offer" , "to" : "abc" }',
+])
+def test_whitespace_variants(raw):
+    raw = raw % PADDING
+    assert routing(raw) == ('offer', 'abc', None)
+
+
+def test_escaped_quotes_in_large_values():
+    raw = json.dumps({'sdp': PADDING + '\\"}', 'type': 'of\\"fer', 'to': '\\\\'})
+    assert routing(raw) == ('of\\"fer', '\\\\', None)
+
+
+@pytest.mark.parametrize('value', ['{"a":1}', '[1,"x"]', '[]', 'true', '7.5', 'null'])
+def test_non_string_routing_values_agree(value):
+    # Derselbe Umschlag einmal geparst, einmal gescannt
+    small = '{"type":"offer","to":%s,"room":%s}' % (value, value)
+    large = '{"type":"offer","to":%s,"room":%s,"sdp":"%s"}' % (value, value, PADDING)
+    assert len(small) < FULL_PARSE_BELOW <= len(large)
+    assert routing(small) == routing(large)
+    if value[0] in '{[':
+        assert routing(large) == ('offer', None, None)
+
+
+@pytest.mark.parametrize('large', [False, True], ids=['small', 'large'])
+def test_nested_duplicate_clears_routing_value(large):
+    raw = '{"type":"offer","to":"abc","to":{"id":"abc"}}'
+    if large:
+        raw = raw.replace('{', '{"sdp":"%s",' % PADDING, 1)
+    assert routing(raw) == ('offer', None, None)
+
+
+def test_duplicate_key_last_wins():
+    raw = '{"type":"offer","sdp":"%s","type":"answer"}' % PADDING
+    assert routing(raw) == expected(raw) == ('answer', None, None)
+
+
+def test_data_is_decoded_lazily():
+    raw = sized({'type': 'offer', 'to': 'abc'}, large=True)
+    envelope = read_envelope(raw)
+    assert envelope._data is None
+    assert envelope.data == json.loads(raw)
+
+
+@pytest.mark.parametrize('large', [False, True], ids=['small', 'large'])
+@pytest.mark.parametrize('raw', [
+    '',
+    '[]',
+    '"offer"',
+    '{"type":"offer"',
+    '{"type":"offer",}',
+    '{"type" "offer"}',
+    '{"type":"offer"} trailing',
+    '{"type":"offer","sdp":"unterminated',
+    '{"type":"offer","sdp":{"a":[1,2}',
+    '{"type":offer}',
+])
+def test_rejects_invalid(raw, large):
+    if large and raw.startswith('{'):
+        raw = raw.replace('{', '{"pad":"%s",' % PADDING, 1)
+    elif large:
+        raw = raw + ' ' * FULL_PARSE_BELOW
+    with pytest.raises(EnvelopeError):
+        read_envelope(raw)
+
+
+def test_with_sender_on_empty_object():
+    assert json.loads(with_sender('{}', 'peer')) == {'from': 'peer'}
+    assert json.loads(with_sender(' { } \n', 'peer')) == {'from': 'peer'}
+
+
+def test_with_sender_overrides_client_from():
+    raw = '{"type":"offer","from":"spoofed"}'
+    forwarded = with_sender(raw, 'peer')
+    assert forwarded.startswith(raw[:-1])
+    assert json.loads(forwarded) == {'type': 'offer', 'from': 'peer'}
+
+
+def test_with_sender_escapes_peer_id():
+    assert json.loads(with_sender('{"type":"offer"}', 'a"b'))['from'] == 'a"b'
+
+
+def test_with_sender_rejects_non_objects():
+    with pytest.raises(EnvelopeError):
+        with_sender('[1]', 'peer')
@@ -0,0 +1,115 @@
+"""
+Upgrade-Request des stdlib-Servers: inkrementelles Parsen und Prüfung
+"""
+
+import base64
+
+import pytest
+
+from signaling_server_stdlib import HandshakeError, HandshakeParser, HandshakeRequest
+
+KEY = base64.b64encode(b'0123456789abcdef').decode()
+REQUEST = (
+    "GET /ws?room=r1 HTTP/1.1\r\n"
+    "Host: localhost:8080\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: keep-alive, Upgrade\r\n"
+    f"Sec-WebSocket-Key: {KEY}\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "Sec-WebSocket-Extensions: permessage-deflate\r\n"
+    "Sec-WebSocket-Extensions: x-webkit-deflate-frame\r\n"
+    "\r\n"
+).encode()
+FRAME = b'\x81\x85abcd' + bytes(c ^ m for c, m in zip(b'hello', b'abcda'))
+
+
+def feed_all(parser, chunks):
+    results = [parser.feed(chunk) for chunk in chunks]
+    assert all(result is None for result in results[:-1])
+    return results[-1]
+
+
+def test_single_read():
+    request, rest = HandshakeParser().feed(REQUEST)
+    assert request.path == '/ws?room=r1'
+    assert request.key == KEY
+    assert rest == b''
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 17])
+def test_split_reads(size):
+    data = REQUEST + FRAME
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    parser = HandshakeParser()
+    result = None
+    rest = b''
+    for chunk in chunks:
+        if result is None:
+            result = parser.feed(chunk)
+            if result is not None:
+                rest = result[1]
+        else:
+            rest += chunk
+    request, _ = result
+    assert request.get('Host') == 'localhost:8080'
+    assert rest == FRAME
+
+
+@pytest.mark.parametrize('split', range(len(REQUEST) - 4, len(REQUEST)))
+def test_terminator_split_across_reads(split):
+    request, rest = feed_all(HandshakeParser(), [REQUEST[:split], REQUEST[split:] + FRAME])
+    assert request.key == KEY
+    assert rest == FRAME
+
+
+def test_parser_resets_after_request():
+    parser = HandshakeParser()
+    parser.feed(REQUEST)
+    assert parser.buf == bytearray()
+    request, _ = parser.feed(REQUEST)
+    assert request.path == '/ws?room=r1'
+
+
+def test_repeated_headers_are_joined():
+    request, _ = HandshakeParser().feed(REQUEST)
+    assert request.get('Sec-WebSocket-Extensions') == 'permessage-deflate, x-webkit-deflate-frame'
+
+
+def test_too_large_without_terminator():
+    parser = HandshakeParser(max_size=64)
+    assert parser.feed(b'GET / HTTP/1.1\r\n') is None
+    with pytest.raises(HandshakeError) as error:
+        parser.feed(b'X-Padding: ' + b'a' * 64)
+    assert error.value.status == 431
+
+
+def test_too_large_with_terminator():
+    with pytest.raises(HandshakeError) as error:
+        HandshakeParser(max_size=64).feed(REQUEST)
+    assert error.value.status == 431
+
+
+@pytest.mark.parametrize('old, new, status', [
+    (b'GET /ws', b'POST /ws', 400),
+    (b'Upgrade: websocket', b'Upgrade: h2c', 426),
+    (b'Connection: keep-alive, Upgrade', b'Connection: keep-alive', 426),
+    (b'Sec-WebSocket-Version: 13', b'Sec-WebSocket-Version: 8', 426),
+    (KEY.encode(), b'not-base64!', 400),
+    (KEY.encode(), base64.b64encode(b'short'), 400),
+    (b' HTTP/1.1', b'', 400),
+    (b'Host: localhost', b' Host: localhost', 400),
+    (b'Host: localhost:8080', b'Host localhost', 400),
+])
+def test_invalid_requests(old, new, status):
+    with pytest.raises(HandshakeError) as error:
+        HandshakeParser().feed(REQUEST.replace(old, new, 1))
+    assert error.value.status == status
+    response = error.value.response()
+    assert response.startswith(f'HTTP/1.1 {status} '.encode())
+    assert (b'Sec-WebSocket-Version: 13' in response) == (status == 426)
+
+
+def test_header_names_are_case_insensitive():
+    head = REQUEST[:-4].replace(b'Upgrade: websocket', b'UPGRADE: WebSocket')
+    request = HandshakeRequest(head)
+    assert request.get('upgrade') == 'WebSocket'
@@ -0,0 +1,159 @@
+"""
+Keepalive: Timer Wheel und Reaper mit simulierter Uhr
+"""
+
+import pytest
+
+from keepalive import KeepalivePolicy, Reaper, TimerWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_wheel_fires_at_due_tick():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule('a', 2.5, 0.0)
+    wheel.schedule('b', 1.0, 0.0)
+    assert len(wheel) == 2 and 'a' in wheel
+    assert wheel.advance(0.9) == []
+    assert wheel.advance(1.0) == ['b']
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ['a']
+    assert len(wheel) == 0
+
+
+def test_wheel_zero_delay_fires_on_next_tick():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule('a', 0.0, 0.0)
+    assert wheel.advance(0.5) == []
+    assert wheel.advance(1.0) == ['a']
+
+
+def test_wheel_deadline_beyond_one_revolution():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0.0)
+    wheel.schedule('far', 10.0, 0.0)
+    for t in range(1, 10):
+        assert wheel.advance(float(t)) == [], t
+    assert wheel.advance(10.0) == ['far']
+
+
+def test_wheel_catches_up_after_long_pause():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0.0)
+    wheel.schedule('a', 1.0, 0.0)
+    wheel.schedule('b', 3.0, 0.0)
+    wheel.schedule('c', 7.0, 0.0)
+    assert sorted(wheel.advance(100.0)) == ['a', 'b', 'c']
+
+
+def test_wheel_reschedule_and_cancel():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule('a', 1.0, 0.0)
+    wheel.schedule('a', 5.0, 0.0)
+    wheel.schedule('b', 1.0, 0.0)
+    wheel.cancel('b')
+    wheel.cancel('missing')
+    assert wheel.advance(4.0) == []
+    assert wheel.advance(5.0) == ['a']
+
+
+def test_wheel_rejects_bad_parameters():
+    with pytest.raises(ValueError):
+        TimerWheel(tick=0)
+
+
+def make_reaper(**policy):
+    clock = Clock()
+    closed, pinged = [], []
+    reaper = Reaper(KeepalivePolicy(tick=0.5, **policy),
+                    lambda conn, reason: closed.append((conn, reason)),
+                    ping=pinged.append, clock=clock)
+    return reaper, clock, closed, pinged
+
+
+def advance(reaper, clock, seconds):
+    end = clock.now + seconds
+    while clock.now < end:
+        clock.now = min(end, clock.now + reaper.policy.tick)
+        reaper.tick()
+
+
+def test_ping_then_timeout():
+    reaper, clock, closed, pinged = make_reaper(ping_interval=10, ping_timeout=5)
+    reaper.track('conn')
+    advance(reaper, clock, 9.5)
+    assert pinged == []
+    advance(reaper, clock, 1.0)
+    assert pinged == ['conn']
+    advance(reaper, clock, 5.5)
+    assert closed == [('conn', 'timeout')]
+    assert len(reaper) == 0
+    assert reaper.stats()['reaped']['timeout'] == 1
+
+
+def test_pong_keeps_connection():
+    reaper, clock, closed, pinged = make_reaper(ping_interval=10, ping_timeout=5)
+    entry = reaper.track('conn')
+    for _ in range(5):
+        advance(reaper, clock, 10.5)
+        entry.last_seen = clock.now  # Pong
+    assert closed == []
+    assert len(pinged) == 5
+
+
+def test_traffic_postpones_ping():
+    reaper, clock, closed, pinged = make_reaper(ping_interval=10, ping_timeout=5)
+    entry = reaper.track('conn')
+    for _ in range(6):
+        advance(reaper, clock, 5)
+        entry.last_seen = clock.now
+    assert pinged == [] and closed == []
+
+
+def test_idle_timeout():
+    reaper, clock, closed, _ = make_reaper(ping_interval=0, idle_timeout=30)
+    entry = reaper.track('conn')
+    advance(reaper, clock, 20)
+    entry.last_message = clock.now
+    advance(reaper, clock, 29)
+    assert closed == []
+    advance(reaper, clock, 1.5)
+    assert closed == [('conn', 'idle')]
+
+
+def test_handshake_timeout():
+    reaper, clock, closed, _ = make_reaper(handshake_timeout=10)
+    slow = reaper.track('slow', established=False)
+    fast = reaper.track('fast', established=False)
+    advance(reaper, clock, 5)
+    reaper.established(fast)
+    advance(reaper, clock, 5.5)
+    assert closed == [('slow', 'handshake')]
+    assert not slow.open and fast.open
+
+
+def test_forget_stops_tracking():
+    reaper, clock, closed, pinged = make_reaper(ping_interval=10, ping_timeout=5)
+    entry = reaper.track('conn')
+    reaper.forget(entry)
+    reaper.forget(None)
+    advance(reaper, clock, 60)
+    assert closed == [] and pinged == []
+    assert len(reaper) == 0
+
+
+def test_failing_callback_does_not_stop_ticks():
+    clock = Clock()
+
+    def close(conn, reason):
+        raise RuntimeError("boom")
+
+    reaper = Reaper(KeepalivePolicy(ping_interval=0, idle_timeout=1, tick=0.5), close, clock=clock)
+    reaper.track('conn')
+    clock.now += 2
+    reaper.safe_tick()
+    assert reaper.stats()['reaped']['idle'] == 1
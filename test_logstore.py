@@ -0,0 +1,134 @@
+"""
+Indiziertes Nachrichten-Log: Index-Datensätze, Abfragen und CLI
+"""
+
+import json
+import os
+
+import pytest
+
+import logstore
+from logstore import (CANDIDATE_BITS, INDEX_RECORD, TYPE_CODES, LogStore, Query, Segment,
+                      index_record, parse_time, room_hash)
+from message_log import JsonlSegmentWriter, LogEntry
+
+HOST = json.dumps({'type': 'ice-candidate', 'candidate': 'candidate:1 1 udp 1 10.0.0.1 9 typ host'})
+SRFLX = json.dumps({'type': 'ice-candidate', 'candidate': 'candidate:2 1 udp 1 1.2.3.4 9 typ srflx'})
+
+
+def write_log(directory, entries, prefix='signaling'):
+    writer = JsonlSegmentWriter(str(directory), prefix=prefix)
+    for timestamp, msg_type, room, raw in entries:
+        writer.submit(LogEntry(msg_type, room, raw, timestamp=timestamp))
+    writer.close()
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    write_log(tmp_path, [
+        (1000.0, 'offer', 'r1', '{"type":"offer"}'),
+        (1001.0, 'ice-candidate', 'r1', HOST),
+        (1002.0, 'ice-candidate', 'r2', SRFLX),
+        (1003.0, 'answer', 'r1', '{"type":"answer"}'),
+        (1004.0, 'bye', 'r2', '{"type":"bye"}'),
+    ])
+    return tmp_path
+
+
+def query(directory, **filters):
+    store = LogStore(str(directory))
+    try:
+        return [json.loads(line)['raw'] for line in store.query(Query(**filters))]
+    finally:
+        store.close()
+
+
+def test_index_record_fields():
+    record = index_record({'type': 'ice-candidate', 'room': 'r1', 'raw': HOST + SRFLX}, 10, 20, 5.0)
+    assert INDEX_RECORD.unpack(record) == (5.0, 10, 20, room_hash('r1'), TYPE_CODES['ice-candidate'],
+                                          CANDIDATE_BITS['host'] | CANDIDATE_BITS['srflx'])
+    # Unbekannter Typ und fehlender Raum
+    _, _, _, room, type_code, bits = INDEX_RECORD.unpack(index_record({'type': 'bye'}, 0, 1, 0.0))
+    assert (room, type_code, bits) == (room_hash('default'), 0, 0)
+
+
+def test_time_range(log_dir):
+    assert len(query(log_dir)) == 5
+    assert query(log_dir, since=1001.0, until=1002.5) == [HOST, SRFLX]
+    assert query(log_dir, since=1003.5) == ['{"type":"bye"}']
+    assert query(log_dir, until=999.0) == []
+
+
+def test_room_type_and_candidate_filters(log_dir):
+    assert query(log_dir, room='r1') == ['{"type":"offer"}', HOST, '{"type":"answer"}']
+    assert query(log_dir, room='missing') == []
+    # Typ-Code 0: am Eintrag nachgeprüft
+    assert query(log_dir, msg_type='bye') == ['{"type":"bye"}']
+    assert query(log_dir, candidate='srflx') == [SRFLX]
+    assert query(log_dir, room='r1', candidate='srflx') == []
+    with pytest.raises(ValueError):
+        Query(candidate='tcp')
+
+
+def test_prefixes_are_merged_by_time(tmp_path):
+    write_log(tmp_path, [(1.0, 'offer', 'r', 'w0-a'), (3.0, 'offer', 'r', 'w0-b')], prefix='w0')
+    write_log(tmp_path, [(2.0, 'offer', 'r', 'w1-a'), (4.0, 'offer', 'r', 'w1-b')], prefix='w1')
+    assert query(tmp_path) == ['w0-a', 'w1-a', 'w0-b', 'w1-b']
+    store = LogStore(str(tmp_path), prefix='w1')
+    assert [json.loads(line)['raw'] for line in store.query(Query(), limit=1)] == ['w1-a']
+    store.close()
+
+
+def test_index_beyond_data_is_ignored(log_dir):
+    data = str(log_dir / 'signaling-000001.jsonl')
+    with open(data, 'rb') as f:
+        lines = f.readlines()
+    # Letzte Zeile nur halb geschrieben (bzw. noch nicht abgebildet)
+    with open(data, 'wb') as f:
+        f.write(b''.join(lines[:-1]) + lines[-1][:5])
+    segment = Segment(data)
+    assert len(segment) == 4
+    segment.close()
+    assert query(log_dir, msg_type='bye') == []
+
+
+def test_index_without_data(log_dir):
+    os.remove(log_dir / 'signaling-000001.jsonl')
+    segment = Segment(str(log_dir / 'signaling-000001.jsonl'))
+    assert segment.data is None and len(segment) == 0
+    segment.close()
+
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time('90m', now=10000.0) == 4600.0
+    assert parse_time('1.5h', now=10000.0) == 4600.0
+    assert parse_time('1234.5') == 1234.5
+    assert parse_time('1970-01-02T00:00:00+00:00') == 86400.0
+
+
+def test_cli_query_and_export(log_dir, capsys):
+    logstore.main(['query', '--dir', str(log_dir), '--room', 'r1', '--count'])
+    assert capsys.readouterr().out == '3\n'
+    logstore.main(['query', '--dir', str(log_dir), '--candidate', 'host'])
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 1 and ' r1 ice-candidate ' in out[0]
+
+    target = log_dir / 'export' / 'offers.jsonl'
+    target.parent.mkdir()
+    logstore.main(['export', '--dir', str(log_dir), '--since', '1000.5', '--limit', '2',
+                   '-o', str(target)])
+    assert capsys.readouterr().err == 'Exported 2 entries\n'
+    assert [json.loads(line)['raw'] for line in target.open()] == [HOST, SRFLX]
+
+
+def test_cli_stats_and_reindex(log_dir, capsys):
+    os.remove(log_dir / 'signaling-000001.idx')
+    logstore.main(['stats', '--dir', str(log_dir)])
+    assert json.loads(capsys.readouterr().out)['records'] == 0
+    logstore.main(['reindex', '--dir', str(log_dir)])
+    assert capsys.readouterr().out == 'signaling-000001.jsonl: 5 entries\n'
+    logstore.main(['stats', '--dir', str(log_dir)])
+    stats = json.loads(capsys.readouterr().out)
+    assert (stats['segments'], stats['records']) == (1, 5)
+    assert stats['index_bytes'] == 5 * INDEX_RECORD.size
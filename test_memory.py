@@ -0,0 +1,50 @@
+"""
+Speicherbudget pro Verbindung
+Verbindungs-, Raum- und Log-Datensätze dürfen kein ``__dict__`` haben;
+der RSS-Zuwachs pro offener Verbindung bleibt unter ``BUDGETS`` aus
+``bench_memory.py`` (hier mit 2000 statt 10k Verbindungen).
+"""
+
+import pytest
+
+from bench_memory import BUDGETS, build_parser, measure, over_budget
+from message_log import LogEntry
+import signaling_server_simple
+import signaling_server_stdlib
+
+IDLE_CONNECTIONS = 2000
+
+
+def assert_slotted(record):
+    assert not hasattr(record, '__dict__'), f"{type(record).__name__} has a __dict__"
+
+
+def test_records_are_slotted():
+    assert_slotted(LogEntry('offer', 'default', '{"type":"offer"}'))
+    assert_slotted(signaling_server_stdlib.Connection(None, None, None))
+    assert_slotted(signaling_server_stdlib.WebSocketHandler(None, None, None))
+    assert_slotted(signaling_server_simple.WebSocketProtocol(None))
+    assert_slotted(signaling_server_simple.Room('default'))
+
+
+def test_websockets_records_are_slotted():
+    pytest.importorskip('websockets')
+    import signaling_server
+    assert_slotted(signaling_server.Client(None, signaling_server.OutboundStats()))
+    assert_slotted(signaling_server.Room('default'))
+
+
+@pytest.mark.parametrize('name', sorted(BUDGETS))
+def test_idle_connection_budget(name):
+    if name == 'websockets':
+        pytest.importorskip('websockets')
+    elif name == 'aiohttp':
+        pytest.importorskip('aiohttp')
+    args = build_parser().parse_args(['--settle', '0.5'])
+    result = measure(name, IDLE_CONNECTIONS, args, 19500 + sorted(BUDGETS).index(name))
+    if result['skipped']:
+        pytest.skip(result['skipped'])
+    assert result['connected'] == IDLE_CONNECTIONS
+    assert not over_budget(result), (
+        f"{name}: {result['bytes_per_connection']:.0f} bytes per idle connection, "
+        f"budget {result['budget']}")
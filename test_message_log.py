@@ -0,0 +1,31 @@
+"""
+Nachrichten-Log: Ringpuffer und JSONL-Segment-Writer
+"""
+
+import json
+
+from message_log import JsonlSegmentWriter, LogEntry, MessageLog
+
+
+def read_lines(directory):
+    with open(directory / 'signaling-000001.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_ring_buffer_keeps_latest():
+    log = MessageLog(maxlen=3)
+    for i in range(5):
+        log.append(LogEntry('offer', 'default', str(i)))
+    assert [entry.raw for entry in log] == ['2', '3', '4']
+    assert log.total == 5
+    assert [entry.raw for entry in log.recent(2)] == ['3', '4']
+
+
+def test_submit_after_close_is_ignored(tmp_path):
+    writer = JsonlSegmentWriter(str(tmp_path))
+    writer.submit(LogEntry('offer', 'default', '{}'))
+    writer.close()
+    writer.submit(LogEntry('answer', 'default', '{}'))
+    assert writer.written == 1
+    assert writer._queue.empty()
+    assert [line['type'] for line in read_lines(tmp_path)] == ['offer']
@@ -0,0 +1,94 @@
+"""
+Prometheus-Textformat: Zähler, Histogramme, Callbacks und Escaping
+"""
+
+from metrics import CallbackHistogram, CallbackMetric, Counter, Histogram, SignalingMetrics
+
+
+def test_counter_without_label_renders_zero():
+    counter = Counter('requests_total', 'Handled requests')
+    assert list(counter.render()) == [
+        '# HELP requests_total Handled requests',
+        '# TYPE requests_total counter',
+        'requests_total 0',
+    ]
+
+
+def test_counter_labels_are_sorted():
+    counter = Counter('routed_total', 'Routed messages', 'mode')
+    assert list(counter.render())[2:] == []
+    counter.inc('unicast')
+    counter.inc('broadcast', 2)
+    counter.inc('broadcast', 0.5)
+    assert counter.get('broadcast') == 2.5 and counter.get('missing') == 0
+    assert list(counter.render())[2:] == [
+        'routed_total{mode="broadcast"} 2.5',
+        'routed_total{mode="unicast"} 1',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter('rooms_total', 'Rooms', 'room')
+    counter.inc('a"b\\c\nd')
+    assert list(counter.render())[2] == r'rooms_total{room="a\"b\\c\nd"} 1'
+
+
+def test_help_is_escaped():
+    metric = CallbackMetric('x', 'line one\nback\\slash "quoted"', 'gauge', lambda: 1)
+    assert list(metric.render())[0] == r'# HELP x line one\nback\\slash "quoted"'
+
+
+def test_callback_metric_is_evaluated_on_render():
+    values = [3]
+    metric = CallbackMetric('open', 'Open connections', 'gauge', lambda: values[-1])
+    assert list(metric.render()) == ['# HELP open Open connections', '# TYPE open gauge', 'open 3']
+    values.append(4.25)
+    assert list(metric.render())[2] == 'open 4.25'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert list(histogram.render()) == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        'latency_seconds_sum 2.65',
+        'latency_seconds_count 4',
+    ]
+
+
+def test_callback_histogram():
+    histogram = CallbackHistogram('room_size', 'Clients per room', (1, 2), lambda: [1, 2, 2, 7])
+    assert list(histogram.render())[2:] == [
+        'room_size_bucket{le="1"} 1',
+        'room_size_bucket{le="2"} 3',
+        'room_size_bucket{le="+Inf"} 4',
+        'room_size_sum 12',
+        'room_size_count 4',
+    ]
+
+
+def test_signaling_metrics_render():
+    metrics = SignalingMetrics(connections=lambda: 2, rooms=lambda: 1, room_sizes=lambda: [2],
+                               dropped=lambda: 5)
+    metrics.observe_message('offer', 100)
+    metrics.observe_message('bogus', 10)
+    extra = Counter('extra_total', 'Added later')
+    metrics.add(extra)
+    text = metrics.render()
+    assert text.endswith('extra_total 0\n')
+    lines = text.splitlines()
+    assert 'signaling_connections 2' in lines
+    assert 'signaling_messages_total{type="offer"} 1' in lines
+    assert 'signaling_messages_total{type="other"} 1' in lines
+    assert 'signaling_message_bytes_total{type="offer"} 100' in lines
+    assert 'signaling_dropped_messages_total 5' in lines
+    assert not any(line.startswith('signaling_send_queue_depth') for line in lines)
+    # Jede Metrik hat genau eine HELP- und TYPE-Zeile
+    helps = [line.split()[2] for line in lines if line.startswith('# HELP')]
+    types = [line.split()[2] for line in lines if line.startswith('# TYPE')]
+    assert helps == types and len(set(helps)) == len(helps)
@@ -0,0 +1,48 @@
+"""
+Raum-ID aus dem Verbindungspfad und Peer-Verzeichnis
+"""
+
+import pytest
+
+from peers import DEFAULT_ROOM, PeerDirectory, room_from_path
+
+
+@pytest.mark.parametrize('path, room', [
+    (None, DEFAULT_ROOM),
+    ('', DEFAULT_ROOM),
+    ('/', DEFAULT_ROOM),
+    ('/ws', DEFAULT_ROOM),
+    ('/ws/', DEFAULT_ROOM),
+    ('/ws/r1', 'r1'),
+    ('/ws/r1/', 'r1'),
+    ('/r1', 'r1'),
+    ('/r1/extra', 'r1'),
+    ('//ws//r1', 'r1'),
+    ('/ws?room=r2', 'r2'),
+    ('/?room=r2&x=1', 'r2'),
+    ('/ws/r1?room=r2', 'r2'),
+    ('/ws/r1?room=', 'r1'),
+    ('/ws?room=a%20b', 'a b'),
+    ('/ws?other=1', DEFAULT_ROOM),
+])
+def test_room_from_path(path, room):
+    assert room_from_path(path) == room
+
+
+def test_register_and_lookup():
+    peers = PeerDirectory()
+    a = peers.register('conn-a')
+    b = peers.register('conn-b')
+    assert a != b and len(a) == 8
+    assert peers.get(a) == 'conn-a' and a in peers
+    assert peers.others(a) == [b]
+    peers.unregister(a)
+    peers.unregister(None)
+    assert peers.get(a) is None and peers.get(None) is None
+    assert list(peers) == [b]
+
+
+def test_others_is_limited():
+    peers = PeerDirectory()
+    ids = [peers.register(i) for i in range(10)]
+    assert peers.others(ids[0], limit=3) == ids[1:4]
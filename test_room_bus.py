@@ -0,0 +1,89 @@
+"""
+Unix-Socket-Bus: Abos, Zustellung und Protokollfehler zwischen zwei Workern
+"""
+
+import asyncio
+
+from room_bus import HELLO, MESSAGE, SUBSCRIBE, UnixSocketBus, _encode
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timeout"
+        await asyncio.sleep(0.01)
+
+
+async def start_pair(directory: str):
+    received = {0: [], 1: []}
+    buses = [UnixSocketBus(worker_id, 2, directory) for worker_id in range(2)]
+    for worker_id, bus in enumerate(buses):
+        await bus.start(lambda room_id, message, worker_id=worker_id:
+                        received[worker_id].append((room_id, message)))
+    await wait_for(lambda: all(bus._peers for bus in buses))
+    return buses, received
+
+
+def test_subscribe_deliver_unsubscribe(tmp_path):
+    async def scenario():
+        (a, b), received = await start_pair(str(tmp_path))
+        try:
+            # Ohne Abo bei B bleibt die Nachricht bei A
+            a.publish('r1', 'lost')
+            b.subscribe('r1')
+            await wait_for(lambda: 'r1' in a._interest.get(1, ()))
+            a.publish('r1', 'hello')
+            a.publish('r2', 'other room')
+            await wait_for(lambda: received[1])
+            b.unsubscribe('r1')
+            await wait_for(lambda: 'r1' not in a._interest.get(1, ()))
+            a.publish('r1', 'after unsubscribe')
+            await asyncio.sleep(0.05)
+            assert received == {0: [], 1: [('r1', 'hello')]}
+            assert (a.published, b.received) == (1, 1)
+        finally:
+            await a.close()
+            await b.close()
+
+    asyncio.run(scenario())
+
+
+def test_subscriptions_are_sent_on_connect(tmp_path):
+    async def scenario():
+        a = UnixSocketBus(0, 2, str(tmp_path))
+        b = UnixSocketBus(1, 2, str(tmp_path))
+        received = []
+        await a.start(lambda room_id, message: None)
+        # B abonniert vor dem Verbinden - das Abo geht mit dem HELLO raus
+        b.subscribe('early')
+        await b.start(lambda room_id, message: received.append(message))
+        try:
+            await wait_for(lambda: 'early' in a._interest.get(1, ()))
+            a.publish('early', 'hi')
+            await wait_for(lambda: received)
+            assert received == ['hi']
+        finally:
+            await a.close()
+            await b.close()
+
+    asyncio.run(scenario())
+
+
+def test_frames_before_hello_close_connection(tmp_path):
+    async def scenario():
+        bus = UnixSocketBus(0, 1, str(tmp_path))
+        delivered = []
+        await bus.start(lambda room_id, message: delivered.append(message))
+        try:
+            for frame in (_encode(SUBSCRIBE, 'r1'), _encode(MESSAGE, 'r1', b'x'),
+                          _encode(HELLO, 'not-a-worker')):
+                reader, writer = await asyncio.open_unix_connection(bus.path(0))
+                writer.write(frame)
+                # Der Bus trennt statt mit KeyError bzw. ValueError abzubrechen
+                assert await asyncio.wait_for(reader.read(), 5) == b''
+                writer.close()
+            assert delivered == [] and bus._interest == {}
+        finally:
+            await bus.close()
+
+    asyncio.run(scenario())
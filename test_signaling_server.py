@@ -0,0 +1,426 @@
+"""
+websockets-Server: Sende-Queues, Raum-Registry, Bündeln von ICE-Kandidaten
+und Replay für später beitretende Clients, auch nach gezielt (``to``)
+gesendetem Answer
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('websockets')
+
+from bench_common import WSClient  # noqa: E402
+from bench_load import ServerProcess  # noqa: E402
+from signaling_server import (CandidateCoalescer, Client, OutboundStats, ReplayBuffer, Room,  # noqa: E402
+                              RoomRegistry, batch_candidates)
+
+OFFER = json.dumps({'type': 'offer', 'sdp': 'v=0', 'from': 'A'})
+ANSWER = json.dumps({'type': 'answer', 'sdp': 'v=0', 'from': 'B'})
+
+
+def candidate(n: int, sender: str = 'A') -> str:
+    return json.dumps({'type': 'ice-candidate', 'candidate': f'candidate:{n}', 'from': sender})
+
+
+class FakeWebSocket:
+    def __init__(self, blocked: bool = False):
+        self.sent = []
+        self.closed_with = None
+        # Gesetzt = Senden möglich; sonst hängt ``send`` wie bei einem langsamen Client
+        self.ready = asyncio.Event()
+        if not blocked:
+            self.ready.set()
+
+    async def send(self, message):
+        await self.ready.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=''):
+        self.closed_with = (code, reason)
+
+
+def make_client(peer_id: str, ice_batch: bool = False) -> Client:
+    client = Client(FakeWebSocket(), OutboundStats(), ice_batch=ice_batch)
+    client.peer_id = peer_id
+    return client
+
+
+def replayed(room: Room, client: Client) -> list:
+    """Was ``client`` beim Beitritt erhält"""
+    async def join():
+        room.replay_to(client)
+        await asyncio.sleep(0)
+        return client.websocket.sent
+
+    return asyncio.run(join())
+
+
+@pytest.fixture
+def room():
+    room = Room('r', replay_ttl=30.0)
+    room.add_client(make_client('A'))
+    room.add_client(make_client('B'))
+    return room
+
+
+def test_replays_offer_and_sender_candidates(room):
+    a, b = room.clients['A'], room.clients['B']
+    room.record('offer', OFFER, a)
+    room.record('ice-candidate', candidate(1), a)
+    room.record('ice-candidate', candidate(2, 'B'), b)
+    room.record('ice-candidate', candidate(3), a)
+    assert replayed(room, make_client('C')) == [OFFER, candidate(1), candidate(3)]
+    # Jeder neue Client erhält das Replay erneut
+    assert replayed(room, make_client('D')) == [OFFER, candidate(1), candidate(3)]
+
+
+def test_replays_batched_candidates(room):
+    a = room.clients['A']
+    room.record('offer', OFFER, a)
+    room.record('ice-candidate', candidate(1), a)
+    room.record('ice-candidate', candidate(2), a)
+    sent = replayed(room, make_client('C', ice_batch=True))
+    assert sent[0] == OFFER
+    assert json.loads(sent[1]) == {'type': 'ice-candidates',
+                                   'candidates': [json.loads(candidate(1)), json.loads(candidate(2))]}
+
+
+def test_nothing_without_offer(room):
+    room.record('ice-candidate', candidate(1), room.clients['A'])
+    assert room.replay is None
+    assert replayed(room, make_client('C')) == []
+
+
+def test_answer_clears(room):
+    room.record('offer', OFFER, room.clients['A'])
+    room.record('answer', ANSWER, room.clients['B'])
+    assert room.replay is None
+
+
+def test_newer_offer_replaces(room):
+    room.record('offer', OFFER, room.clients['A'])
+    room.record('ice-candidate', candidate(1), room.clients['A'])
+    newer = json.dumps({'type': 'offer', 'sdp': 'v=0 renegotiated', 'from': 'B'})
+    room.record('offer', newer, room.clients['B'])
+    assert replayed(room, make_client('C')) == [newer]
+
+
+def test_sender_leaving_clears(room):
+    room.record('offer', OFFER, room.clients['A'])
+    room.remove_client(room.clients['B'])
+    assert room.replay is not None
+    room.remove_client(room.clients['A'])
+    assert room.replay is None
+
+
+def test_expired_offer_is_dropped(room):
+    room.record('offer', OFFER, room.clients['A'])
+    room.replay.expires = 0.0
+    assert replayed(room, make_client('C')) == []
+    assert room.replay is None
+
+
+def test_disabled_without_ttl():
+    room = Room('r', replay_ttl=0.0)
+    a = make_client('A')
+    room.add_client(a)
+    room.record('offer', OFFER, a)
+    assert room.replay is None
+
+
+def test_limits(room):
+    a = room.clients['A']
+    room.record('offer', 'x' * (ReplayBuffer.MAX_BYTES + 1), a)
+    assert room.replay is None
+    room.record('offer', OFFER, a)
+    for n in range(ReplayBuffer.MAX_CANDIDATES + 10):
+        room.record('ice-candidate', candidate(n), a)
+    assert len(room.replay.candidates) == ReplayBuffer.MAX_CANDIDATES
+    room.record('offer', 'x' * (ReplayBuffer.MAX_BYTES - 100), a)
+    room.record('ice-candidate', candidate(1) + ' ' * 200, a)
+    assert room.replay.candidates == []
+
+
+def test_targeted_answer_clears(room):
+    # app.js sendet Answers mit ``to`` - sie müssen das Replay trotzdem beenden
+    room.record('offer', OFFER, room.clients['A'])
+    room.record('answer', ANSWER, room.clients['B'], targeted=True)
+    assert room.replay is None
+
+
+def test_targeted_messages_are_not_buffered(room):
+    a = room.clients['A']
+    room.record('offer', OFFER, a, targeted=True)
+    assert room.replay is None
+    room.record('offer', OFFER, a)
+    room.record('ice-candidate', candidate(1), a, targeted=True)
+    assert replayed(room, make_client('C')) == [OFFER]
+
+
+async def late_join_after(answer_to_offerer: bool, port: int) -> list:
+    """A bietet an, B antwortet (gezielt an A), danach tritt C bei
+
+    Liefert, was C vor der Antwort auf sein ``join`` erhält.
+    """
+    path = '/ws?room=late-join'
+    a = await WSClient.connect('127.0.0.1', port, path)
+    a_id = json.loads(await a.recv())['peer_id']
+    b = await WSClient.connect('127.0.0.1', port, path)
+    await b.recv()
+    await a.send(json.dumps({'type': 'offer', 'sdp': 'v=0'}))
+    assert json.loads(await b.recv())['type'] == 'offer'
+    if answer_to_offerer:
+        await b.send(json.dumps({'type': 'answer', 'sdp': 'v=0', 'to': a_id}))
+        assert json.loads(await a.recv())['type'] == 'answer'
+    c = await WSClient.connect('127.0.0.1', port, path)
+    assert json.loads(await c.recv())['type'] == 'welcome'
+    # ``joined`` kommt nach allem, was beim Beitritt nachgereicht wurde
+    await c.send(json.dumps({'type': 'join', 'room': 'late-join'}))
+    received = []
+    while True:
+        message = json.loads(await asyncio.wait_for(c.recv(), 5))
+        if message['type'] == 'joined':
+            break
+        received.append(message['type'])
+    for ws in (a, b, c):
+        ws.writer.close()
+    return received
+
+
+@pytest.mark.parametrize('answered, expected', [(False, ['offer']), (True, [])],
+                         ids=['unanswered', 'unicast-answer'])
+def test_late_join_after_unicast_answer(answered, expected):
+    port = 19620 + answered
+    server = ServerProcess('websockets', '127.0.0.1', port)
+    server.start()
+    try:
+        assert asyncio.run(late_join_after(answered, port)) == expected
+    finally:
+        server.stop()
+
+
+class FakeBus:
+    def __init__(self):
+        self.calls = []
+
+    def subscribe(self, room_id):
+        self.calls.append(('subscribe', room_id))
+
+    def unsubscribe(self, room_id):
+        self.calls.append(('unsubscribe', room_id))
+
+
+def test_registry_removes_empty_rooms():
+    bus = FakeBus()
+    rooms = RoomRegistry(bus)
+    a, b = make_client('A'), make_client('B')
+    room = rooms.join('r1', a)
+    assert rooms.join('r1', b) is room
+    assert rooms.stats() == {'rooms': 1, 'clients': 2}
+    rooms.leave(room, a)
+    assert 'r1' in rooms
+    rooms.leave(room, b)
+    assert 'r1' not in rooms and len(rooms) == 0
+    assert bus.calls == [('subscribe', 'r1'), ('unsubscribe', 'r1')]
+
+
+def test_registry_rejoin_creates_fresh_room():
+    rooms = RoomRegistry()
+    a = make_client('A')
+    old = rooms.join('r1', a)
+    rooms.leave(old, a)
+    new = rooms.join('r1', a)
+    assert new is not old
+    # Ein veralteter Raum darf den neuen nicht austragen
+    rooms.discard_if_empty(old)
+    assert rooms.get('r1') is new
+
+
+def test_queue_drains_and_writer_exits():
+    async def scenario():
+        client = make_client('A')
+        for n in range(3):
+            assert client.enqueue(str(n))
+        assert client.queue_depth == 3
+        await asyncio.sleep(0)
+        # Queue leer: Writer-Task und Queue werden freigegeben
+        assert client.websocket.sent == ['0', '1', '2']
+        assert client.queue is None and client._writer is None
+        assert client.stats.sent == 3
+        assert client.enqueue('3')
+        await asyncio.sleep(0)
+        assert client.websocket.sent[-1] == '3'
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_drops_newest():
+    async def scenario():
+        client = Client(FakeWebSocket(blocked=True), OutboundStats(), max_queue=2)
+        assert client.enqueue('0') and client.enqueue('1')
+        assert not client.enqueue('2')
+        assert client.dropped == 1 and client.stats.dropped == 1
+        assert not client.closed
+        client.websocket.ready.set()
+        await asyncio.sleep(0.01)
+        assert client.websocket.sent == ['0', '1']
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_disconnects():
+    async def scenario():
+        client = Client(FakeWebSocket(blocked=True), OutboundStats(), max_queue=2,
+                        policy='disconnect')
+        client.enqueue('0')
+        client.enqueue('1')
+        await asyncio.sleep(0)
+        client.enqueue('2')
+        client.enqueue('3')
+        assert client.closed
+        assert client.stats.slow_disconnects == 1
+        await asyncio.sleep(0.01)
+        assert client.websocket.closed_with == (1013, 'slow consumer')
+        assert client._writer.cancelled()
+        assert not client.enqueue('4')
+
+    asyncio.run(scenario())
+
+
+def test_send_timeout_disconnects():
+    async def scenario():
+        client = Client(FakeWebSocket(blocked=True), OutboundStats(), policy='disconnect',
+                        send_timeout=0.01)
+        client.enqueue('0')
+        await asyncio.sleep(0.05)
+        assert client.closed
+        assert client.websocket.closed_with == (1013, 'send timeout')
+
+    asyncio.run(scenario())
+
+
+def test_close_cancels_writer():
+    async def scenario():
+        client = make_client('A')
+        client.websocket.ready.clear()
+        client.enqueue('0')
+        await asyncio.sleep(0)
+        writer = client._writer
+        await client.close()
+        assert writer.cancelled()
+        assert client._writer is None
+        assert not client.enqueue('1')
+        # Ohne Writer-Task ist close() ein No-op
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        Client(FakeWebSocket(), OutboundStats(), policy='block')
+
+
+def test_batch_candidates_embeds_messages_verbatim():
+    messages = [candidate(1), candidate(2)]
+    assert json.loads(batch_candidates(messages)) == {
+        'type': 'ice-candidates', 'candidates': [json.loads(m) for m in messages]}
+
+
+def test_coalescer_delivers_after_window():
+    async def scenario():
+        delivered = []
+        coalescer = CandidateCoalescer(0.02, lambda messages, at: delivered.append((messages, at)))
+        coalescer.add('a', 1.0)
+        coalescer.add('b', 2.0)
+        await asyncio.sleep(0.005)
+        assert delivered == []
+        await asyncio.sleep(0.03)
+        # Empfangszeit der ersten Nachricht für die Latenz-Metrik
+        assert delivered == [(['a', 'b'], 1.0)]
+        coalescer.add('c', 3.0)
+        await asyncio.sleep(0.03)
+        assert delivered[-1] == (['c'], 3.0)
+
+    asyncio.run(scenario())
+
+
+def test_coalescer_flush_cancels_window():
+    async def scenario():
+        delivered = []
+        coalescer = CandidateCoalescer(0.01, lambda messages, at: delivered.append(messages))
+        coalescer.flush()
+        coalescer.add('a')
+        coalescer.flush()
+        assert delivered == [['a']] and coalescer._timer is None
+        await asyncio.sleep(0.02)
+        assert delivered == [['a']]
+
+    asyncio.run(scenario())
+
+
+def test_coalescer_flushes_full_batch():
+    async def scenario():
+        delivered = []
+        coalescer = CandidateCoalescer(10.0, lambda messages, at: delivered.append(messages))
+        for n in range(CandidateCoalescer.MAX_BATCH + 1):
+            coalescer.add(str(n))
+        assert [len(batch) for batch in delivered] == [CandidateCoalescer.MAX_BATCH]
+        assert coalescer.pending == [str(CandidateCoalescer.MAX_BATCH)]
+        coalescer.flush()
+
+    asyncio.run(scenario())
+
+
+async def routed_broadcasts(port: int) -> int:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+    body = (await reader.read()).decode()
+    writer.close()
+    for line in body.splitlines():
+        if line.startswith('signaling_routed_messages_total{mode="broadcast"}'):
+            return int(line.split()[-1])
+    return 0
+
+
+async def coalesced_delivery(port: int) -> list:
+    """A sendet Kandidaten, ein Offer und wieder Kandidaten, trennt dann
+
+    Liefert, was B (``?ice_batch=1``) erhält.
+    """
+    a = await WSClient.connect('127.0.0.1', port, '/ws?room=batch')
+    await a.recv()
+    b = await WSClient.connect('127.0.0.1', port, '/ws?room=batch&ice_batch=1')
+    assert json.loads(await b.recv())['ice_batch'] is True
+    for n in range(3):
+        await a.send(candidate(n))
+    # Ein anderer Nachrichtentyp leert die Sammlung vor dem Ablauf des Fensters
+    await a.send(OFFER)
+    await a.send(candidate(3))
+    await a.send(candidate(4))
+    await asyncio.sleep(0.1)
+    # Beim Trennen werden die restlichen Kandidaten noch verteilt
+    a.writer.close()
+    received = []
+    while len(received) < 3:
+        message = json.loads(await asyncio.wait_for(b.recv(), 5))
+        received.append((message['type'], len(message.get('candidates', []))))
+    b.writer.close()
+    return received
+
+
+def test_coalesced_candidates_flush_and_count():
+    port = 19622
+    # Fenster länger als der Test: nur Offer und Trennen lösen die Zustellung aus
+    server = ServerProcess('websockets', '127.0.0.1', port, ['--ice-batch-window', '60000'])
+    server.start()
+    try:
+        received = asyncio.run(coalesced_delivery(port))
+        broadcasts = asyncio.run(routed_broadcasts(port))
+    finally:
+        server.stop()
+    assert received == [('ice-candidates', 3), ('offer', 0), ('ice-candidates', 2)]
+    assert broadcasts == 6
@@ -0,0 +1,118 @@
+"""
+aiohttp-Server: Fan-out eines einmal kodierten Frames
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from bench_common import WSClient  # noqa: E402
+from bench_load import ServerProcess  # noqa: E402
+from signaling_server_aiohttp import SignalingServer  # noqa: E402
+from signaling_server_stdlib import encode_frame  # noqa: E402
+
+
+class FakeTransport:
+    def __init__(self, buffered=0, closing=False):
+        self.written = []
+        self.buffered = buffered
+        self.closing = closing
+
+    def write(self, data):
+        self.written.append(data)
+
+    def is_closing(self):
+        return self.closing
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWebSocket:
+    def __init__(self, compress=0, closed=False, fail=False):
+        self.compress = compress
+        self.closed = closed
+        self.fail = fail
+        self.sent = []
+
+    async def send_str(self, message):
+        if self.fail:
+            raise ConnectionResetError()
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def server():
+    server = SignalingServer(max_client_buffer=100)
+    yield server
+    server.analyzer.close()
+
+
+def test_frame_is_encoded_once(server, monkeypatch):
+    encoded = []
+    monkeypatch.setattr('signaling_server_aiohttp.encode_frame',
+                        lambda payload: encoded.append(payload) or encode_frame(payload))
+    sender = FakeWebSocket()
+    server.clients[sender] = FakeTransport()
+    receivers = {FakeWebSocket(): FakeTransport() for _ in range(3)}
+    server.clients.update(receivers)
+    asyncio.run(server.fanout('{"type":"offer"}', sender))
+    assert encoded == [b'{"type":"offer"}']
+    frame = encode_frame(b'{"type":"offer"}')
+    assert all(transport.written == [frame] for transport in receivers.values())
+    assert server.clients[sender].written == []
+
+
+def test_compressed_clients_use_send_str(server):
+    plain, compressed = FakeWebSocket(), FakeWebSocket(compress=15)
+    server.clients[plain] = FakeTransport()
+    server.clients[compressed] = FakeTransport()
+    asyncio.run(server.fanout('hi', None))
+    assert compressed.sent == ['hi'] and server.clients[compressed].written == []
+    assert plain.sent == [] and server.clients[plain].written == [encode_frame(b'hi')]
+
+
+def test_removed_clients_are_counted_by_reason(server):
+    healthy = FakeWebSocket()
+    server.clients[healthy] = FakeTransport()
+    server.clients[FakeWebSocket(closed=True)] = FakeTransport()
+    server.clients[FakeWebSocket()] = FakeTransport(closing=True)
+    server.clients[FakeWebSocket()] = FakeTransport(buffered=101)
+    server.clients[FakeWebSocket(compress=15, fail=True)] = FakeTransport()
+
+    async def scenario():
+        await server.fanout('hi', None)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert list(server.clients) == [healthy]
+    assert server.removed.values == {'closed': 2, 'slow': 1, 'error': 1}
+    assert 'signaling_dropped_messages_total' not in server.metrics.render()
+
+
+async def broadcast(port: int) -> list:
+    clients = [await WSClient.connect('127.0.0.1', port, '/ws') for _ in range(3)]
+    for ws in clients:
+        await ws.recv()
+    await clients[0].send(json.dumps({'type': 'offer', 'sdp': 'v=0'}))
+    received = [json.loads(await asyncio.wait_for(ws.recv(), 5)) for ws in clients[1:]]
+    for ws in clients:
+        ws.writer.close()
+    return received
+
+
+def test_broadcast_reaches_all_other_clients():
+    server = ServerProcess('aiohttp', '127.0.0.1', 19650)
+    server.start()
+    try:
+        received = asyncio.run(broadcast(19650))
+    finally:
+        server.stop()
+    assert [message['type'] for message in received] == ['offer', 'offer']
+    assert received[0]['from'] == received[1]['from']
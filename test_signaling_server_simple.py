@@ -0,0 +1,135 @@
+"""
+Simple-Server: inkrementelles Lesen per ``BufferedProtocol`` über den
+gemeinsamen Lesepuffer und den eigenen Puffer für angefangene Frames
+"""
+
+import base64
+
+import pytest
+
+from bench_common import client_frame
+from signaling_server_simple import SimpleSignalingServer, WebSocketProtocol
+
+KEY = base64.b64encode(b'0123456789abcdef').decode()
+REQUEST = (
+    "GET /ws?room=r1 HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    f"Sec-WebSocket-Key: {KEY}\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "\r\n"
+).encode()
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 50000)
+
+    def writelines(self, chunks):
+        self.written.extend(chunks)
+
+    def is_closing(self):
+        return self.closed
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def close(self):
+        self.closed = True
+
+    abort = close
+
+
+class FakeLoop:
+    def call_soon(self, callback):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = SimpleSignalingServer()
+    server.loop = FakeLoop()
+    server.received = []
+    server.handle_message = lambda message, sender: server.received.append(message)
+    yield server
+    server.analyzer.close()
+
+
+def connect(server) -> WebSocketProtocol:
+    conn = WebSocketProtocol(server)
+    conn.connection_made(FakeTransport())
+    return conn
+
+
+def feed(conn: WebSocketProtocol, data: bytes, size: int):
+    """Wie die Event-Loop: höchstens ``size`` Bytes pro ``recv_into``"""
+    pos = 0
+    while pos < len(data):
+        buf = conn.get_buffer(-1)
+        n = min(len(buf), size, len(data) - pos)
+        buf[:n] = data[pos:pos + n]
+        conn.buffer_updated(n)
+        pos += n
+
+
+def messages(count: int, size: int = 40) -> list:
+    return [f'{{"type":"offer","n":{n},"sdp":"{"x" * size}"}}' for n in range(count)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1000])
+def test_frames_split_across_reads(server, size):
+    conn = connect(server)
+    sent = messages(5, size=200)
+    feed(conn, REQUEST + b''.join(client_frame(m.encode()) for m in sent), size)
+    assert conn.handshake_done
+    assert server.received == sent
+    assert conn.partial is None and conn.filled == 0
+
+
+def test_handshake_and_frame_in_one_read(server):
+    conn = connect(server)
+    feed(conn, REQUEST + client_frame(b'{"type":"offer"}'), 10 ** 6)
+    assert conn.handshake_done and server.received == ['{"type":"offer"}']
+    assert conn.partial is None
+
+
+def test_handshake_with_partial_frame_in_one_read(server):
+    conn = connect(server)
+    frame = client_frame(b'{"type":"offer"}')
+    buf = conn.get_buffer(-1)
+    data = REQUEST + frame[:5]
+    buf[:len(data)] = data
+    conn.buffer_updated(len(data))
+    # Der angefangene Frame liegt im eigenen Puffer, nicht im gemeinsamen
+    assert conn.handshake_done and server.received == []
+    assert bytes(conn.partial[:conn.filled]) == frame[:5]
+    feed(conn, frame[5:], 10 ** 6)
+    assert server.received == ['{"type":"offer"}']
+
+
+@pytest.mark.parametrize('size', [13, 4096, 10 ** 6])
+def test_frame_larger_than_shared_buffer(server, size):
+    server.read_buffer = bytearray(1024)
+    server.read_view = memoryview(server.read_buffer)
+    conn = connect(server)
+    big = '{"type":"offer","sdp":"%s"}' % ('v' * 100000)
+    feed(conn, REQUEST + client_frame(big.encode()) + client_frame(b'{"type":"answer"}'), size)
+    assert server.received == [big, '{"type":"answer"}']
+    assert conn.partial is None
+
+
+def test_connections_share_read_buffer(server):
+    a, b = connect(server), connect(server)
+    feed(a, REQUEST, 10 ** 6)
+    feed(b, REQUEST, 10 ** 6)
+    first, second = client_frame(b'{"from":"a"}'), client_frame(b'{"from":"b"}')
+    feed(a, first[:4], 10 ** 6)
+    # B liest in den gemeinsamen Puffer, während A einen angefangenen Frame hält
+    feed(b, second, 10 ** 6)
+    feed(a, first[4:], 10 ** 6)
+    assert server.received == ['{"from":"b"}', '{"from":"a"}']
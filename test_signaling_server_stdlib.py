@@ -0,0 +1,133 @@
+"""
+stdlib-Server: Frame-Hilfsfunktionen und Close-Handshake beider Engines
+"""
+
+import asyncio
+import struct
+import zlib
+
+import pytest
+
+from bench_common import WSClient, client_frame
+from bench_load import ServerProcess
+from deflate import DeflateConfig, negotiate
+from signaling_server_stdlib import (OP_BINARY, OP_CLOSE, OP_TEXT, FrameTooLarge, build_frame,
+                                     encode_frame, parse_frame, unmask)
+
+
+async def close_reply(port: int) -> bytes:
+    """Sende einen Close-Frame (1000) und liefere den ersten Frame der Antwort"""
+    ws = await WSClient.connect('127.0.0.1', port, '/ws')
+    await ws.recv()  # welcome
+    ws.writer.write(client_frame(struct.pack('!H', 1000) + b'bye', OP_CLOSE))
+    header = await asyncio.wait_for(ws.reader.readexactly(2), 5)
+    ws.writer.close()
+    return header
+
+
+@pytest.mark.parametrize('name, port', [('stdlib', 19640), ('stdlib-threads', 19641)])
+def test_close_is_echoed(name, port):
+    server = ServerProcess(name, '127.0.0.1', port)
+    server.start()
+    try:
+        header = asyncio.run(close_reply(port))
+    finally:
+        server.stop()
+    assert header[0] == 0x80 | OP_CLOSE
+
+
+@pytest.mark.parametrize('length, header_size', [
+    (0, 2), (125, 2), (126, 4), (65535, 4), (65536, 10), (70000, 10),
+])
+def test_parse_masked_client_frame(length, header_size):
+    payload = bytes(range(256)) * (length // 256) + bytes(range(length % 256))
+    frame = client_frame(payload, OP_BINARY)
+    # Maskenbit + 4 Byte Maske
+    assert len(frame) == header_size + 4 + length
+    assert parse_frame(frame) == (OP_BINARY, payload, len(frame), False)
+
+
+@pytest.mark.parametrize('length', [0, 125, 126, 65535, 65536])
+def test_parse_unmasked_server_frame(length):
+    payload = b'x' * length
+    frame = encode_frame(payload)
+    assert parse_frame(bytearray(frame) + b'next') == (OP_TEXT, payload, len(frame), False)
+
+
+@pytest.mark.parametrize('length', [10, 300, 70000])
+def test_parse_incomplete_frame(length):
+    frame = client_frame(b'y' * length)
+    for cut in (0, 1, 2, 3, 9, len(frame) - 1):
+        assert parse_frame(frame[:cut]) is None
+
+
+def test_parse_rejects_oversized_before_payload():
+    frame = client_frame(b'z' * 70000)
+    with pytest.raises(FrameTooLarge) as error:
+        parse_frame(frame[:14], max_size=65536)
+    assert error.value.args[0] == 70000
+
+
+def test_parse_compressed_flag():
+    frame = encode_frame(b'data', compressed=True)
+    assert parse_frame(frame)[3] is True
+
+
+@pytest.mark.parametrize('length', [0, 1, 3, 4, 5, 1000, 1001])
+def test_unmask_round_trip(length):
+    payload = bytes((i * 7) & 0xFF for i in range(length))
+    masks = b'\x12\x34\x56\x78'
+    masked = bytes(b ^ masks[i % 4] for i, b in enumerate(payload))
+    assert unmask(masked, masks) == payload
+    assert unmask(unmask(payload, masks), masks) == payload
+    assert unmask(memoryview(masked), masks) == payload
+
+
+@pytest.mark.parametrize('length, header', [
+    (5, b'\x81\x05'), (126, b'\x81\x7e\x00\x7e'), (65536, b'\x81\x7f' + struct.pack('!Q', 65536)),
+])
+def test_encode_frame_lengths(length, header):
+    assert encode_frame(b'a' * length) == header + b'a' * length
+
+
+def test_build_frame_shared_without_deflate():
+    frames = {}
+    first = build_frame(None, b'hello', frames)
+    assert build_frame(None, b'hello', frames) is first
+    assert parse_frame(first)[1] == b'hello'
+
+
+def negotiated(offer):
+    return negotiate(offer, DeflateConfig(threshold=16))[1]
+
+
+def test_build_frame_below_threshold_is_uncompressed():
+    frame = build_frame(negotiated('permessage-deflate'), b'short', {})
+    assert parse_frame(frame) == (OP_TEXT, b'short', len(frame), False)
+
+
+def test_build_frame_shared_without_context_takeover():
+    payload = b'a=candidate:1 1 udp 2122260223 192.168.1.20 54321 typ host\r\n' * 10
+    frames = {}
+    a = negotiated('permessage-deflate; server_no_context_takeover')
+    b = negotiated('permessage-deflate; server_no_context_takeover')
+    frame = build_frame(a, payload, frames)
+    assert build_frame(b, payload, frames) is frame
+    _, data, _, compressed = parse_frame(frame)
+    assert compressed and len(data) < len(payload)
+    assert zlib.decompressobj(-15).decompress(data + b'\x00\x00\xff\xff') == payload
+
+
+def test_build_frame_per_connection_with_context_takeover():
+    payload = b'v=0\r\no=- 4611731400430051336 2 IN IP4 127.0.0.1\r\n' * 5
+    frames = {}
+    connection = negotiated('permessage-deflate')
+    first = parse_frame(build_frame(connection, payload, frames))[1]
+    second = parse_frame(build_frame(connection, payload, frames))[1]
+    # Nicht geteilt: jede Verbindung hat ihren eigenen zlib-Zustand
+    assert frames == {}
+    # Die zweite Nachricht verweist auf das Fenster der ersten
+    assert len(second) < len(first)
+    decompressor = zlib.decompressobj(-15)
+    for data in (first, second):
+        assert decompressor.decompress(data + b'\x00\x00\xff\xff') == payload
@@ -0,0 +1,111 @@
+"""
+TLS: Server-Context aus einem selbstsignierten Zertifikat und Session-Wiederaufnahme
+"""
+
+import argparse
+import shutil
+import ssl
+
+import pytest
+
+from tls import TLSConfig, add_tls_arguments, client_context, generate_self_signed, tls_from_args
+
+pytestmark = pytest.mark.skipif(shutil.which('openssl') is None, reason='needs the openssl command')
+
+
+@pytest.fixture(scope='module')
+def cert(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('certs')
+    certfile, keyfile = str(directory / 'localhost.pem'), str(directory / 'localhost-key.pem')
+    generate_self_signed(certfile, keyfile)
+    return certfile, keyfile
+
+
+def handshake(server_context, client, session=None):
+    """Handshake über Memory-BIOs; liefert Client- und Server-Verbindung"""
+    client_in, client_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    server_in, server_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    client_side = client.wrap_bio(client_in, client_out, server_hostname='localhost', session=session)
+    server_side = server_context.wrap_bio(server_in, server_out, server_side=True)
+    done = {client_side: False, server_side: False}
+    for _ in range(10):
+        for side in done:
+            if not done[side]:
+                try:
+                    side.do_handshake()
+                    done[side] = True
+                except ssl.SSLWantReadError:
+                    pass
+        server_in.write(client_out.read())
+        client_in.write(server_out.read())
+        if all(done.values()):
+            break
+    assert all(done.values())
+    return client_side, server_side
+
+
+def close_notify(connection):
+    """Sauberes Verbindungsende von einer Seite (Antwort wird nicht abgewartet)"""
+    try:
+        connection.unwrap()
+    except ssl.SSLWantReadError:
+        pass
+
+
+def test_server_context_settings(cert):
+    context = TLSConfig(*cert, ciphers='ECDHE+AESGCM', min_version='1.3', tickets=3).server_context()
+    assert context.minimum_version == ssl.TLSVersion.TLSv1_3
+    assert context.options & ssl.OP_NO_COMPRESSION
+    assert not context.options & ssl.OP_NO_TICKET
+    assert context.num_tickets == 3
+    cache = TLSConfig(*cert, resumption='cache').server_context()
+    assert cache.options & ssl.OP_NO_TICKET
+    assert cache.minimum_version == ssl.TLSVersion.TLSv1_2
+
+
+@pytest.mark.parametrize('kwargs', [{'min_version': '1.1'}, {'resumption': 'psk'}, {'tickets': -1}])
+def test_rejects_invalid_settings(cert, kwargs):
+    with pytest.raises(ValueError):
+        TLSConfig(*cert, **kwargs)
+
+
+def test_verified_handshake_negotiates_alpn(cert):
+    connection, _ = handshake(TLSConfig(*cert).server_context(), client_context(cafile=cert[0]))
+    assert connection.selected_alpn_protocol() == 'http/1.1'
+    assert connection.version() == 'TLSv1.3'
+
+
+@pytest.mark.parametrize('resumption', ['tickets', 'cache'])
+def test_tls12_session_resumption(cert, resumption):
+    server = TLSConfig(*cert, resumption=resumption).server_context()
+    client = client_context(cafile=cert[0], max_version='1.2')
+    first, server_side = handshake(server, client)
+    assert not first.session_reused
+    assert first.session.has_ticket == (resumption == 'tickets')
+    close_notify(server_side)
+    second, _ = handshake(server, client, session=first.session)
+    assert second.session_reused
+    assert server.session_stats()['hits'] == 1
+
+
+def test_cache_drops_session_without_close_notify(cert):
+    server = TLSConfig(*cert, resumption='cache').server_context()
+    client = client_context(cafile=cert[0], max_version='1.2')
+    first, server_side = handshake(server, client)
+    session = first.session
+    # Abgebrochene Verbindung: OpenSSL entfernt die Session aus dem Cache
+    del server_side
+    second, _ = handshake(server, client, session=session)
+    assert not second.session_reused
+
+
+def test_tls_from_args(cert):
+    parser = argparse.ArgumentParser()
+    add_tls_arguments(parser)
+    assert tls_from_args(parser.parse_args([])) is None
+    args = parser.parse_args(['--tls-cert', cert[0], '--tls-key', cert[1], '--tls-alpn', '',
+                              '--tls-resumption', 'cache', '--tls-tickets', '0'])
+    context = tls_from_args(args)
+    assert context.options & ssl.OP_NO_TICKET and context.num_tickets == 0
+    connection, _ = handshake(context, client_context(cafile=cert[0], alpn=()))
+    assert connection.selected_alpn_protocol() is None
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+TLS (wss://) für die Signalisierungsserver
+Baut den Server-``SSLContext`` aus Zertifikat, Schlüssel, Cipher- und
+ALPN-Einstellungen. Wiederkehrende Clients sollen keinen vollständigen
+Handshake brauchen: Standard sind zustandslose Session Tickets, mit
+``--tls-resumption cache`` übernimmt der Session-Cache des Servers
+(TLS 1.2: Session-IDs, TLS 1.3: Tickets, die nur auf den Cache verweisen).
+
+Der Context wird vor dem Fork der Worker erzeugt - alle Worker teilen sich
+damit den Ticket-Schlüssel, und ein Ticket gilt auf jedem Worker.
+
+Für Tests erzeugt ``python tls.py selfsigned`` ein selbstsigniertes
+Zertifikat für ``localhost`` (benötigt das ``openssl``-Kommando).
+"""
+
+import logging
+import os
+import shutil
+import ssl
+import subprocess
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+TLS_VERSIONS = {
+    '1.2': ssl.TLSVersion.TLSv1_2,
+    '1.3': ssl.TLSVersion.TLSv1_3,
+}
+
+# WebSocket läuft über HTTP/1.1 - h2 anzubieten würde den Upgrade verhindern
+DEFAULT_ALPN = ('http/1.1',)
+
+RESUMPTION_MODES = ('tickets', 'cache')
+
+DEFAULT_CERT = os.path.join('certs', 'localhost.pem')
+DEFAULT_KEY = os.path.join('certs', 'localhost-key.pem')
+
+
+class TLSConfig:
+    """TLS-Einstellungen eines Servers
+
+    ``ciphers``: OpenSSL-Cipher-String für TLS 1.2 (TLS-1.3-Suites legt
+    OpenSSL fest). ``resumption``: ``tickets`` (zustandslos, der Server
+    speichert nichts) oder ``cache`` (Sessions im Speicher des Servers).
+    ``tickets``: Anzahl Tickets pro Handshake (TLS 1.3), 0 = keine
+    Wiederaufnahme unter TLS 1.3.
+    """
+
+    def __init__(self, certfile: str, keyfile: Optional[str] = None,
+                 ciphers: Optional[str] = None, alpn: Sequence[str] = DEFAULT_ALPN,
+                 min_version: str = '1.2', resumption: str = 'tickets', tickets: int = 2):
+        if min_version not in TLS_VERSIONS:
+            raise ValueError(f"Unknown TLS version: {min_version}")
+        if resumption not in RESUMPTION_MODES:
+            raise ValueError(f"Unknown resumption mode: {resumption}")
+        if tickets < 0:
+            raise ValueError("tickets must not be negative")
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.ciphers = ciphers
+        self.alpn = tuple(alpn)
+        self.min_version = min_version
+        self.resumption = resumption
+        self.tickets = tickets
+
+    def server_context(self) -> ssl.SSLContext:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = TLS_VERSIONS[self.min_version]
+        context.load_cert_chain(self.certfile, self.keyfile)
+        if self.ciphers:
+            context.set_ciphers(self.ciphers)
+        if self.alpn:
+            context.set_alpn_protocols(list(self.alpn))
+        # Keine Kompression (CRIME), frische (EC)DHE-Schlüssel pro Handshake
+        context.options |= ssl.OP_NO_COMPRESSION | ssl.OP_SINGLE_ECDH_USE
+        if self.resumption == 'cache':
+            # Keine verschlüsselten Tickets - der Session-Cache hält den Zustand
+            context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = self.tickets
+        return context
+
+
+def client_context(cafile: Optional[str] = None, alpn: Sequence[str] = DEFAULT_ALPN,
+                   max_version: Optional[str] = None) -> ssl.SSLContext:
+    """Client-Context für Tests und Benchmarks
+
+    Mit ``cafile`` wird das (selbstsignierte) Serverzertifikat geprüft,
+    ohne wird die Prüfung abgeschaltet.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    if cafile:
+        context.load_verify_locations(cafile)
+    else:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    if max_version:
+        context.maximum_version = TLS_VERSIONS[max_version]
+    if alpn:
+        context.set_alpn_protocols(list(alpn))
+    return context
+
+
+def generate_self_signed(certfile: str = DEFAULT_CERT, keyfile: str = DEFAULT_KEY,
+                         hostname: str = 'localhost', days: int = 365):
+    """Selbstsigniertes ECDSA-Zertifikat (P-256) über das ``openssl``-Kommando"""
+    openssl = shutil.which('openssl')
+    if openssl is None:
+        raise RuntimeError("The openssl command is required to generate a certificate")
+    for path in (certfile, keyfile):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    subprocess.run([
+        openssl, 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+        '-nodes', '-days', str(days), '-keyout', keyfile, '-out', certfile,
+        '-subj', f'/CN={hostname}',
+        '-addext', f'subjectAltName=DNS:{hostname},IP:127.0.0.1,IP:::1',
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    os.chmod(keyfile, 0o600)
+    logger.info(f"Self-signed certificate for {hostname}: {certfile} (key: {keyfile})")
+
+
+def add_tls_arguments(parser):
+    """CLI-Optionen für TLS (für alle Server gleich)"""
+    parser.add_argument('--tls-cert', default=None,
+                        help='Certificate chain (PEM); enables wss://')
+    parser.add_argument('--tls-key', default=None,
+                        help='Private key (PEM, default: contained in --tls-cert)')
+    parser.add_argument('--tls-ciphers', default=None,
+                        help='OpenSSL cipher string for TLS 1.2 (default: OpenSSL defaults)')
+    parser.add_argument('--tls-alpn', default=','.join(DEFAULT_ALPN),
+                        help='Comma-separated ALPN protocols (default: http/1.1, empty = off)')
+    parser.add_argument('--tls-min-version', choices=sorted(TLS_VERSIONS), default='1.2',
+                        help='Minimum TLS version (default: 1.2)')
+    parser.add_argument('--tls-resumption', choices=RESUMPTION_MODES, default='tickets',
+                        help='Session resumption: stateless tickets or the server-side session cache')
+    parser.add_argument('--tls-tickets', type=int, default=2,
+                        help='Tickets per TLS 1.3 handshake (default: 2, 0 = no TLS 1.3 resumption)')
+
+
+def tls_from_args(args) -> Optional[ssl.SSLContext]:
+    """``SSLContext`` aus den CLI-Optionen oder ``None`` ohne ``--tls-cert``"""
+    if not args.tls_cert:
+        return None
+    alpn = [protocol.strip() for protocol in args.tls_alpn.split(',') if protocol.strip()]
+    return TLSConfig(args.tls_cert, args.tls_key, ciphers=args.tls_ciphers, alpn=alpn,
+                     min_version=args.tls_min_version, resumption=args.tls_resumption,
+                     tickets=args.tls_tickets).server_context()
+
+
+def main():
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='TLS helpers for the signaling servers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    selfsigned = commands.add_parser('selfsigned', help='Generate a self-signed certificate for testing')
+    selfsigned.add_argument('--cert', default=DEFAULT_CERT, help=f'Certificate path (default: {DEFAULT_CERT})')
+    selfsigned.add_argument('--key', default=DEFAULT_KEY, help=f'Key path (default: {DEFAULT_KEY})')
+    selfsigned.add_argument('--hostname', default='localhost')
+    selfsigned.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    if args.command == 'selfsigned':
+        generate_self_signed(args.cert, args.key, args.hostname, args.days)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Mehrere Worker-Prozesse auf einem Port (SO_REUSEPORT)
+Der Elternprozess bindet vor dem Fork N Sockets mit SO_REUSEPORT an
+denselben Port. So verteilt der Kernel Verbindungen von Anfang an auf alle
+Worker, auch wenn einzelne Worker noch starten.
+"""
+
+import logging
+import os
+import signal
+import socket
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+def reuseport_sockets(host: str, port: int, count: int,
+                      backlog: int = socket.SOMAXCONN) -> List[socket.socket]:
+    """Erzeuge ``count`` lauschende Sockets derselben SO_REUSEPORT-Gruppe"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+    sockets = []
+    for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[:1]:
+        family, type_, proto, _, address = info
+        for _ in range(count):
+            sock = socket.socket(family, type_, proto)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(address)
+            sock.listen(backlog)
+            sock.setblocking(False)
+            sockets.append(sock)
+    return sockets
+
+
+def run_workers(host: str, port: int, count: int, worker: Callable[[int, socket.socket], None],
+                backlog: int = socket.SOMAXCONN) -> int:
+    """Forke ``count`` Worker und warte auf sie
+
+    ``worker(worker_id, sock)`` läuft im Kindprozess. SIGINT/SIGTERM werden
+    an alle Worker weitergereicht. Gibt den schlechtesten Exit-Code zurück.
+    """
+    sockets = reuseport_sockets(host, port, count, backlog)
+    children = {}
+    for worker_id, sock in enumerate(sockets):
+        pid = os.fork()
+        if pid == 0:
+            for other in sockets:
+                if other is not sock:
+                    other.close()
+            # SIGTERM wie Ctrl+C behandeln, damit Worker sauber aufräumen
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            code = 0
+            try:
+                worker(worker_id, sock)
+            except KeyboardInterrupt:
+                pass
+            except Exception:
+                logger.exception(f"Worker {worker_id} failed")
+                code = 1
+            os._exit(code)
+        children[pid] = worker_id
+    for sock in sockets:
+        sock.close()
+    logger.info(f"Started {count} workers on {host}:{port}: {sorted(children)}")
+
+    def forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    status = 0
+    while children:
+        try:
+            pid, code = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = children.pop(pid, None)
+        exit_code = os.waitstatus_to_exitcode(code)
+        if exit_code not in (0, -signal.SIGINT, -signal.SIGTERM):
+            logger.warning(f"Worker {worker_id} (pid {pid}) exited with {exit_code}")
+            status = max(status, 1)
+    return status